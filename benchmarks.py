@@ -0,0 +1,367 @@
+"""
+Micro-benchmarks for the hot paths of the gauntlet tools.
+
+Run from the directory holding the Scryfall bulk data file:
+
+    python benchmarks.py
+"""
+import glob
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+deck_list_path = os.path.join(current_dir, 'deck_lists')
+
+
+def time_it(func, repeat=5):
+    """
+    Runs a function several times and returns the best wall-clock time in seconds.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def deck_list_card_names():
+    """
+    Collects every card name written in the gauntlet deck lists, as a realistic lookup workload.
+    """
+    names = []
+    for txt_file in sorted(glob.glob(os.path.join(deck_list_path, '*.txt'))):
+        with open(txt_file, 'r', encoding='utf-8') as file:
+            for line in file:
+                line = line.strip()
+                if line and line[0].isdigit():
+                    names.append(line.split(' ', 1)[1])
+    return names
+
+
+def load_oracle_data():
+    from card_store import ORACLE_FILE
+
+    with open(ORACLE_FILE, 'r', encoding="utf8") as f:
+        return json.load(f)
+
+
+def benchmark_card_lookup(sample_size=200):
+    """
+    Compares the old linear scan over the Oracle data against the card index lookup.
+    """
+    from card_store import build_card_index
+
+    oracle_data = load_oracle_data()
+    card_index = build_card_index(oracle_data)
+
+    def linear_lookup(card_name):
+        card_name_lower = card_name.lower()
+        for card in oracle_data:
+            if card['name'].lower() == card_name_lower and card['set_type'] != "funny" and card['layout'] != "token":
+                return card
+        return None
+
+    names = deck_list_card_names()
+    names = random.Random(0).sample(names, min(sample_size, len(names)))
+
+    scan_time = time_it(lambda: [linear_lookup(name) for name in names], repeat=1)
+    index_time = time_it(lambda: [card_index.get(name.casefold()) for name in names])
+
+    print(f"Card lookup ({len(names)} names over {len(oracle_data)} cards)")
+    print(f"  linear scan: {scan_time / len(names) * 1e6:10.1f} us/lookup")
+    print(f"  card index:  {index_time / len(names) * 1e6:10.3f} us/lookup")
+    print(f"  speedup:     {scan_time / index_time:10.0f}x")
+
+
+def benchmark_card_store_cold_start():
+    """
+    Compares loading the whole bulk data file against opening the compiled card store,
+    each followed by a lookup of every card in the gauntlet deck lists.
+    """
+    from card_store import CardStore, build_card_index, open_card_store
+
+    names = deck_list_card_names()
+    open_card_store().connection.close()  # Make sure the store is compiled before timing it
+
+    def json_cold_start():
+        card_index = build_card_index(load_oracle_data())
+        return [card_index.get(name.casefold()) for name in names]
+
+    def store_cold_start():
+        store = CardStore()
+        cards = [store.get_card(name) for name in names]
+        store.connection.close()
+        return cards
+
+    json_time = time_it(json_cold_start, repeat=1)
+    store_time = time_it(store_cold_start)
+
+    print(f"Cold start plus {len(names)} deck list lookups")
+    print(f"  json.load:  {json_time * 1e3:10.1f} ms")
+    print(f"  card store: {store_time * 1e3:10.1f} ms")
+
+
+def misspell(name, rng):
+    """
+    Introduces one typo into a card name: a dropped, doubled or swapped letter.
+    """
+    i = rng.randrange(1, len(name) - 1)
+    typo = rng.choice(['drop', 'double', 'swap'])
+    if typo == 'drop':
+        return name[:i] + name[i + 1:]
+    if typo == 'double':
+        return name[:i] + name[i] + name[i:]
+    return name[:i - 1] + name[i] + name[i - 1] + name[i + 1:]
+
+
+def benchmark_fuzzy_resolution(sample_size=200):
+    """
+    Times offline fuzzy resolution of misspelled deck list card names.
+    """
+    from card_store import open_card_store
+
+    store = open_card_store()
+    rng = random.Random(0)
+    names = sorted(set(deck_list_card_names()))
+    names = rng.sample(names, min(sample_size, len(names)))
+    queries = [misspell(name, rng) for name in names]
+
+    build_time = time_it(store.get_fuzzy_index, repeat=1)
+    index = store.get_fuzzy_index()
+    results = []
+    resolve_time = time_it(lambda: results.extend(index.resolve(query) for query in queries), repeat=1)
+
+    correct = sum(1 for name, result in zip(names, results) if result.name == name)
+    ambiguous = sum(1 for result in results if result.name is None and result.candidates)
+    print(f"Fuzzy resolution ({len(queries)} misspelled names)")
+    print(f"  index build: {build_time * 1e3:10.1f} ms")
+    print(f"  resolve:     {resolve_time / len(queries) * 1e6:10.1f} us/name")
+    print(f"  correct:     {correct:10d}")
+    print(f"  ambiguous:   {ambiguous:10d}")
+
+
+def benchmark_keyword_extraction():
+    """
+    Compares scanning every deck list card's rules text with one keyword regex against
+    a union over the card store's keyword index.
+    """
+    import re
+
+    from card_store import card_text, open_card_store
+
+    store = open_card_store()
+    cards = [store.get_card(name) for name in deck_list_card_names()]
+    cards = [card for card in cards if card is not None]
+    card_ids = [store.get_card_id(card['name']) for card in cards]
+
+    def regex_keywords():
+        sorted_keywords = sorted(store.all_keywords(), key=len, reverse=True)
+        keyword_pattern = re.compile(r'\b(?:' + '|'.join(re.escape(keyword) for keyword in sorted_keywords) + r')\b',
+                                     re.IGNORECASE)
+        keywords = set()
+        for card in cards:
+            keywords.update(match.lower() for match in keyword_pattern.findall(card_text(card)))
+        return keywords
+
+    def index_keywords():
+        store._keywords_by_card.clear()
+        return {keyword.lower() for keyword in store.keywords_for_cards(card_ids)}
+
+    regex_time = time_it(regex_keywords, repeat=1)
+    index_time = time_it(index_keywords)
+
+    print(f"Keyword extraction ({len(cards)} deck list cards)")
+    print(f"  regex scan:    {regex_time * 1e3:10.2f} ms")
+    print(f"  keyword index: {index_time * 1e3:10.2f} ms")
+    print(f"  same result:   {str(regex_keywords() == index_keywords()):>10}")
+
+
+def benchmark_deck_parsing():
+    """
+    Times a cold parse of every deck list, in this process and across worker processes.
+    """
+    from gauntlet_tools import parse_decks
+    from card_store import get_card_store
+
+    raw_decks = []
+    for directory in ('deck_lists', 'pre_gauntlet_deck_lists'):
+        for txt_file in sorted(glob.glob(os.path.join(current_dir, directory, '*.txt'))):
+            with open(txt_file, 'r', encoding='utf-8') as file:
+                raw_decks.append(file.readlines())
+    import mtg_tools
+
+    store = get_card_store()
+    parse_decks(raw_decks[:1], workers=1)  # Warm up the store's page cache
+
+    def cold_parse(workers):
+        # Forget every card looked up so far, so both runs resolve every name from the store
+        for cache in (mtg_tools.CARD_RECORDS, mtg_tools.CARD_IDS, mtg_tools.CARD_NAMES, store._cards_by_name):
+            cache.clear()
+        return parse_decks(raw_decks, workers=workers)
+
+    workers = max(2, os.cpu_count())
+    serial_time = time_it(lambda: cold_parse(1), repeat=1)
+    parallel_time = time_it(lambda: cold_parse(workers), repeat=1)
+
+    print(f"Deck parsing ({len(raw_decks)} deck lists)")
+    print(f"  1 process:    {serial_time * 1e3:10.1f} ms")
+    print(f"  {workers} processes: {parallel_time * 1e3:10.1f} ms")
+
+
+def synthetic_event_dump(path, deck_count, seed=0):
+    """
+    Writes a tournament-style dump of deck_count decks built from the gauntlet lists:
+    some are copies with their lines shuffled, some have a card or two swapped, and
+    the rest mix the mainboard of one list with the cards of another.
+    """
+    rng = random.Random(seed)
+    lists = []
+    for txt_file in sorted(glob.glob(os.path.join(deck_list_path, '*.txt'))):
+        with open(txt_file, 'r', encoding='utf-8') as file:
+            cards = [line.strip() for line in file if line.strip()[:1].isdigit()]
+        lists.append(cards[:60])
+    all_cards = [card for cards in lists for card in cards]
+
+    with open(path, 'w', encoding='utf-8') as f:
+        for index in range(deck_count):
+            cards = list(rng.choice(lists))
+            kind = rng.random()
+            if kind < 0.3:
+                rng.shuffle(cards)
+            elif kind < 0.6:
+                for _ in range(rng.randint(1, 2)):
+                    cards[rng.randrange(len(cards))] = rng.choice(all_cards)
+            else:
+                cards = rng.sample(cards, len(cards) // 2) + rng.sample(all_cards, len(cards) // 2)
+            f.write(f"Name: Deck {index}\nAuthor: Player {index}\nEvent: Synthetic Open\n# v1\n")
+            f.write("\n".join(cards) + "\n\n")
+
+
+def benchmark_bulk_import(deck_count=2000):
+    """
+    Measures deck store import throughput on a synthetic event dump, including dedupe.
+    """
+    import tempfile
+
+    from deck_store import DeckStore, import_decks
+
+    with tempfile.TemporaryDirectory() as directory:
+        dump_file = os.path.join(directory, 'event.txt')
+        synthetic_event_dump(dump_file, deck_count)
+        deck_store = DeckStore(os.path.join(directory, 'deck_store.sqlite3'))
+        start = time.perf_counter()
+        counts = import_decks([dump_file], deck_store)
+        elapsed = time.perf_counter() - start
+        deck_store.connection.close()
+
+    print(f"Bulk import ({deck_count} decks)")
+    print(f"  {elapsed * 1e3:10.1f} ms  {deck_count / elapsed:8.0f} decks/s")
+    print(f"  {counts['added']} added, {counts['near_duplicates']} of them near duplicates, "
+          f"{counts['duplicates']} duplicates")
+
+
+def synthetic_gauntlet_decks(deck_count, card_pool, seed=0):
+    """
+    Builds stand-ins for parsed decks: each needs 40 to 75 distinct cards of the pool, 1 to 4 copies each.
+    """
+    from types import SimpleNamespace
+
+    from card_counts import CardCounts
+
+    rng = random.Random(seed)
+    decks = []
+    for _ in range(deck_count):
+        card_ids = rng.sample(range(card_pool), rng.randint(40, 75))
+        cards_needed = CardCounts(card_ids, [rng.randint(1, 4) for _ in card_ids])
+        decks.append(SimpleNamespace(get_cards_needed=lambda cards_needed=cards_needed: cards_needed))
+    return decks
+
+
+def benchmark_build_gauntlet(deck_count=5000):
+    """
+    Compares the per-card sorted lists the gauntlet used to be built from against
+    compute_gauntlet's top-k over the sparse decks x cards matrix, on synthetic decks
+    drawn from the whole card store.
+    """
+    from card_store import get_card_store
+    from gauntlet_tools import GAUNTLET_TOP_DECKS, compute_gauntlet
+
+    card_pool = len(get_card_store())
+    decks = synthetic_gauntlet_decks(deck_count, card_pool)
+
+    def sorted_lists():
+        cards_used = {}
+        for deck in decks:
+            cards_needed = deck.get_cards_needed()
+            for card_id, quantity in zip(cards_needed.ids, cards_needed.counts):
+                cards_used.setdefault(card_id, []).append(quantity)
+        return {card_id: sum(sorted(quantities, reverse=True)[:GAUNTLET_TOP_DECKS])
+                for card_id, quantities in cards_used.items()}
+
+    compute_gauntlet(decks[:1])  # Import numpy outside the timed runs
+    list_time = time_it(sorted_lists, repeat=3)
+    matrix_time = time_it(lambda: compute_gauntlet(decks))
+    card_ids, quantities = compute_gauntlet(decks)
+
+    print(f"Gauntlet ({deck_count} decks, {len(card_ids)} of {card_pool} cards used)")
+    print(f"  sorted lists:  {list_time * 1e3:10.1f} ms")
+    print(f"  matrix top-k:  {matrix_time * 1e3:10.1f} ms")
+    print(f"  same result:   {str(sorted_lists() == dict(zip(card_ids.tolist(), quantities.tolist()))):>10}")
+
+
+# Modules the non-rendering commands import, and the libraries only rendering should load
+DATA_MODULES = ('mtg_tools', 'mtg_deck', 'gauntlet_tools', 'mtg_gauntlet')
+HEAVY_MODULES = ('requests', 'PIL', 'cairosvg', 'cairocffi', 'cffi')
+IMPORT_TIME_BUDGET_MS = 100
+
+
+def import_times(module):
+    """
+    Imports a module in a fresh interpreter under -X importtime.
+
+    Returns:
+        dict: Cumulative import time in microseconds of every module imported along the way.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=os.getcwd(), env={**os.environ, 'PYTHONPATH': current_dir}, capture_output=True, text=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line.split('|')
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+def benchmark_import_time():
+    """
+    Measures how long each data-layer module takes to import, and checks that none of
+    them pulls in the HTTP or imaging libraries.
+    """
+    print(f"Import time (budget {IMPORT_TIME_BUDGET_MS} ms)")
+    for module in DATA_MODULES:
+        times = import_times(module)
+        total = times.get(module, 0) / 1e3
+        heavy = [name for name in HEAVY_MODULES if name in times]
+        status = "ok" if total < IMPORT_TIME_BUDGET_MS and not heavy else "OVER BUDGET"
+        print(f"  {module:<16} {total:8.1f} ms  {status}")
+        if heavy:
+            print(f"    imports {', '.join(heavy)}")
+
+
+if __name__ == "__main__":
+    benchmark_import_time()
+    benchmark_card_lookup()
+    benchmark_card_store_cold_start()
+    benchmark_fuzzy_resolution()
+    benchmark_keyword_extraction()
+    benchmark_deck_parsing()
+    benchmark_bulk_import()
+    benchmark_build_gauntlet()
@@ -0,0 +1,85 @@
+"""
+Streaming reader for Scryfall bulk data files.
+
+Scryfall bulk files are one large JSON array of card objects. iter_bulk_cards decodes
+that array one card at a time from a fixed-size read buffer and keeps only the fields
+the tools actually use, so peak memory stays bounded no matter how large the dump is.
+"""
+import json
+
+# Card fields read anywhere in the tools. Everything else (prices per printing, purchase
+# and related URIs, rulings links, artist credits...) is dropped while streaming.
+CARD_FIELDS = (
+    'id',
+    'oracle_id',
+    'name',
+    'flavor_name',
+    'layout',
+    'set',
+    'set_type',
+    'mana_cost',
+    'cmc',
+    'type_line',
+    'oracle_text',
+    'colors',
+    'color_identity',
+    'keywords',
+    'legalities',
+    'image_uris',
+    'card_faces',
+    'all_parts',
+    'prices',
+)
+
+CHUNK_SIZE = 1 << 20
+
+
+def project_card(card, fields):
+    """
+    Returns a copy of a card dictionary holding only the given fields.
+    """
+    return {field: card[field] for field in fields if field in card}
+
+
+def iter_bulk_cards(bulk_file, fields=CARD_FIELDS, chunk_size=CHUNK_SIZE):
+    """
+    Yields the cards of a Scryfall bulk data file one at a time.
+
+    Args:
+        bulk_file (str): Path to the Scryfall bulk data JSON file.
+        fields (tuple or None): The card fields to keep. None keeps every field.
+        chunk_size (int): Number of characters read from the file at a time.
+
+    Yields:
+        dict: One card dictionary per element of the bulk data array.
+    """
+    decoder = json.JSONDecoder()
+    with open(bulk_file, 'r', encoding="utf8") as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f"{bulk_file} is not a JSON array of cards")
+        position = 1
+        end_of_file = False
+
+        while True:
+            # Skip the separators between array elements
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer) and buffer[position] == ']':
+                return
+
+            try:
+                if position >= len(buffer):
+                    raise json.JSONDecodeError("Buffer exhausted", buffer, position)
+                card, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # The next card is cut off by the end of the buffer; read more and retry.
+                if end_of_file:
+                    raise
+                chunk = f.read(chunk_size)
+                end_of_file = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+
+            yield card if fields is None else project_card(card, fields)
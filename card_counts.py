@@ -0,0 +1,283 @@
+"""
+Array-backed card count vectors.
+
+A CardCounts holds a deck section as two parallel arrays: interned card IDs and the
+number of copies of each. Math across decks (sums, per-card maximums) works on the
+integer IDs instead of hashing card name strings over and over, and the arrays pickle
+to a few hundred bytes when decks are sent to worker processes.
+
+CardCounts is also a read-only Mapping from card name to count, so code written
+against the old {card_name: quantity} dictionaries keeps working unchanged.
+"""
+from array import array
+from collections.abc import ItemsView, Mapping, ValuesView
+
+from mtg_tools import get_card_id, get_card_name
+
+# Signed typecodes: 'l' holds any card store row ID, 'h' any number of copies
+ID_TYPECODE = 'l'
+COUNT_TYPECODE = 'h'
+
+
+class CardCountsItems(ItemsView):
+    def __iter__(self):
+        return zip(map(get_card_name, self._mapping.ids), self._mapping.counts)
+
+
+class CardCountsValues(ValuesView):
+    def __iter__(self):
+        return iter(self._mapping.counts)
+
+
+class CardCounts(Mapping):
+    """
+    A sparse vector of card counts keyed by card ID, viewed as a {card_name: count} mapping.
+
+    Cards keep the order they were added in, so the mapping iterates in deck list order.
+
+    Attributes:
+        ids (array): The card IDs present.
+        counts (array): The number of copies of each card, parallel to ids.
+    """
+
+    __slots__ = ('ids', 'counts', '_positions')
+
+    def __init__(self, ids=(), counts=()):
+        self.ids = array(ID_TYPECODE, ids)
+        self.counts = array(COUNT_TYPECODE, counts)
+        self._positions = None
+
+    def position(self, card_id):
+        """
+        Returns the index of a card ID in ids, or None if the card is not present.
+        """
+        # Built on first lookup, so vectors that are only iterated never pay for it
+        if self._positions is None:
+            self._positions = {card_id: i for i, card_id in enumerate(self.ids)}
+        return self._positions.get(card_id)
+
+    @classmethod
+    def from_dict(cls, card_counts):
+        """
+        Builds a CardCounts from a {card_name: count} dictionary.
+        """
+        return cls([get_card_id(name) for name in card_counts], card_counts.values())
+
+    @classmethod
+    def from_id_counts(cls, id_counts):
+        """
+        Builds a CardCounts from a {card_id: count} dictionary, dropping zero counts.
+        """
+        id_counts = {card_id: count for card_id, count in id_counts.items() if count}
+        return cls(id_counts.keys(), id_counts.values())
+
+    def id_counts(self):
+        """
+        Returns the vector as a {card_id: count} dictionary.
+        """
+        return dict(zip(self.ids, self.counts))
+
+    def count(self, card_id):
+        i = self.position(card_id)
+        return 0 if i is None else self.counts[i]
+
+    def __getitem__(self, card_name):
+        i = self.position(get_card_id(card_name, resolve=False))
+        if i is None:
+            raise KeyError(card_name)
+        return self.counts[i]
+
+    def __contains__(self, card_name):
+        return self.position(get_card_id(card_name, resolve=False)) is not None
+
+    def __iter__(self):
+        return map(get_card_name, self.ids)
+
+    def items(self):
+        return CardCountsItems(self)
+
+    def values(self):
+        return CardCountsValues(self)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __add__(self, other):
+        """
+        Adds two vectors card by card, e.g. a mainboard and its sideboard.
+        """
+        totals = self.id_counts()
+        for card_id, count in zip(other.ids, other.counts):
+            totals[card_id] = totals.get(card_id, 0) + count
+        return CardCounts.from_id_counts(totals)
+
+    def shortfall(self, other):
+        """
+        Returns the copies of each card in this vector that other does not cover,
+        e.g. the cards still needed for a deck given a collection.
+        """
+        owned = other.id_counts()
+        return CardCounts.from_id_counts({
+            card_id: count - owned.get(card_id, 0) for card_id, count in zip(self.ids, self.counts)
+            if count > owned.get(card_id, 0)
+        })
+
+    def difference(self, other):
+        """
+        Returns this vector minus other as signed counts, keeping only the cards that differ.
+        """
+        totals = self.id_counts()
+        for card_id, count in zip(other.ids, other.counts):
+            totals[card_id] = totals.get(card_id, 0) - count
+        return CardCounts.from_id_counts(totals)
+
+    @staticmethod
+    def maximum(vectors):
+        """
+        Returns the card-by-card maximum of several vectors, e.g. across deck versions.
+        """
+        maximums = {}
+        for vector in vectors:
+            for card_id, count in zip(vector.ids, vector.counts):
+                if count > maximums.get(card_id, 0):
+                    maximums[card_id] = count
+        return CardCounts.from_id_counts(maximums)
+
+    def __eq__(self, other):
+        if isinstance(other, CardCounts):
+            return self.id_counts() == other.id_counts()
+        return Mapping.__eq__(self, other)
+
+    __hash__ = None
+
+    def __getstate__(self):
+        return self.ids, self.counts
+
+    def __setstate__(self, state):
+        self.ids, self.counts = state
+        self._positions = None
+
+    def __repr__(self):
+        return f"CardCounts({dict(self.items())!r})"
+
+
+class VersionedCardCounts(Mapping):
+    """
+    One deck section across versions, as a {version: CardCounts} mapping stored as the
+    first version plus each later version's changes against it.
+
+    Deck versions usually differ by a handful of cards, so a delta holds only the cards
+    whose count changed, with signed counts. Looking a version up rebuilds its CardCounts
+    from the base: cards keep the base version's order, and cards only in the later
+    version come last. diff and count work on the deltas alone.
+
+    Attributes:
+        base_version (str): The version stored in full, normally "v1".
+        base (CardCounts): That version's cards.
+        deltas (dict): Later version -> CardCounts of count changes against base.
+    """
+
+    __slots__ = ('base_version', 'base', 'deltas')
+
+    def __init__(self, versions=None):
+        """
+        Args:
+            versions (dict, optional): Version -> CardCounts, in version order.
+        """
+        self.base_version = None
+        self.base = CardCounts()
+        self.deltas = {}
+        for version, cards in (versions or {}).items():
+            if self.base_version is None:
+                self.base_version, self.base = version, cards
+            else:
+                self.deltas[version] = cards.difference(self.base)
+
+    @classmethod
+    def from_deltas(cls, base_version, base, deltas):
+        versioned = cls()
+        versioned.base_version, versioned.base, versioned.deltas = base_version, base, deltas
+        return versioned
+
+    def delta(self, version):
+        """
+        Returns a version's changes against the base version, as signed counts.
+        """
+        if version == self.base_version:
+            return CardCounts()
+        return self.deltas[version]
+
+    def changed_ids(self):
+        """
+        Returns the IDs of every card whose count differs between any two versions.
+        """
+        return {card_id for delta in self.deltas.values() for card_id in delta.ids}
+
+    def all_ids(self):
+        """
+        Returns the IDs of every card that appears in any version.
+        """
+        ids = set(self.base.ids)
+        for delta in self.deltas.values():
+            ids.update(card_id for card_id, change in zip(delta.ids, delta.counts) if change > 0)
+        return ids
+
+    def count(self, version, card_id):
+        return self.base.count(card_id) + self.delta(version).count(card_id)
+
+    def diff(self, version1, version2):
+        """
+        Returns how the cards change from version1 to version2, as signed counts, using
+        only the two versions' deltas.
+        """
+        return self.delta(version2).difference(self.delta(version1))
+
+    def __getitem__(self, version):
+        if version == self.base_version:
+            return self.base
+        delta = self.deltas[version]
+        totals = self.base.id_counts()
+        for card_id, change in zip(delta.ids, delta.counts):
+            totals[card_id] = totals.get(card_id, 0) + change
+        return CardCounts.from_id_counts(totals)
+
+    def __iter__(self):
+        if self.base_version is not None:
+            yield self.base_version
+        yield from self.deltas
+
+    def __len__(self):
+        return (self.base_version is not None) + len(self.deltas)
+
+    def __contains__(self, version):
+        return version == self.base_version or version in self.deltas
+
+    def __repr__(self):
+        return f"VersionedCardCounts({dict(self.items())!r})"
+
+
+def versions_maximum(mainboard, sideboard):
+    """
+    Returns the card-by-card maximum over versions of mainboard plus sideboard, i.e. the
+    cards needed to play every version of a deck.
+
+    A card no version changes counts the same in all of them, so only the changed cards
+    are looked at per version, and the cost grows with the differences rather than with
+    the number of versions.
+
+    Args:
+        mainboard (VersionedCardCounts): The mainboard of every version.
+        sideboard (VersionedCardCounts): The sideboard of every version, with the same versions.
+    """
+    totals = (mainboard.base + sideboard.base).id_counts()
+    changed = mainboard.changed_ids() | sideboard.changed_ids()
+    if changed:
+        main_deltas = [mainboard.delta(version).id_counts() for version in mainboard]
+        side_deltas = [sideboard.delta(version).id_counts() for version in mainboard]
+        for card_id in changed:
+            base_total = totals.get(card_id, 0)
+            totals[card_id] = max(
+                base_total + main_delta.get(card_id, 0) + side_delta.get(card_id, 0)
+                for main_delta, side_delta in zip(main_deltas, side_deltas)
+            )
+    return CardCounts.from_id_counts(totals)
@@ -0,0 +1,157 @@
+"""
+Compact per-card records with the derived attributes the tools use on hot paths.
+
+Colors, types, image URIs and legality depend on a card's layout, and working them out
+means walking the nested Scryfall card dictionary. CardRecord does that once per card;
+afterwards those values are plain attribute reads.
+"""
+from legality import legality_mask, mask_formats
+
+MAIN_CARD_TYPES = (
+    "Creature",
+    "Artifact",
+    "Enchantment",
+    "Instant",
+    "Sorcery",
+    "Planeswalker",
+    "Battle",
+    "Land",
+)
+
+# Sorting orders used when laying out a deck by type and then color
+TYPE_SORT_ORDER = {
+    "Creature": 1,
+    "Instant": 2,
+    "Sorcery": 3,
+    "Artifact": 4,
+    "Enchantment": 5,
+    "Planeswalker": 6,
+    "Land": 7
+}
+COLOR_SORT_ORDER = {
+    "W": 1,
+    "U": 2,
+    "B": 3,
+    "R": 4,
+    "G": 5,
+    "Gold": 6,
+    "Colorless": 7
+}
+
+# Layouts whose front face carries the image
+FRONT_FACE_IMAGE_LAYOUTS = ('transform', 'modal_dfc', 'flip')
+
+
+def get_main_card_type(type_line):
+    """
+    Determines the main card type based on the type line.
+
+    Args:
+        type_line (str): The type line of the card.
+
+    Returns:
+        str: The main card type.
+    """
+    for card_type in MAIN_CARD_TYPES:
+        if card_type in type_line:
+            return card_type
+
+    return "Other"
+
+
+def color_category(colors):
+    """
+    Returns "Gold" for multicolored cards, "Colorless" for colorless ones and the single color otherwise.
+    """
+    if len(colors) > 1:
+        return "Gold"
+    elif len(colors) == 0:
+        return "Colorless"
+    else:
+        return colors[0]
+
+
+def card_colors(card):
+    layout = card['layout']
+    if layout in ["adventure", "prototype"]:
+        return card['color_identity']
+    elif layout == "transform":
+        return card['card_faces'][0]['colors']
+    elif layout == "modal_dfc":
+        return list({color for face in card['card_faces'] for color in face['colors']})
+    else:
+        return card['colors']
+
+
+class CardRecord:
+    """
+    The derived attributes of one card, computed once from its Scryfall dictionary.
+
+    Attributes:
+        name (str): The card's full Oracle name.
+        layout (str): The Scryfall layout, e.g. "normal", "transform" or "split".
+        colors (tuple): The card's colors, using the front face or color identity where
+                        the layout calls for it.
+        color_identity (tuple): The card's color identity.
+        type_line (str): The full type line.
+        front_type_line (str): The type line of the front face for transform cards,
+                               otherwise the full type line.
+        face_type_lines (tuple): The type line of every face, or just the card's own.
+        main_type (str): The main card type of the full type line.
+        front_main_type (str): The main card type of the front type line.
+        image_uris (dict): The front image URL for each image quality.
+        mana_value (float): The card's mana value.
+        legality_mask (int): Bitmask of the formats the card is legal in (see legality.py).
+        sort_key (tuple): Type and color ordering used to lay out a deck.
+    """
+
+    __slots__ = (
+        'name',
+        'layout',
+        'colors',
+        'color_identity',
+        'type_line',
+        'front_type_line',
+        'face_type_lines',
+        'main_type',
+        'front_main_type',
+        'image_uris',
+        'mana_value',
+        'legality_mask',
+        'sort_key',
+    )
+
+    def __init__(self, card):
+        faces = card.get('card_faces', [])
+        self.name = card['name']
+        self.layout = card.get('layout', '')
+        self.colors = tuple(card_colors(card))
+        self.color_identity = tuple(card.get('color_identity', ()))
+        self.type_line = card.get('type_line', '')
+        if self.layout == 'transform':
+            self.front_type_line = faces[0]['type_line']
+        else:
+            self.front_type_line = self.type_line
+        self.face_type_lines = tuple(face['type_line'] for face in faces if 'type_line' in face) or (self.type_line,)
+        self.main_type = get_main_card_type(self.type_line)
+        self.front_main_type = get_main_card_type(self.front_type_line)
+        if self.layout in FRONT_FACE_IMAGE_LAYOUTS and 'image_uris' in faces[0]:
+            self.image_uris = faces[0]['image_uris']
+        else:
+            self.image_uris = card.get('image_uris', {})
+        self.mana_value = card.get('cmc', 0)
+        self.legality_mask = legality_mask(card.get('legalities', {}))
+        self.sort_key = (
+            TYPE_SORT_ORDER.get(self.main_type, float('inf')),
+            COLOR_SORT_ORDER.get(color_category(self.colors), float('inf')),
+        )
+
+    @property
+    def legal_formats(self):
+        """
+        The formats the card is legal in.
+        """
+        return mask_formats(self.legality_mask)
+
+    def __repr__(self):
+        return f"CardRecord({self.name!r})"
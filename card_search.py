@@ -0,0 +1,146 @@
+"""
+Full-text search over the card pool.
+
+The card store keeps an FTS5 index over every card's name, type line and rules text
+(all faces of multi-faced cards), plus a table of color identity, mana value and legal
+formats. search_cards combines a text query with those filters in one SQL query:
+
+    search_cards('"when this" enters', type_line='Enchantment', color_identity='', identity_mode='exact')
+
+Text queries use FTS5 syntax: bare words must all appear, "quoted words" must appear as
+a phrase, and OR, NOT and prefix* work as usual. The same search is available from the
+command line:
+
+    python card_search.py '"when this" enters' --type Enchantment --identity '' --identity-mode exact
+    python card_search.py destroy --legal standard --max-mana-value 2 --in-list gauntlet.json
+"""
+import argparse
+import json
+
+from card_store import color_identity_mask, get_card_store
+from legality import format_bit
+
+IDENTITY_MODES = ('within', 'exact', 'including')
+
+
+def fts_phrase(text):
+    """
+    Quotes text as a single FTS5 phrase, so it is matched literally.
+    """
+    return '"' + text.replace('"', '""') + '"'
+
+
+def search_cards(text=None, type_line=None, color_identity=None, identity_mode='within', mana_value=None,
+                 min_mana_value=None, max_mana_value=None, legal_in=None, card_ids=None, limit=None, store=None):
+    """
+    Finds cards by rules text and attributes.
+
+    Args:
+        text (str, optional): An FTS5 query over names, type lines and rules text.
+        type_line (str, optional): Words that must appear in the type line, e.g. "Legendary Creature".
+        color_identity (str, optional): Colors as WUBRG letters; "" means colorless.
+        identity_mode (str): "within" for identities inside color_identity (what a deck of
+                             those colors can play), "exact" for exactly those colors, or
+                             "including" for identities containing all of them.
+        mana_value (float, optional): Exact mana value.
+        min_mana_value (float, optional): Lowest mana value allowed.
+        max_mana_value (float, optional): Highest mana value allowed.
+        legal_in (str, optional): A format the cards must be legal in, e.g. "standard".
+        card_ids (iterable, optional): Only search these cards, e.g. the cards of a gauntlet.
+        limit (int, optional): Maximum number of results.
+        store (CardStore, optional): The store to search. Defaults to the shared card store.
+
+    Returns:
+        list: Matching card names, sorted by name.
+    """
+    store = store or get_card_store()
+    joins = []
+    conditions = []
+    parameters = []
+
+    match_terms = []
+    if text:
+        match_terms.append(f"({text})")
+    if type_line:
+        match_terms.append(f"type_line : {fts_phrase(type_line)}")
+    if match_terms:
+        joins.append("JOIN card_search ON card_search.rowid = card_attributes.card_id")
+        conditions.append("card_search MATCH ?")
+        parameters.append(' AND '.join(match_terms))
+
+    if color_identity is not None:
+        mask = color_identity_mask(color_identity.upper())
+        if identity_mode == 'within':
+            conditions.append("card_attributes.color_identity & ? = 0")
+            parameters.append(~mask & 0b11111)
+        elif identity_mode == 'exact':
+            conditions.append("card_attributes.color_identity = ?")
+            parameters.append(mask)
+        elif identity_mode == 'including':
+            conditions.append("card_attributes.color_identity & ? = ?")
+            parameters.extend([mask, mask])
+        else:
+            raise ValueError(f"identity_mode must be one of {', '.join(IDENTITY_MODES)}")
+
+    if mana_value is not None:
+        conditions.append("card_attributes.mana_value = ?")
+        parameters.append(mana_value)
+    if min_mana_value is not None:
+        conditions.append("card_attributes.mana_value >= ?")
+        parameters.append(min_mana_value)
+    if max_mana_value is not None:
+        conditions.append("card_attributes.mana_value <= ?")
+        parameters.append(max_mana_value)
+    if legal_in:
+        conditions.append("card_attributes.legality & ? != 0")
+        parameters.append(format_bit(legal_in))
+    if card_ids is not None:
+        card_ids = list(card_ids)
+        conditions.append(f"card_attributes.card_id IN ({','.join('?' * len(card_ids))})")
+        parameters.extend(card_ids)
+
+    query = (
+        "SELECT cards.name FROM card_attributes JOIN cards ON cards.id = card_attributes.card_id "
+        + ' '.join(joins)
+        + (" WHERE " + ' AND '.join(conditions) if conditions else "")
+        + " ORDER BY cards.name"
+    )
+    if limit is not None:
+        query += f" LIMIT {int(limit)}"
+    return [row[0] for row in store.connection.execute(query, parameters)]
+
+
+def card_list_ids(json_file, store=None):
+    """
+    Returns the card IDs of a gauntlet.json style {"cards": [{"name": ...}]} file.
+    """
+    store = store or get_card_store()
+    with open(json_file, 'r') as f:
+        names = [card['name'] for card in json.load(f)['cards']]
+    return [card_id for card_id in map(store.get_card_id, names) if card_id is not None]
+
+
+if __name__ == "__main__":
+    import time
+
+    parser = argparse.ArgumentParser(description="Search the card pool by rules text and attributes.")
+    parser.add_argument('text', nargs='?', help="FTS5 query over names, type lines and rules text")
+    parser.add_argument('--type', dest='type_line', help="words that must appear in the type line")
+    parser.add_argument('--identity', dest='color_identity', help="color identity as WUBRG letters, '' for colorless")
+    parser.add_argument('--identity-mode', choices=IDENTITY_MODES, default='within')
+    parser.add_argument('--mana-value', type=float)
+    parser.add_argument('--min-mana-value', type=float)
+    parser.add_argument('--max-mana-value', type=float)
+    parser.add_argument('--legal', dest='legal_in', help="format the cards must be legal in")
+    parser.add_argument('--in-list', help="only search the cards of a gauntlet.json style file")
+    parser.add_argument('--limit', type=int)
+    args = parser.parse_args()
+
+    card_ids = card_list_ids(args.in_list) if args.in_list else None
+    start = time.perf_counter()
+    results = search_cards(args.text, args.type_line, args.color_identity, args.identity_mode, args.mana_value,
+                           args.min_mana_value, args.max_mana_value, args.legal_in, card_ids, args.limit)
+    elapsed = time.perf_counter() - start
+    for card_name in results:
+        print(card_name)
+    print(f"{len(results)} cards in {elapsed * 1e3:.1f} ms")
@@ -0,0 +1,530 @@
+"""
+Compiled, indexed local store for Scryfall card data.
+
+Loading a full Scryfall bulk data file with json.load takes seconds and hundreds of MB
+of memory. compile_card_store streams the bulk file into a SQLite database once, holding
+one JSON record per card (projected to the fields the tools use) plus a name index. CardStore then reads only the records a
+lookup actually needs, so opening the store costs milliseconds.
+"""
+import json
+import os
+import pathlib
+import sqlite3
+import threading
+import uuid
+
+from bulk_data import CARD_FIELDS, iter_bulk_cards, project_card
+from fuzzy_names import FuzzyNameIndex
+from keyword_matcher import KeywordMatcher
+from legality import legality_mask
+
+ORACLE_FILE = 'oracle-cards-20241109220318.json'
+CARD_STORE_FILE = 'card_store.sqlite3'
+
+# Bump whenever the tables written by compile_card_store change.
+SCHEMA_VERSION = 7
+
+# Price columns kept for every card, as Scryfall names them in a card's prices
+PRICE_CURRENCIES = ('usd', 'eur', 'tix')
+
+# Bit for each color in a color identity mask
+COLOR_BITS = {'W': 1, 'U': 2, 'B': 4, 'R': 8, 'G': 16}
+
+# Layouts whose individual faces can be looked up by name, e.g. "Fire" for "Fire // Ice".
+FACE_NAME_LAYOUTS = ('split', 'transform', 'modal_dfc', 'adventure', 'flip')
+
+
+def is_indexed_card(card):
+    """
+    Returns True for cards that belong in the name index, i.e. not tokens or "funny" set cards.
+    """
+    return card['set_type'] != "funny" and card['layout'] != "token"
+
+
+def card_aliases(card):
+    """
+    Returns the extra names a card can be looked up by: the face names of multi-faced
+    cards and its flavor name, if it has one.
+    """
+    aliases = []
+    if card['layout'] in FACE_NAME_LAYOUTS:
+        aliases.extend(face['name'] for face in card.get('card_faces', []))
+    if 'flavor_name' in card:
+        aliases.append(card['flavor_name'])
+    return aliases
+
+
+def card_text(card):
+    """
+    Returns all the rules text of a card, with the text of every face for multi-faced cards.
+    """
+    texts = [card.get('oracle_text', '')]
+    texts.extend(face.get('oracle_text', '') for face in card.get('card_faces', []))
+    return '\n'.join(text for text in texts if text)
+
+
+def card_keywords(card, keyword_matcher):
+    """
+    Returns the keywords a card has or mentions anywhere in its rules text.
+    """
+    return keyword_matcher.find(card_text(card)) | set(card.get('keywords', []))
+
+
+def color_identity_mask(colors):
+    mask = 0
+    for color in colors:
+        mask |= COLOR_BITS[color]
+    return mask
+
+
+def card_prices(card):
+    """
+    Returns a card's prices as floats in PRICE_CURRENCIES order, None where Scryfall has no price.
+    """
+    prices = card.get('prices') or {}
+    return tuple(float(prices[currency]) if prices.get(currency) else None for currency in PRICE_CURRENCIES)
+
+
+def index_card_attributes(connection, card_id, card):
+    """
+    Adds a card to the full-text search index, the attribute table search filters use,
+    and the price table.
+    """
+    connection.execute(
+        "INSERT OR REPLACE INTO card_search (rowid, name, type_line, oracle_text) VALUES (?, ?, ?, ?)",
+        (card_id, card['name'], card.get('type_line', ''), card_text(card)),
+    )
+    connection.execute(
+        "INSERT OR REPLACE INTO prices (card_id, usd, eur, tix) VALUES (?, ?, ?, ?)",
+        (card_id, *card_prices(card)),
+    )
+    connection.execute(
+        "INSERT OR REPLACE INTO card_attributes (card_id, color_identity, mana_value, legality) "
+        "VALUES (?, ?, ?, ?)",
+        (card_id, color_identity_mask(card.get('color_identity', [])), card.get('cmc', 0),
+         legality_mask(card.get('legalities', {}))),
+    )
+
+
+def build_card_index(oracle_data):
+    """
+    Builds an in-memory lookup table from case-folded card names to Oracle card entries.
+
+    Full card names are indexed first so they always win over face names and aliases.
+    Cards from "funny" sets and tokens are left out of the index.
+
+    Args:
+        oracle_data (iterable): Card dictionaries from a Scryfall bulk data file.
+
+    Returns:
+        dict: A dictionary mapping case-folded names to card dictionaries.
+    """
+    card_index = {}
+    aliases = []
+    for card in oracle_data:
+        if not is_indexed_card(card):
+            continue
+        card_index.setdefault(card['name'].casefold(), card)
+        aliases.extend((alias, card) for alias in card_aliases(card))
+
+    for alias, card in aliases:
+        card_index.setdefault(alias.casefold(), card)
+    return card_index
+
+
+def compile_card_store(bulk_file=ORACLE_FILE, store_file=CARD_STORE_FILE, fields=CARD_FIELDS):
+    """
+    Compiles a Scryfall bulk data file into an indexed SQLite card store.
+
+    The bulk file is streamed one card at a time, so memory use does not grow with the
+    size of the dump. The store is written to a temporary file first and moved into
+    place when complete, so a crash part way through never leaves a half-written store.
+
+    Args:
+        bulk_file (str): Path to the Scryfall bulk data JSON file.
+        store_file (str): Path of the SQLite store to create or replace.
+        fields (tuple or None): The card fields to keep in each record. None keeps every field.
+
+    Returns:
+        str: The path of the compiled store.
+    """
+    temp_file = store_file + '.tmp'
+    if os.path.exists(temp_file):
+        os.remove(temp_file)
+
+    connection = sqlite3.connect(temp_file)
+    with connection:
+        connection.executescript("""
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE cards (id INTEGER PRIMARY KEY, name TEXT NOT NULL, data TEXT NOT NULL);
+            CREATE TABLE card_names (name_key TEXT PRIMARY KEY, card_id INTEGER NOT NULL) WITHOUT ROWID;
+            CREATE TABLE keywords (keyword TEXT PRIMARY KEY) WITHOUT ROWID;
+            CREATE TABLE card_keywords (
+                keyword TEXT NOT NULL,
+                card_id INTEGER NOT NULL,
+                PRIMARY KEY (keyword, card_id)
+            ) WITHOUT ROWID;
+            CREATE VIRTUAL TABLE card_search USING fts5(
+                name, type_line, oracle_text, tokenize = 'unicode61 remove_diacritics 2'
+            );
+            CREATE TABLE card_attributes (
+                card_id INTEGER PRIMARY KEY,
+                color_identity INTEGER NOT NULL,
+                mana_value REAL NOT NULL,
+                legality INTEGER NOT NULL
+            );
+            CREATE TABLE prices (card_id INTEGER PRIMARY KEY, usd REAL, eur REAL, tix REAL);
+        """)
+
+        all_keywords = set()
+        aliases = []
+        for card in iter_bulk_cards(bulk_file, fields):
+            all_keywords.update(card.get('keywords', []))
+            if not is_indexed_card(card):
+                continue
+            card_id = connection.execute(
+                "INSERT INTO cards (name, data) VALUES (?, ?)",
+                (card['name'], json.dumps(card, separators=(',', ':'))),
+            ).lastrowid
+            # The first card with a given name wins, as it did with the linear scan
+            connection.execute(
+                "INSERT OR IGNORE INTO card_names (name_key, card_id) VALUES (?, ?)",
+                (card['name'].casefold(), card_id),
+            )
+            aliases.extend((alias.casefold(), card_id) for alias in card_aliases(card))
+            index_card_attributes(connection, card_id, card)
+
+        # Aliases go in last so they never shadow a full card name
+        connection.executemany("INSERT OR IGNORE INTO card_names (name_key, card_id) VALUES (?, ?)", aliases)
+        connection.executemany("INSERT INTO keywords (keyword) VALUES (?)", ((k,) for k in sorted(all_keywords)))
+
+        # The keyword list is only complete once every card has been read, so the
+        # keyword -> card inverted index is built in a second pass over the stored cards
+        keyword_matcher = KeywordMatcher(all_keywords)
+        for card_id, data in connection.execute("SELECT id, data FROM cards").fetchall():
+            connection.executemany(
+                "INSERT INTO card_keywords (keyword, card_id) VALUES (?, ?)",
+                ((keyword, card_id) for keyword in card_keywords(json.loads(data), keyword_matcher)),
+            )
+        connection.execute("CREATE INDEX card_keywords_by_card ON card_keywords (card_id)")
+        connection.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+            ('schema_version', str(SCHEMA_VERSION)),
+            ('source_file', os.path.basename(bulk_file)),
+            # Rows add_card appends differ between two compiles of the same bulk file
+            ('store_id', uuid.uuid4().hex),
+        ])
+    connection.close()
+
+    os.replace(temp_file, store_file)
+    return store_file
+
+
+class CardStore:
+    """
+    Read access to a compiled card store.
+
+    Card records are decoded from JSON the first time they are requested and kept in
+    memory afterwards, so repeated lookups of the same card are plain dictionary hits.
+    """
+
+    def __init__(self, store_file=CARD_STORE_FILE, read_only=False):
+        self.store_file = store_file
+        # A read-only store (see reopen_card_store) never adds cards; lookups that would
+        # need Scryfall fail instead, so another process can fetch and add them
+        self.read_only = read_only
+        if read_only:
+            self.connection = sqlite3.connect(pathlib.Path(store_file).resolve().as_uri() + "?mode=ro", uri=True,
+                                              check_same_thread=False)
+        else:
+            self.connection = sqlite3.connect(store_file, check_same_thread=False)
+        self._cards_by_name = {}
+        self._fuzzy_index = None
+        self._resolved_names = {}
+        # Aliases a read-only store could not save, for the process that owns the store (see add_aliases)
+        self.unsaved_aliases = []
+        self._keyword_matcher = None
+        self._keywords_by_card = {}
+        self._legality_masks = {}
+        self._snapshot = None
+
+    def get_meta(self, key, default=None):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    @property
+    def snapshot(self):
+        """
+        Identifies the bulk data file and schema the store was compiled from, and the
+        compile itself. Card IDs are only comparable between stores with the same
+        snapshot: a store rebuilt from the same file numbers the cards add_card fetched
+        from Scryfall differently, so it gets a new snapshot.
+        """
+        if self._snapshot is None:
+            self._snapshot = (f"{self.get_meta('source_file')}:{self.get_meta('schema_version')}:"
+                              f"{self.get_meta('store_id')}")
+        return self._snapshot
+
+    def get_card_id(self, card_name):
+        """
+        Returns the integer ID of a card in this store, or None if the name is unknown.
+        """
+        row = self.connection.execute(
+            "SELECT card_id FROM card_names WHERE name_key = ?", (card_name.casefold(),)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_card_name(self, card_id):
+        row = self.connection.execute("SELECT name FROM cards WHERE id = ?", (card_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_card(self, card_name):
+        """
+        Looks up a card by its full name, face name or alias, ignoring case.
+
+        Args:
+            card_name (str): The name of the card to look up.
+
+        Returns:
+            dict or None: The card dictionary, or None if the name is not in the store.
+        """
+        name_key = card_name.casefold()
+        if name_key in self._cards_by_name:
+            return self._cards_by_name[name_key]
+
+        row = self.connection.execute(
+            "SELECT cards.data FROM card_names JOIN cards ON cards.id = card_names.card_id "
+            "WHERE card_names.name_key = ?",
+            (name_key,),
+        ).fetchone()
+        card = json.loads(row[0]) if row else None
+        if card is not None:
+            self._cards_by_name[name_key] = card
+        return card
+
+    def add_card(self, card, extra_names=()):
+        """
+        Adds a card fetched from Scryfall to the store, so it is found locally from then on.
+
+        Args:
+            card (dict): A full Scryfall card object.
+            extra_names (iterable): Other names to index the card under, such as the
+                                    misspelled name it was fetched by.
+
+        Returns:
+            dict: The card as stored, projected to CARD_FIELDS.
+        """
+        card = project_card(card, CARD_FIELDS)
+        names = [card['name']] + card_aliases(card) + list(extra_names)
+        with self.connection:
+            row = self.connection.execute(
+                "SELECT card_id FROM card_names WHERE name_key = ?", (card['name'].casefold(),)
+            ).fetchone()
+            if row:
+                card_id = row[0]
+            else:
+                card_id = self.connection.execute(
+                    "INSERT INTO cards (name, data) VALUES (?, ?)",
+                    (card['name'], json.dumps(card, separators=(',', ':'))),
+                ).lastrowid
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO card_names (name_key, card_id) VALUES (?, ?)",
+                [(name.casefold(), card_id) for name in names],
+            )
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO card_keywords (keyword, card_id) VALUES (?, ?)",
+                [(keyword, card_id) for keyword in card_keywords(card, self.get_keyword_matcher())],
+            )
+            index_card_attributes(self.connection, card_id, card)
+        self._keywords_by_card.pop(card_id, None)
+        self._legality_masks.pop(card_id, None)
+        self._fuzzy_index = None
+        self._resolved_names.clear()
+        return card
+
+    def add_aliases(self, aliases):
+        """
+        Indexes cards under other names, such as the misspellings they were resolved from,
+        so those names are found without resolving them again. A read-only store keeps
+        them in unsaved_aliases instead.
+
+        Args:
+            aliases (iterable): (alias, card name) pairs. Aliases already in the store are ignored.
+        """
+        if self.read_only:
+            self.unsaved_aliases.extend(aliases)
+            return
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO card_names (name_key, card_id) "
+                "SELECT ?, card_id FROM card_names WHERE name_key = ?",
+                [(alias.casefold(), card_name.casefold()) for alias, card_name in aliases],
+            )
+        # The fuzzy index is kept: each alias resolves to the card it was already matched to
+
+    def get_fuzzy_index(self):
+        """
+        Returns the fuzzy name index over every name in the store, building it on first use.
+        """
+        if self._fuzzy_index is None:
+            self._fuzzy_index = FuzzyNameIndex(self.connection.execute(
+                "SELECT card_names.name_key, cards.name FROM card_names JOIN cards ON cards.id = card_names.card_id"
+            ))
+        return self._fuzzy_index
+
+    def resolve_card_name(self, card_name):
+        """
+        Resolves a misspelled, partial or loosely punctuated card name offline.
+
+        Args:
+            card_name (str): The card name as written in a deck list.
+
+        Returns:
+            FuzzyResult: The matched Oracle card name, or None plus the tied candidates.
+        """
+        if card_name not in self._resolved_names:
+            self._resolved_names[card_name] = self.get_fuzzy_index().resolve(card_name)
+        return self._resolved_names[card_name]
+
+    def all_keywords(self):
+        return {row[0] for row in self.connection.execute("SELECT keyword FROM keywords")}
+
+    def get_keyword_matcher(self):
+        if self._keyword_matcher is None:
+            self._keyword_matcher = KeywordMatcher(self.all_keywords())
+        return self._keyword_matcher
+
+    def cards_with_keyword(self, keyword):
+        """
+        Returns the IDs of every card that has or mentions a keyword.
+        """
+        return {row[0] for row in self.connection.execute(
+            "SELECT card_id FROM card_keywords WHERE keyword = ?", (keyword,)
+        )}
+
+    def keywords_for_cards(self, card_ids):
+        """
+        Returns the union of the keywords of several cards, read from the inverted index.
+
+        Args:
+            card_ids (iterable): Card IDs in this store.
+
+        Returns:
+            set: Every keyword any of the cards has or mentions in its rules text.
+        """
+        card_ids = set(card_ids)
+        missing = [card_id for card_id in card_ids if card_id not in self._keywords_by_card]
+        if missing:
+            for card_id in missing:
+                self._keywords_by_card[card_id] = set()
+            placeholders = ','.join('?' * len(missing))
+            for keyword, card_id in self.connection.execute(
+                f"SELECT keyword, card_id FROM card_keywords WHERE card_id IN ({placeholders})", missing
+            ):
+                self._keywords_by_card[card_id].add(keyword)
+        return set().union(*(self._keywords_by_card[card_id] for card_id in card_ids))
+
+    def legality_masks(self, card_ids):
+        """
+        Returns the legality bitmask (see legality.py) of each of several cards.
+
+        Args:
+            card_ids (iterable): Card IDs in this store.
+
+        Returns:
+            dict: Card ID -> mask of the formats the card is legal in.
+        """
+        card_ids = set(card_ids)
+        missing = [card_id for card_id in card_ids if card_id not in self._legality_masks]
+        if missing:
+            placeholders = ','.join('?' * len(missing))
+            self._legality_masks.update(self.connection.execute(
+                f"SELECT card_id, legality FROM card_attributes WHERE card_id IN ({placeholders})", missing
+            ))
+        return {card_id: self._legality_masks.get(card_id, 0) for card_id in card_ids}
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM cards").fetchone()[0]
+
+
+def open_card_store(bulk_file=ORACLE_FILE, store_file=CARD_STORE_FILE):
+    """
+    Opens the card store, compiling it from the bulk data file first if needed.
+
+    The store is recompiled when it is missing, was built by an older schema, or was
+    compiled from a different bulk data file. A store without its bulk file next to it
+    is used as is.
+
+    Args:
+        bulk_file (str): Path to the Scryfall bulk data JSON file the store is built from.
+        store_file (str): Path to the SQLite card store.
+
+    Returns:
+        CardStore: The opened card store.
+    """
+    if os.path.exists(store_file):
+        store = CardStore(store_file)
+        up_to_date = (
+            store.get_meta('schema_version') == str(SCHEMA_VERSION)
+            and (store.get_meta('source_file') == os.path.basename(bulk_file) or not os.path.exists(bulk_file))
+        )
+        if up_to_date:
+            return store
+        store.connection.close()
+
+    print(f"Compiling card store from {bulk_file}")
+    compile_card_store(bulk_file, store_file)
+    return CardStore(store_file)
+
+
+_card_store = None
+_card_store_lock = threading.Lock()
+
+
+def get_card_store():
+    """
+    Returns the process-wide card store, opening (and if needed compiling) it on first use.
+
+    Every module looks cards up through this one store, so a process only ever holds
+    one card database, and importing a module never touches the disk.
+    """
+    global _card_store
+    if _card_store is None:
+        with _card_store_lock:
+            if _card_store is None:
+                _card_store = open_card_store()
+    return _card_store
+
+
+# Stores inherited from the parent of a forked worker. Their connections must not be used
+# or closed in the worker, so they are kept referenced until it exits (fork workers end
+# with os._exit, which runs no finalizers).
+_inherited_stores = []
+
+
+def reopen_card_store(read_only=True):
+    """
+    Gives a worker process its own connection to the shared card store.
+
+    SQLite connections must not be used across a fork, so a store inherited from the
+    parent is set aside, and a new read-only connection takes its place. The cards and
+    fuzzy index the parent had already loaded are plain Python objects, and are kept.
+    The parent must have opened (and if needed compiled) the store before starting the worker.
+    """
+    global _card_store, _card_store_lock
+    # Another thread of the parent may have held the lock at the moment of the fork
+    _card_store_lock = threading.Lock()
+    inherited = _card_store
+    _card_store = CardStore(inherited.store_file if inherited else CARD_STORE_FILE, read_only=read_only)
+    if inherited is not None:
+        _inherited_stores.append(inherited)
+        _card_store._cards_by_name = inherited._cards_by_name
+        _card_store._fuzzy_index = inherited._fuzzy_index
+        _card_store._resolved_names = inherited._resolved_names
+        _card_store._snapshot = inherited._snapshot
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Usage: python card_store.py [bulk_file]
+    print(compile_card_store(*sys.argv[1:2]))
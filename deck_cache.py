@@ -0,0 +1,316 @@
+"""
+Versioned, two-level cache of parsed decks, kept in one SQLite file.
+
+Parsing a deck list resolves every card name, so parsed decks are cached at two levels:
+
+1. Raw entries are keyed by deck_hash: a hash of the deck list as written, parsed but
+   with its card names not yet resolved. It covers the metadata and each section's
+   cards in sorted order. Whitespace, line endings, card order, "4x" versus "4", set
+   codes and comments do not change it. Each raw entry points to a deck entry.
+2. Deck entries are keyed by MTGDeck.canonical_hash: the resolved card counts of every
+   version. Lists of the same cards spelled differently, or the same list under a new
+   name, share one deck entry.
+
+A lookup tries the raw entry first. On a miss, the deck list's card names are looked up
+in the card store without any fuzzy matching or Scryfall requests. Misspellings an
+earlier parse resolved are found too, since resolved names are saved in the store as
+aliases (see CardStore.add_aliases). If all the names are known, the deck entry of their
+canonical hash is tried. A hit there is returned with this deck list's own text and
+metadata, and gets a raw entry of its own. Only decks whose cards actually changed are
+parsed again, so cosmetic edits to a deck file cost nothing.
+
+Every key also covers the card store snapshot, since card IDs are only valid within one
+store. DECK_CACHE_VERSION is kept in the file's user_version, and a file written by
+another version is emptied on open. Entries are plain JSON (see MTGDeck.to_dict) rather
+than pickled objects. collect_garbage drops entries of other snapshots and entries
+nobody has loaded in a while.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from card_store import get_card_store
+from deck_parser import MAINBOARD, SIDEBOARD, read_deck, version_sort_key
+from mtg_deck import MTGDeck, canonical_deck_hash
+from mtg_tools import get_card_id
+
+DECK_CACHE_FILE = 'deck_cache.sqlite3'
+
+# Bump whenever MTGDeck.to_dict changes what it writes, deck lists parse differently,
+# or the tables change.
+DECK_CACHE_VERSION = 4
+
+# Entries not loaded for this long are dropped by collect_garbage
+UNUSED_ENTRY_MAX_AGE = 30 * 24 * 60 * 60
+
+
+def deck_hash(raw_deck, source='<deck>', line_number=1):
+    """
+    Returns a hash of a deck list's metadata and cards as written, before name
+    resolution, independent of formatting and card order.
+
+    Args:
+        raw_deck (list): The deck list's lines.
+        source (str): The file the deck list came from, for DeckParseError messages.
+        line_number (int): The line of source the deck list starts on.
+    """
+    deck_text = read_deck(raw_deck, source, line_number)
+    lines = [f"{key}: {value}" for key, value in sorted(deck_text.metadata.items())]
+    for version in sorted(deck_text.versions, key=version_sort_key):
+        for section in (MAINBOARD, SIDEBOARD):
+            lines.append(f"# {version} {section}")
+            lines.extend(sorted(f"{count} {name}" for name, count in deck_text.versions[version][section].items()))
+    return hashlib.sha256('\n'.join(lines).encode('utf-8')).hexdigest()
+
+
+def known_canonical_hash(raw_deck):
+    """
+    Returns the canonical hash a deck list will parse to, using only names the card
+    store already knows (including misspellings resolved before), or None if any card
+    would need resolving.
+    """
+    versions = {}
+    for version, sections in read_deck(raw_deck).versions.items():
+        resolved = []
+        for section in (MAINBOARD, SIDEBOARD):
+            counts = {}
+            for name, count in sections[section].items():
+                card_id = get_card_id(name, resolve=False)
+                if card_id is None:
+                    return None
+                counts[card_id] = counts.get(card_id, 0) + count
+            resolved.append(counts)
+        versions[version] = resolved
+    return canonical_deck_hash(versions)
+
+
+def hash_cache_key(hash, snapshot=None):
+    """
+    Returns the cache key of a deck_hash or canonical hash under a card store snapshot
+    (the shared store's by default).
+    """
+    snapshot = snapshot or get_card_store().snapshot
+    return hashlib.sha256(f"{snapshot}\n{hash}".encode('utf-8')).hexdigest()
+
+
+def deck_cache_key(raw_deck, snapshot=None):
+    """
+    Returns the raw entry key of a deck list.
+    """
+    return hash_cache_key(deck_hash(raw_deck), snapshot)
+
+
+def deck_list_data(deck):
+    """
+    Returns the parts of a deck's to_dict data that belong to its deck list rather than its cards.
+    """
+    return {
+        'raw_deck': deck.raw_deck,
+        'deck_name': deck.deck_name,
+        'deck_author': deck.deck_author,
+        'deck_event': deck.deck_event,
+    }
+
+
+class DeckCache:
+    """
+    Parsed decks under raw and canonical keys, in a single SQLite file.
+    """
+
+    def __init__(self, cache_file=DECK_CACHE_FILE):
+        self.cache_file = cache_file
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(cache_file, check_same_thread=False)
+        with self.connection:
+            if self.connection.execute("PRAGMA user_version").fetchone()[0] != DECK_CACHE_VERSION:
+                self.connection.executescript(f"""
+                    DROP TABLE IF EXISTS decks;
+                    DROP TABLE IF EXISTS raw_entries;
+                    PRAGMA user_version = {DECK_CACHE_VERSION};
+                """)
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS decks (
+                    canonical_key TEXT PRIMARY KEY,
+                    snapshot TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    last_used REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS raw_entries (
+                    raw_key TEXT PRIMARY KEY,
+                    canonical_key TEXT NOT NULL,
+                    snapshot TEXT NOT NULL,
+                    deck_list TEXT NOT NULL,
+                    last_used REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS raw_entries_by_canonical_key ON raw_entries (canonical_key);
+            """)
+
+    def get_many(self, raw_decks):
+        """
+        Loads the cached decks for several deck lists, by raw key and then by canonical key.
+
+        Returns:
+            list: The cached MTGDeck for each deck list, or None where there is no valid entry.
+        """
+        decks = self.get_many_by_hash([deck_hash(raw_deck) for raw_deck in raw_decks])
+        misses = {}
+        for index, (raw_deck, deck) in enumerate(zip(raw_decks, decks)):
+            if deck is None:
+                canonical_hash = known_canonical_hash(raw_deck)
+                if canonical_hash is not None:
+                    misses[index] = canonical_hash
+        if not misses:
+            return decks
+
+        snapshot = get_card_store().snapshot
+        canonical_keys = {index: hash_cache_key(canonical_hash, snapshot) for index, canonical_hash in misses.items()}
+        placeholders = ','.join('?' * len(canonical_keys))
+        with self._lock:
+            rows = dict(self.connection.execute(
+                f"SELECT canonical_key, data FROM decks WHERE canonical_key IN ({placeholders})",
+                list(canonical_keys.values()),
+            ))
+        found = []
+        for index, canonical_key in canonical_keys.items():
+            if canonical_key in rows:
+                deck = self._load(rows[canonical_key], None, snapshot)
+                if deck is not None:
+                    # Same cards as the cached deck, but this deck list's own text and metadata
+                    deck.raw_deck = raw_decks[index]
+                    deck.deck_name, deck.deck_author, deck.deck_event = {}, {}, {}
+                    deck.build_meta_info(read_deck(deck.raw_deck).metadata)
+                    decks[index] = deck
+                    found.append(deck)
+        self.put_many(found)
+        return decks
+
+    def get_many_by_hash(self, hashes):
+        """
+        Loads the cached decks whose deck_hash is already known (see deck_manifest.py),
+        so the deck lists do not have to be read again.
+
+        Returns:
+            list: The cached MTGDeck for each hash, or None where there is no valid entry.
+        """
+        snapshot = get_card_store().snapshot
+        keys = [hash_cache_key(raw_hash, snapshot) for raw_hash in hashes]
+        placeholders = ','.join('?' * len(keys))
+        now = time.time()
+        with self._lock, self.connection:
+            rows = {
+                raw_key: (canonical_key, deck_list, data)
+                for raw_key, canonical_key, deck_list, data in self.connection.execute(
+                    f"SELECT raw_entries.raw_key, raw_entries.canonical_key, raw_entries.deck_list, decks.data "
+                    f"FROM raw_entries JOIN decks ON decks.canonical_key = raw_entries.canonical_key "
+                    f"WHERE raw_entries.raw_key IN ({placeholders})", keys,
+                )
+            }
+            self.connection.executemany(
+                "UPDATE raw_entries SET last_used = ? WHERE raw_key = ?", [(now, raw_key) for raw_key in rows]
+            )
+            self.connection.executemany(
+                "UPDATE decks SET last_used = ? WHERE canonical_key = ?",
+                [(now, canonical_key) for canonical_key, _, _ in rows.values()],
+            )
+
+        decks = []
+        for raw_key in keys:
+            row = rows.get(raw_key)
+            decks.append(self._load(row[2], row[1], snapshot) if row else None)
+        return decks
+
+    @staticmethod
+    def _load(data, deck_list, snapshot):
+        try:
+            data = json.loads(data)
+            if deck_list is not None:
+                data.update(json.loads(deck_list))
+            deck = MTGDeck.from_dict(data)
+        except (ValueError, KeyError, TypeError):
+            return None
+        # The key already covers the snapshot; checking it guards against a corrupt entry
+        return deck if deck.card_store_snapshot == snapshot else None
+
+    def get(self, raw_deck):
+        return self.get_many([raw_deck])[0]
+
+    def put_many(self, decks):
+        """
+        Writes several parsed decks in one transaction, each under its canonical key, with
+        a raw entry for its deck list.
+        """
+        now = time.time()
+        deck_rows = []
+        raw_rows = []
+        for deck in decks:
+            snapshot = deck.card_store_snapshot
+            canonical_key = hash_cache_key(deck.canonical_hash(), snapshot)
+            deck_rows.append((canonical_key, snapshot, json.dumps(deck.to_dict(), separators=(',', ':')), now))
+            raw_rows.append((deck_cache_key(deck.raw_deck, snapshot), canonical_key, snapshot,
+                             json.dumps(deck_list_data(deck), separators=(',', ':')), now))
+        with self._lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO decks (canonical_key, snapshot, data, last_used) VALUES (?, ?, ?, ?)",
+                deck_rows,
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO raw_entries (raw_key, canonical_key, snapshot, deck_list, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                raw_rows,
+            )
+
+    def put(self, deck):
+        self.put_many([deck])
+
+    def collect_garbage(self, max_age=UNUSED_ENTRY_MAX_AGE):
+        """
+        Deletes entries written under another card store snapshot, entries not loaded for
+        max_age seconds, and deck entries no raw entry points to any more.
+
+        Returns:
+            int: The number of entries deleted.
+        """
+        snapshot = get_card_store().snapshot
+        cutoff = time.time() - max_age
+        with self._lock, self.connection:
+            deleted = self.connection.execute(
+                "DELETE FROM raw_entries WHERE snapshot != ? OR last_used < ?", (snapshot, cutoff)
+            ).rowcount
+            deleted += self.connection.execute(
+                "DELETE FROM decks WHERE snapshot != ? OR last_used < ? "
+                "OR canonical_key NOT IN (SELECT canonical_key FROM raw_entries)",
+                (snapshot, cutoff),
+            ).rowcount
+        return deleted
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM decks").fetchone()[0]
+
+
+_deck_cache = None
+_deck_cache_lock = threading.Lock()
+
+
+def get_deck_cache():
+    """
+    Returns the process-wide deck cache, opening it on first use.
+    """
+    global _deck_cache
+    if _deck_cache is None:
+        with _deck_cache_lock:
+            if _deck_cache is None:
+                _deck_cache = DeckCache()
+    return _deck_cache
+
+
+def load_cached_deck(raw_deck):
+    """
+    Returns the cached MTGDeck for a deck list, or None if there is no valid entry.
+    """
+    return get_deck_cache().get(raw_deck)
+
+
+def save_cached_deck(deck):
+    get_deck_cache().put(deck)
@@ -1,50 +1,14 @@
 import json
-import requests
-import time
 import os
 import glob
 
+from deck_parser import iter_deck_file
+from gauntlet_tools import iter_parsed_decks
+from mtg_tools import get_card_colors, get_oracle_name
+
 current_dir = os.path.dirname(os.path.abspath(__file__))
 deck_list_path = os.path.join(current_dir, 'deck_lists')
 
-with open('oracle-cards-20240723210312.json', 'r', encoding="utf8") as f:
-    oracle_data = json.load(f)
-
-def get_card_entry(card_name):
-    for card in oracle_data:
-        if card['name'].lower() == card_name.lower():
-            if card['set_type'] != "funny":
-                return card
-    url = 'https://api.scryfall.com/cards/named?fuzzy=' + card_name
-    fuzzy_response = requests.get(url)
-    return fuzzy_response.json()
-
-def get_oracle_name(card_name):
-    url = 'https://api.scryfall.com/cards/named?fuzzy=' + card_name
-    # Wait for 100ms to avoid rate limiting
-    time.sleep(0.2)
-    response = requests.get(url)
-    data = response.json()
-    # print(card_name, data)
-    return data['name']
-
-def get_card_colors(card_name):
-    card = get_card_entry(card_name)
-    layout = card['layout']
-    if layout == "adventure":
-        return card['color_identity']
-    elif layout == "transform":
-        return card['card_faces'][0]['colors']
-    elif layout == "modal_dfc":
-        colors = []
-        for face in card['card_faces']:
-            colors += face['colors']
-        return list(set(colors))
-    elif layout == "prototype":
-        return card['color_identity']
-    else:
-        return card['colors']
-
 class deck:
     def __init__(self, raw_deck):
         self.mainboard = {}
@@ -118,19 +82,6 @@ class deck:
         print(color_distribution)
 
 
-### Implementing things, we should do this somewhere else. ###
-
-txt_files = glob.glob(os.path.join(deck_list_path, '*.txt'))
-decks = []
-deck_names = []
-for txt_file in txt_files:
-    with open(txt_file, 'r') as file:
-        current_deck = file.readlines()
-        # print(current_deck)
-        deck_names.append(current_deck[0].strip())
-    # d = deck(current_deck)
-    # print(d.deck_name)
-    # decks.append(d)
 
 
 
@@ -145,10 +96,6 @@ for txt_file in txt_files:
 #         visual_spoiler_v2(deck_list, sideboard_list, deck_name)
 
 
-import random
-print(deck_names)
-print(random.choice(deck_names))
-
 ##############################################################
 
 
@@ -283,31 +230,30 @@ def print_differences(differences):
 # print_differences(differences)
 
 
-gauntlet = load_json('gauntlet.json')['cards']
-
 # for item in gauntlet:
 #     card_data = get_card_entry(item['name'])
 #     if 'Land' in card_data['type_line'] and len(card_data['color_identity']) == 3:
 #         print(item['quantity'], item['name'])
 
 
-def build_decks(file_path):
-    decks = []
-    deck_object_list = []
-    with open(file_path, 'r') as file:
-        current_deck = []
-        for line in file:
-            line = line.strip()
-            if not line:
-                decks.append(current_deck)
-                current_deck = []
-            else:
-                current_deck.append(line)
-    for deck_list in decks:
-        d = deck(deck_list)
-        print(d)
-        deck_object_list.append(d)
-    return deck_object_list
+def build_decks(file_path, workers=None, errors='raise'):
+    """
+    Streams the decks of a file holding any number of deck lists, e.g. an event dump
+    or a Moxfield/Arena/MTGO export (see deck_parser).
+
+    Args:
+        file_path (str): The deck list file.
+        workers (int, optional): Number of processes to resolve card names with (see iter_parsed_decks).
+        errors (str): "raise" to stop at the first bad line or unknown card, or "skip" to
+                      print it and leave out its deck.
+
+    Yields:
+        MTGDeck: Each deck, in file order.
+    """
+    raw_decks = (deck_text.raw_deck for deck_text in iter_deck_file(file_path, errors))
+    for deck in iter_parsed_decks(raw_decks, workers, errors=errors):
+        if deck is not None:
+            yield deck
 
 ###########################################################################
 
@@ -328,4 +274,26 @@ def build_decks(file_path):
 # Esper Midrange
 # Bant Toxic
 # Mono Red Aggro
-# Simic Artifacts
\ No newline at end of file
+# Simic Artifacts
+
+
+if __name__ == "__main__":
+    ### Implementing things, we should do this somewhere else. ###
+    import random
+
+    txt_files = glob.glob(os.path.join(deck_list_path, '*.txt'))
+    decks = []
+    deck_names = []
+    for txt_file in txt_files:
+        with open(txt_file, 'r') as file:
+            current_deck = file.readlines()
+            # print(current_deck)
+            deck_names.append(current_deck[0].strip())
+        # d = deck(current_deck)
+        # print(d.deck_name)
+        # decks.append(d)
+
+    print(deck_names)
+    print(random.choice(deck_names))
+
+    gauntlet = load_json('gauntlet.json')['cards']
@@ -0,0 +1,257 @@
+"""
+Incremental rebuilds of the gauntlet outputs, driven by a manifest of the deck lists.
+
+Each set of deck lists (the gauntlet's and the pre-gauntlet's) has its own manifest, which
+records the modification time, size and deck_hash (the hash the deck cache is keyed by)
+of every deck list, and which optional outputs were built for all of them. A rebuild only stats each file: a file is read
+and hashed again only if its mtime or size moved, and it only counts as changed if its
+hash did too. Unchanged decks are loaded straight from the deck cache by hash and
+changed ones are parsed. Then only the outputs that depend on the changed decks are
+written:
+
+- the gauntlet list, whenever a deck list was added, changed or removed,
+- the deck images and HTML of the added and changed decks (if asked for), or of every
+  deck the first time they are asked for.
+
+A new card store snapshot changes every deck's card IDs, so it counts as every deck changing.
+
+    python deck_manifest.py                   # rebuild what changed since the last run
+    python deck_manifest.py --watch --images  # keep rebuilding while deck_lists/ is edited
+"""
+import argparse
+import contextlib
+import json
+import os
+import time
+
+from card_store import get_card_store
+from deck_cache import deck_hash, get_deck_cache
+from gauntlet_tools import (build_gauntlet, deck_list_files, ensure_cache_directory, image_path,
+                            parse_missing_decks, read_raw_deck, update_deck_visuals)
+from mtg_tools import deck_to_html
+
+# Each set of deck lists has its own manifest and outputs, so building one never touches the other's
+MANIFEST_FILES = {'gauntlet': 'deck_manifest.json', 'pre_gauntlet': 'pre_gauntlet_deck_manifest.json'}
+GAUNTLET_FILES = {'gauntlet': 'gauntlet.json', 'pre_gauntlet': 'pre_gauntlet.json'}
+DECK_HTML_DIRECTORIES = {'gauntlet': 'deck_html', 'pre_gauntlet': 'pre_gauntlet_deck_html'}
+
+# Bump whenever the manifest layout or the meaning of deck_hash changes
+MANIFEST_VERSION = 3
+
+# Seconds between scans in watch mode, so an edit is picked up well within a second
+POLL_INTERVAL = 0.5
+
+
+class DeckManifest:
+    """
+    The last seen state of each deck list file.
+
+    Attributes:
+        manifest_file (str): Where the manifest is saved.
+        snapshot (str): The card store snapshot the outputs were last built with.
+        entries (dict): Path -> {"mtime_ns", "size", "deck_hash"}.
+        outputs (list): The optional outputs ("images", "html") that are up to date for every deck.
+    """
+
+    def __init__(self, manifest_file=MANIFEST_FILES['gauntlet']):
+        self.manifest_file = manifest_file
+        self.snapshot = None
+        self.entries = {}
+        self.outputs = []
+        try:
+            with open(manifest_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') == MANIFEST_VERSION:
+            self.snapshot = data.get('snapshot')
+            self.entries = data.get('files', {})
+            self.outputs = data.get('outputs', [])
+
+    def refresh(self, paths):
+        """
+        Compares the deck list files that exist now against the manifest, without changing
+        it. The caller commits the new entries once the outputs are rebuilt, so a failed
+        rebuild is retried on the next scan.
+
+        Args:
+            paths (list): The current deck list paths.
+
+        Returns:
+            tuple: The new entries (see entries), and lists of the "added", "changed" and "removed" paths.
+        """
+        entries = {}
+        changes = {'added': [], 'changed': [], 'removed': []}
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                # Deleted since it was listed; the next scan will not list it
+                continue
+            entry = self.entries.get(path)
+            if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                entries[path] = entry
+                continue
+            new_hash = deck_hash(read_raw_deck(path), path)
+            if entry is None:
+                changes['added'].append(path)
+            elif entry['deck_hash'] != new_hash:
+                changes['changed'].append(path)
+            entries[path] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'deck_hash': new_hash}
+
+        changes['removed'] = sorted(set(self.entries) - set(entries))
+        return entries, changes
+
+    def save(self):
+        data = {'version': MANIFEST_VERSION, 'snapshot': self.snapshot, 'outputs': self.outputs,
+                'files': self.entries}
+        # Write then rename, so an interrupted save never leaves a truncated manifest
+        temporary_file = self.manifest_file + '.tmp'
+        with open(temporary_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=1)
+        os.replace(temporary_file, self.manifest_file)
+
+
+def load_decks(paths, entries, workers=None):
+    """
+    Returns the MTGDeck of each path, from the deck cache by the hashes in entries (see
+    DeckManifest.refresh) where possible. Only the deck lists that miss the cache are read and parsed.
+    """
+    deck_cache = get_deck_cache()
+    decks = deck_cache.get_many_by_hash([entries[path]['deck_hash'] for path in paths])
+    raw_decks = [read_raw_deck(path) if deck is None else None for path, deck in zip(paths, decks)]
+    # A deck list with new text may still have the cards of a cached deck
+    missing = [index for index, deck in enumerate(decks) if deck is None]
+    for index, deck in zip(missing, deck_cache.get_many([raw_decks[index] for index in missing]) if missing else []):
+        decks[index] = deck
+    parse_missing_decks(decks, raw_decks, workers)
+    return decks
+
+
+def html_file(path, which_decks="gauntlet"):
+    return os.path.join(DECK_HTML_DIRECTORIES[which_decks], os.path.splitext(os.path.basename(path))[0] + '.html')
+
+
+def write_deck_html(deck, path, which_decks="gauntlet"):
+    ensure_cache_directory(DECK_HTML_DIRECTORIES[which_decks])
+    with open(html_file(path, which_decks), 'w', encoding='utf-8') as f, contextlib.redirect_stdout(f):
+        deck_to_html(deck)
+
+
+def rebuild(manifest, which_decks="gauntlet", gauntlet_file=None, images=False, html=False, workers=None):
+    """
+    Regenerates the outputs affected by the deck lists that changed since the manifest was saved.
+
+    Args:
+        manifest (DeckManifest): The manifest to compare against. It is only updated and
+                                 saved once the outputs are written.
+        which_decks (str): "gauntlet" for deck_lists or "pre_gauntlet" for pre_gauntlet_deck_lists.
+        gauntlet_file (str, optional): Where to write the gauntlet card list (GAUNTLET_FILES by default).
+        images (bool): Also save the deck images of the added and changed decks, or of
+                       every deck if the manifest has no images built.
+        html (bool): Likewise for the deck HTML.
+        workers (int, optional): Number of processes to parse changed decks with (see parse_decks).
+
+    Returns:
+        dict: Lists of the "added", "changed" and "removed" paths; all empty if nothing was rebuilt.
+    """
+    gauntlet_file = gauntlet_file or GAUNTLET_FILES[which_decks]
+    paths = deck_list_files(which_decks)
+    entries, changes = manifest.refresh(paths)
+    paths = [path for path in paths if path in entries]
+
+    snapshot = get_card_store().snapshot
+    if manifest.snapshot != snapshot:
+        changes['changed'] = [path for path in paths if path not in changes['added']]
+    outputs = {output for output, wanted in (('images', images), ('html', html)) if wanted}
+    # Outputs not built by an earlier run are needed for every deck, changed or not
+    new_outputs = outputs - set(manifest.outputs)
+    if not any(changes.values()) and not new_outputs and os.path.exists(gauntlet_file):
+        if entries != manifest.entries:
+            # Only modification times moved, so there is nothing to rebuild
+            manifest.entries = entries
+            manifest.save()
+        return changes
+
+    decks = load_decks(paths, entries, workers)
+    build_gauntlet(decks, gauntlet_file)
+
+    stale = set(changes['added']) | set(changes['changed'])
+
+    def stale_decks(output):
+        return [(path, deck) for path, deck in zip(paths, decks) if path in stale or output in new_outputs]
+
+    if images:
+        ensure_cache_directory(image_path)
+        update_deck_visuals([deck for _, deck in stale_decks('images')], save=True)
+    if html:
+        for path, deck in stale_decks('html'):
+            write_deck_html(deck, path, which_decks)
+        for path in changes['removed']:
+            if os.path.exists(html_file(path, which_decks)):
+                os.remove(html_file(path, which_decks))
+
+    # Updated last, so outputs that failed to build are retried on the next scan. An
+    # output not asked for is out of date as soon as any deck list changes.
+    manifest.entries = entries
+    manifest.snapshot = snapshot
+    manifest.outputs = sorted(outputs if any(changes.values()) else outputs | set(manifest.outputs))
+    manifest.save()
+    return changes
+
+
+def describe_changes(changes):
+    return ', '.join(f"{len(paths)} {kind}" for kind, paths in changes.items())
+
+
+def watch(manifest, interval=POLL_INTERVAL, **rebuild_options):
+    """
+    Polls the deck lists every interval seconds and rebuilds whenever one changes, until interrupted.
+
+    Args:
+        manifest (DeckManifest): The manifest to rebuild against.
+        interval (float): Seconds between scans.
+        **rebuild_options: Passed on to rebuild.
+    """
+    print(f"Watching the deck lists every {interval}s, press Ctrl+C to stop.")
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                changes = rebuild(manifest, **rebuild_options)
+            except Exception as e:
+                # A half-saved or broken deck list should not end the watch; every scan retries it
+                print(f"Rebuild failed: {e}")
+            else:
+                if any(changes.values()):
+                    elapsed = time.perf_counter() - start
+                    print(f"Rebuilt ({describe_changes(changes)}) in {elapsed * 1e3:.0f} ms")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the gauntlet outputs of the deck lists that changed.")
+    parser.add_argument('--decks', dest='which_decks', default='gauntlet', choices=('gauntlet', 'pre_gauntlet'))
+    parser.add_argument('--output', dest='gauntlet_file',
+                        help="where to write the gauntlet list (gauntlet.json or pre_gauntlet.json by default)")
+    parser.add_argument('--images', action='store_true', help="also save images of the changed decks")
+    parser.add_argument('--html', action='store_true', help="also write HTML of the changed decks")
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--watch', action='store_true', help="keep rebuilding as deck lists are edited")
+    parser.add_argument('--interval', type=float, default=POLL_INTERVAL)
+    args = parser.parse_args()
+
+    manifest = DeckManifest(MANIFEST_FILES[args.which_decks])
+    options = dict(which_decks=args.which_decks, gauntlet_file=args.gauntlet_file, images=args.images,
+                   html=args.html, workers=args.workers)
+    if args.watch:
+        watch(manifest, args.interval, **options)
+    else:
+        start = time.perf_counter()
+        changes = rebuild(manifest, **options)
+        if any(changes.values()):
+            print(f"Rebuilt ({describe_changes(changes)}) in {(time.perf_counter() - start) * 1e3:.0f} ms")
+        else:
+            print("Nothing changed.")
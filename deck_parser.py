@@ -0,0 +1,282 @@
+"""
+Line-by-line deck list parsing, for single decks and for files holding any number of them.
+
+Three layouts are understood, and may be mixed within one file:
+
+- This repository's format: a "# Deck Name" line or "Name:", "Author:" and "Event:"
+  lines, then "# v1", "# v2", ... sections, each optionally followed by "# Sideboard".
+- MTGO exports: the mainboard, a blank line, then the sideboard.
+- Arena and Moxfield exports: "About" / "Name ..." headers, "Deck", "Commander",
+  "Companion" and "Sideboard" sections, and card lines like "4 Opt (XLN) 65 *F*".
+
+Cards before any "# v" line belong to v1. iter_decks splits a file into decks as it reads
+it: a deck ends at the next header once it has cards, or at a blank line after its
+sideboard. Only the deck being read is held in memory, so event dumps of thousands of
+decks stream through in constant memory:
+
+    for deck_text in iter_deck_file('event_dump.txt'):
+        deck = MTGDeck(deck_text.raw_deck)
+
+Any line that is not a header, section marker or card raises a DeckParseError that
+names its file and line number.
+"""
+import re
+
+# Line kinds returned by classify_line
+BLANK = 'blank'
+COMMENT = 'comment'
+HEADER = 'header'  # "# Deck Name", or Arena's "About"
+METADATA = 'metadata'  # "Name: ...", "Author: ...", Arena's "Name ..."
+VERSION = 'version'  # "# v2"
+SECTION = 'section'  # "# Sideboard", "Deck", "Companion", ...
+CARD = 'card'
+
+MAINBOARD = 'mainboard'
+SIDEBOARD = 'sideboard'
+# Cards in these sections are read but not part of the deck
+IGNORED_SECTION = 'ignored'
+
+SECTION_NAMES = {
+    'deck': MAINBOARD,
+    'main': MAINBOARD,
+    'mainboard': MAINBOARD,
+    'main deck': MAINBOARD,
+    'commander': MAINBOARD,
+    'sideboard': SIDEBOARD,
+    'companion': SIDEBOARD,
+    'maybeboard': IGNORED_SECTION,
+    'considering': IGNORED_SECTION,
+    'tokens': IGNORED_SECTION,
+}
+
+VERSION_PATTERN = re.compile(r'#\s*v(\d+)$', re.IGNORECASE)
+# "4 Name", "4x Name", and the Arena/Moxfield "4 Name (SET) 123 *F*"
+CARD_PATTERN = re.compile(r'(\d+)x?\s+(.+?)(?:\s+\([A-Za-z0-9]{2,6}\)(?:\s+[\w★-]+)?)?(?:\s+\*[A-Z]+\*)*')
+METADATA_PATTERN = re.compile(r'([A-Za-z][A-Za-z ]*?)\s*:\s*(.*)')
+ARENA_NAME_PATTERN = re.compile(r'name\s+(.+)', re.IGNORECASE)
+
+
+def version_sort_key(version):
+    # "v10" sorts after "v9"
+    return int(version[1:]) if version[1:].isdigit() else 0
+
+
+class DeckParseError(ValueError):
+    """
+    A deck list line that could not be parsed.
+
+    Attributes:
+        source (str): The file (or other source) the line came from.
+        line_number (int): The 1-based line number within the source.
+        line (str): The offending line.
+    """
+
+    def __init__(self, message, source, line_number, line):
+        super().__init__(f"{source}:{line_number}: {message}: {line.strip()!r}")
+        self.source = source
+        self.line_number = line_number
+        self.line = line
+
+
+def classify_line(line, source='<deck>', line_number=1):
+    """
+    Works out what a deck list line is.
+
+    Returns:
+        tuple: (kind, value). value is the section for SECTION, the version name ("v2")
+        for VERSION, the name for HEADER, a (key, value) pair for METADATA and a
+        (count, name) pair for CARD.
+
+    Raises:
+        DeckParseError: If the line is none of the known kinds.
+    """
+    text = line.strip()
+    if not text:
+        return BLANK, None
+    if text.startswith('//'):
+        return COMMENT, None
+
+    version = VERSION_PATTERN.match(text)
+    if version:
+        return VERSION, f"v{int(version.group(1))}"
+    section = SECTION_NAMES.get(text.lstrip('#').strip().rstrip(':').strip().lower())
+    if section:
+        return SECTION, section
+    if text.lower() == 'about':
+        return HEADER, None
+    if text.startswith('#'):
+        return HEADER, text.lstrip('#').strip()
+
+    if text[0].isdigit():
+        card = CARD_PATTERN.fullmatch(text)
+        if card:
+            count = int(card.group(1))
+            if count == 0:
+                raise DeckParseError("Card count must be at least 1", source, line_number, line)
+            return CARD, (count, card.group(2))
+        raise DeckParseError("Expected '<count> <card name>'", source, line_number, line)
+
+    metadata = METADATA_PATTERN.fullmatch(text)
+    if metadata:
+        return METADATA, (metadata.group(1).strip().title(), metadata.group(2).strip())
+    arena_name = ARENA_NAME_PATTERN.fullmatch(text)
+    if arena_name:
+        return METADATA, ('Name', arena_name.group(1).strip())
+    raise DeckParseError("Not a card, section or header line", source, line_number, line)
+
+
+class DeckText:
+    """
+    One deck read from a deck list, as the lines it came from plus what they say.
+
+    Attributes:
+        raw_deck (list): The deck's own lines, as MTGDeck takes them.
+        source (str): The file the deck was read from.
+        line_number (int): The line of the source the deck starts on.
+        metadata (dict): Header values, e.g. {"Name": "Mono Red, Mono Red v2", "Author": "..."}.
+        versions (dict): Version ("v1", ...) -> {MAINBOARD: {name: count}, SIDEBOARD: {name: count}}.
+    """
+
+    __slots__ = ('raw_deck', 'source', 'line_number', 'metadata', 'versions',
+                 '_version', '_section', '_explicit_sections', '_after_blank')
+
+    def __init__(self, source='<deck>', line_number=1):
+        self.raw_deck = []
+        self.source = source
+        self.line_number = line_number
+        self.metadata = {}
+        self.versions = {}
+        self._version = 'v1'
+        self._section = MAINBOARD
+        # Set once the deck marks its own sections, which turns off MTGO-style
+        # "a blank line starts the sideboard"
+        self._explicit_sections = False
+        self._after_blank = False
+
+    @property
+    def has_cards(self):
+        return bool(self.versions)
+
+    def continues_with(self, kind):
+        """
+        Returns whether a line of this kind still belongs to this deck, rather than starting the next one.
+        """
+        if not self.has_cards:
+            return True
+        if kind in (HEADER, METADATA):
+            return False
+        if kind == CARD and self._after_blank:
+            # A blank line after the mainboard of an unsectioned deck starts its
+            # sideboard; after anything else it ends the deck
+            return not self._explicit_sections and self._section == MAINBOARD
+        return True
+
+    def add_line(self, line, kind, value):
+        """
+        Adds one classified line (see classify_line) to the deck.
+        """
+        self.raw_deck.append(line)
+        if kind == BLANK:
+            self._after_blank = self.has_cards
+            return
+        if kind == COMMENT:
+            return
+        if kind == CARD and self._after_blank and not self._explicit_sections and self._section == MAINBOARD:
+            self._section = SIDEBOARD
+        self._after_blank = False
+
+        if kind == HEADER:
+            if value:
+                self.metadata.setdefault('Name', value)
+        elif kind == METADATA:
+            key, text = value
+            self.metadata[key] = text
+        elif kind == VERSION:
+            self._explicit_sections = True
+            self._version = value
+            self._section = MAINBOARD
+        elif kind == SECTION:
+            self._explicit_sections = True
+            self._section = value
+        elif kind == CARD and self._section != IGNORED_SECTION:
+            count, name = value
+            sections = self.versions.setdefault(self._version, {MAINBOARD: {}, SIDEBOARD: {}})
+            section = sections[self._section]
+            section[name] = section.get(name, 0) + count
+
+    def finish(self):
+        # Trailing blank lines belong between decks, not to either of them
+        while self.raw_deck and not self.raw_deck[-1].strip():
+            self.raw_deck.pop()
+        return self
+
+
+def read_deck(lines, source='<deck>', line_number=1):
+    """
+    Reads lines that hold exactly one deck.
+
+    Args:
+        lines (iterable): The deck's lines.
+        source (str): Where the lines came from, for error messages.
+        line_number (int): The line number of the first line within source.
+
+    Returns:
+        DeckText: The deck.
+
+    Raises:
+        DeckParseError: For the first line that cannot be parsed.
+    """
+    deck = DeckText(source, line_number)
+    for line_number, line in enumerate(lines, line_number):
+        kind, value = classify_line(line, source, line_number)
+        deck.add_line(line, kind, value)
+    return deck.finish()
+
+
+def iter_decks(lines, source='<deck>', errors='raise'):
+    """
+    Splits a stream of lines into decks, yielding each as soon as it ends.
+
+    Args:
+        lines (iterable): Deck list lines, e.g. an open file.
+        source (str): Where the lines came from, for error messages.
+        errors (str): "raise" to stop at the first bad line, or "skip" to print the error
+                      and leave out the deck it is in.
+
+    Yields:
+        DeckText: Each deck, in order.
+    """
+    if errors not in ('raise', 'skip'):
+        raise ValueError("errors must be 'raise' or 'skip'")
+    deck = None
+    broken = False
+    for line_number, line in enumerate(lines, 1):
+        try:
+            kind, value = classify_line(line, source, line_number)
+        except DeckParseError as e:
+            if errors == 'raise':
+                raise
+            print(e)
+            broken = True
+            continue
+        if deck is None:
+            if kind == BLANK:
+                continue
+            deck = DeckText(source, line_number)
+        elif not deck.continues_with(kind):
+            if not broken:
+                yield deck.finish()
+            deck = DeckText(source, line_number)
+            broken = False
+        deck.add_line(line, kind, value)
+    if deck is not None and deck.has_cards and not broken:
+        yield deck.finish()
+
+
+def iter_deck_file(path, errors='raise'):
+    """
+    Streams the decks of a deck list file of any size (see iter_decks).
+    """
+    # utf-8-sig drops the byte order mark some exporters write
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        yield from iter_decks(f, path, errors)
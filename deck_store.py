@@ -0,0 +1,426 @@
+"""
+Bulk import of tournament decks into an indexed, deduplicated deck store.
+
+import_decks streams any number of deck list files through deck_parser, resolves card
+names in worker processes and writes every new deck to deck_store.sqlite3 in large
+transactions. Decks are deduplicated at three levels:
+
+- Identical text: a deck list whose deck_hash (its text up to formatting and card order)
+  was already imported is not parsed again.
+- Identical contents: decks with the same MTGDeck.canonical_hash (same cards and counts
+  per version, in any order or spelling) are stored once.
+- Near duplicates: a deck within NEAR_DUPLICATE_DISTANCE card copies of a stored deck is
+  stored, but marked as a variant of it. Candidates are found by MinHash locality
+  sensitive hashing over the decks' card copies, so each new deck is compared with a
+  handful of similar decks instead of every deck in the store.
+
+Every occurrence of a deck is kept in deck_sources with its file, line number, name,
+author and event, so a deduplicated deck still shows everyone who played it. Decks are
+stored in the deck_lists format (Name:/Author:/Event: and "# v"), and export_decks
+writes them out as .txt files, e.g. to seed pre_gauntlet_deck_lists:
+
+    python deck_store.py import event_dump.txt moxfield_exports/*.txt
+    python deck_store.py export pre_gauntlet_deck_lists --event "Pro Tour"
+"""
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from deck_cache import deck_hash
+from deck_parser import iter_deck_file
+from gauntlet_tools import PARSE_BATCH_SIZE, iter_parsed_decks
+from mtg_tools import get_card_name, prefetch_card_entries
+
+DECK_STORE_FILE = 'deck_store.sqlite3'
+SCHEMA_VERSION = 1
+
+# Two decks this many card copies apart or closer (counting mainboards and sideboards,
+# so one 1-for-1 swap is 2) are near duplicates
+NEAR_DUPLICATE_DISTANCE = 4
+
+# MinHash signature: MINHASH_BANDS bands of MINHASH_ROWS values each. Two 75-card decks
+# two swaps apart share a band with probability ~1; unrelated decks almost never do.
+MINHASH_BANDS = 8
+MINHASH_ROWS = 4
+MINHASH_SIZE = MINHASH_BANDS * MINHASH_ROWS
+
+
+def deck_elements(cards):
+    """
+    Returns the card copies of a deck as a set of "section:name:copy" strings, so that
+    the Jaccard similarity of two sets reflects how many copies the decks share.
+
+    Args:
+        cards (dict): (section, card name) -> count, where section is "main" or "side".
+    """
+    return {f"{section}:{name}:{copy}" for (section, name), count in cards.items() for copy in range(count)}
+
+
+def minhash_bands(cards):
+    """
+    Returns the MINHASH_BANDS locality sensitive hash buckets of a deck.
+
+    Uses one-permutation MinHash: each card copy is hashed once, the low bits of the
+    hash pick one of MINHASH_SIZE bins and each bin keeps its smallest value. That
+    estimates Jaccard similarity like MINHASH_SIZE independent hash functions would,
+    at the cost of one hash per card copy instead of MINHASH_SIZE.
+    """
+    elements = deck_elements(cards)
+    if not elements:
+        return []
+    signature = [-1] * MINHASH_SIZE  # -1 marks a bin no card copy fell into
+    for element in elements:
+        value = int.from_bytes(hashlib.blake2b(element.encode('utf-8'), digest_size=8).digest(), 'big')
+        index = value % MINHASH_SIZE
+        value //= MINHASH_SIZE
+        if signature[index] < 0 or value < signature[index]:
+            signature[index] = value
+    bands = []
+    for band in range(MINHASH_BANDS):
+        rows = signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS]
+        digest = hashlib.blake2b(repr(rows).encode('utf-8'), digest_size=8).digest()
+        bands.append((band, int.from_bytes(digest, 'big', signed=True)))
+    return bands
+
+
+def card_distance(cards1, cards2):
+    """
+    Returns the number of card copies by which two decks differ.
+    """
+    return sum(abs(cards1.get(key, 0) - cards2.get(key, 0)) for key in cards1.keys() | cards2.keys())
+
+
+def deck_cards(deck):
+    """
+    Returns the (section, card name) -> count of a deck's cards, taking the most copies
+    any version uses, which is what near-duplicate detection compares.
+    """
+    cards = {}
+    for version in deck.mainboard:
+        for section, counts in (('main', deck.mainboard[version]), ('side', deck.sideboard.get(version, {}))):
+            if not counts:
+                continue
+            for card_id, count in zip(counts.ids, counts.counts):
+                key = (section, get_card_name(card_id))
+                cards[key] = max(cards.get(key, 0), count)
+    return cards
+
+
+class DeckStore:
+    """
+    Imported decks with their cards, sources and near-duplicate buckets, in one SQLite file.
+    """
+
+    def __init__(self, store_file=DECK_STORE_FILE):
+        self.store_file = store_file
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(store_file, check_same_thread=False)
+        with self.connection:
+            self.connection.executescript(f"""
+                CREATE TABLE IF NOT EXISTS decks (
+                    id INTEGER PRIMARY KEY,
+                    canonical_hash TEXT NOT NULL UNIQUE,
+                    name TEXT,
+                    author TEXT,
+                    event TEXT,
+                    deck_list TEXT NOT NULL,
+                    near_duplicate_of INTEGER REFERENCES decks (id),
+                    imported_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS decks_by_name ON decks (name);
+                CREATE INDEX IF NOT EXISTS decks_by_event ON decks (event);
+                CREATE TABLE IF NOT EXISTS deck_cards (
+                    deck_id INTEGER NOT NULL,
+                    section TEXT NOT NULL,
+                    card_name TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (deck_id, section, card_name)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS deck_cards_by_card ON deck_cards (card_name);
+                CREATE TABLE IF NOT EXISTS deck_sources (
+                    deck_id INTEGER NOT NULL,
+                    raw_hash TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    line_number INTEGER NOT NULL,
+                    name TEXT,
+                    author TEXT,
+                    event TEXT
+                );
+                CREATE INDEX IF NOT EXISTS deck_sources_by_deck ON deck_sources (deck_id);
+                CREATE INDEX IF NOT EXISTS deck_sources_by_raw_hash ON deck_sources (raw_hash);
+                CREATE TABLE IF NOT EXISTS minhash_bands (
+                    band INTEGER NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    deck_id INTEGER NOT NULL,
+                    PRIMARY KEY (band, bucket, deck_id)
+                ) WITHOUT ROWID;
+                PRAGMA user_version = {SCHEMA_VERSION};
+            """)
+
+    def deck_id_for_raw_hash(self, raw_hash):
+        row = self.connection.execute(
+            "SELECT deck_id FROM deck_sources WHERE raw_hash = ? LIMIT 1", (raw_hash,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def deck_id_for_canonical_hash(self, canonical_hash):
+        row = self.connection.execute("SELECT id FROM decks WHERE canonical_hash = ?", (canonical_hash,)).fetchone()
+        return row[0] if row else None
+
+    def cards(self, deck_id):
+        """
+        Returns the (section, card name) -> count of a stored deck.
+        """
+        return {
+            (section, card_name): count
+            for section, card_name, count in self.connection.execute(
+                "SELECT section, card_name, count FROM deck_cards WHERE deck_id = ?", (deck_id,)
+            )
+        }
+
+    def find_near_duplicate(self, cards, bands, max_distance=NEAR_DUPLICATE_DISTANCE):
+        """
+        Returns the ID of the closest stored deck within max_distance card copies of a
+        deck, or None. Only decks sharing one of its MinHash bands are compared.
+        """
+        if not bands:
+            return None
+        conditions = ' OR '.join(['(band = ? AND bucket = ?)'] * len(bands))
+        candidates = {row[0] for row in self.connection.execute(
+            f"SELECT deck_id FROM minhash_bands WHERE {conditions}",
+            [value for band in bands for value in band],
+        )}
+        best = None
+        for candidate in sorted(candidates):
+            distance = card_distance(cards, self.cards(candidate))
+            if distance <= max_distance and (best is None or distance < best[0]):
+                best = (distance, candidate)
+        return best[1] if best else None
+
+    def add_source(self, deck_id, raw_hash, deck_text):
+        metadata = deck_text.metadata
+        self.connection.execute(
+            "INSERT INTO deck_sources (deck_id, raw_hash, source, line_number, name, author, event) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (deck_id, raw_hash, deck_text.source, deck_text.line_number,
+             metadata.get('Name'), metadata.get('Author'), metadata.get('Event')),
+        )
+
+    def add_deck(self, deck, canonical_hash, cards, bands, near_duplicate_of=None):
+        """
+        Stores a new deck with its cards and MinHash bands.
+
+        Returns:
+            int: The new deck's ID.
+        """
+        versions = deck.sorted_versions()
+        first = versions[0] if versions else 'v1'
+        deck_id = self.connection.execute(
+            "INSERT INTO decks (canonical_hash, name, author, event, deck_list, near_duplicate_of, imported_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (canonical_hash, deck.deck_name.get(first), deck.deck_author.get(first), deck.deck_event.get(first),
+             ''.join(deck.to_deck_list()), near_duplicate_of, time.time()),
+        ).lastrowid
+        self.connection.executemany(
+            "INSERT INTO deck_cards (deck_id, section, card_name, count) VALUES (?, ?, ?, ?)",
+            [(deck_id, section, card_name, count) for (section, card_name), count in cards.items()],
+        )
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO minhash_bands (band, bucket, deck_id) VALUES (?, ?, ?)",
+            [(band, bucket, deck_id) for band, bucket in bands],
+        )
+        return deck_id
+
+    def decks_with_card(self, card_name):
+        """
+        Returns the IDs of the stored decks that play a card, in the mainboard or sideboard.
+        """
+        return [row[0] for row in self.connection.execute(
+            "SELECT DISTINCT deck_id FROM deck_cards WHERE card_name = ? ORDER BY deck_id", (card_name,)
+        )]
+
+    def unique_decks(self, name=None, event=None):
+        """
+        Returns (deck ID, name, deck list text) for the stored decks that are not near
+        duplicates of another, optionally only those whose name or event contains a string.
+        """
+        conditions = ["near_duplicate_of IS NULL"]
+        parameters = []
+        if name:
+            conditions.append("name LIKE ?")
+            parameters.append(f"%{name}%")
+        if event:
+            conditions.append("(event LIKE ? OR id IN (SELECT deck_id FROM deck_sources WHERE event LIKE ?))")
+            parameters.extend([f"%{event}%", f"%{event}%"])
+        return self.connection.execute(
+            f"SELECT id, name, deck_list FROM decks WHERE {' AND '.join(conditions)} ORDER BY id", parameters
+        ).fetchall()
+
+    def stats(self):
+        """
+        Returns a dictionary of how many decks, near duplicates and sources are stored.
+        """
+        execute = self.connection.execute
+        return {
+            'decks': execute("SELECT COUNT(*) FROM decks").fetchone()[0],
+            'near_duplicates': execute("SELECT COUNT(*) FROM decks WHERE near_duplicate_of IS NOT NULL").fetchone()[0],
+            'sources': execute("SELECT COUNT(*) FROM deck_sources").fetchone()[0],
+        }
+
+
+def _prefetched(deck_texts, pending, batch_size):
+    """
+    Yields the raw deck lists of deck_texts, looking up each batch's card names in one
+    pass before the workers resolve them, and queueing each DeckText in pending so the
+    parsed decks can be matched back to where they came from.
+    """
+    batch = []
+    for deck_text in deck_texts:
+        batch.append(deck_text)
+        if len(batch) == batch_size:
+            yield from _prefetch_batch(batch, pending)
+            batch = []
+    yield from _prefetch_batch(batch, pending)
+
+
+def _prefetch_batch(batch, pending):
+    prefetch_card_entries(
+        name for deck_text in batch for sections in deck_text.versions.values()
+        for section in sections.values() for name in section
+    )
+    for deck_text in batch:
+        pending.append(deck_text)
+        yield deck_text.raw_deck
+
+
+def import_decks(paths, deck_store=None, workers=None, errors='skip', max_distance=NEAR_DUPLICATE_DISTANCE,
+                 batch_size=PARSE_BATCH_SIZE):
+    """
+    Imports every deck in some deck list files into the deck store.
+
+    Args:
+        paths (iterable): Deck list files, each holding any number of decks (see deck_parser).
+        deck_store (DeckStore, optional): Where to import to. Defaults to deck_store.sqlite3.
+        workers (int, optional): Number of processes to resolve card names with (see iter_parsed_decks).
+        errors (str): "skip" to report decks with unparseable lines or cards that cannot be
+                      resolved and go on, or "raise".
+        max_distance (int): Card copies within which decks count as near duplicates; 0 turns it off.
+        batch_size (int): Decks parsed and committed per transaction.
+
+    Returns:
+        dict: How many decks were "read", "added", "duplicates" (same text or contents as a
+        stored deck), "near_duplicates" (added, but marked as a variant) and "skipped"
+        (with a card that could not be resolved).
+    """
+    deck_store = deck_store or DeckStore()
+    counts = {'read': 0, 'added': 0, 'duplicates': 0, 'near_duplicates': 0, 'skipped': 0}
+    connection = deck_store.connection
+
+    def new_deck_texts():
+        # Deck lists whose exact text was imported before are only recorded as another source
+        for path in paths:
+            for deck_text in iter_deck_file(path, errors):
+                counts['read'] += 1
+                raw_hash = deck_hash(deck_text.raw_deck, deck_text.source, deck_text.line_number)
+                deck_id = deck_store.deck_id_for_raw_hash(raw_hash)
+                if deck_id is None:
+                    yield deck_text
+                else:
+                    deck_store.add_source(deck_id, raw_hash, deck_text)
+                    counts['duplicates'] += 1
+
+    pending = deque()
+    raw_decks = _prefetched(new_deck_texts(), pending, batch_size)
+    with deck_store._lock:
+        try:
+            for index, deck in enumerate(iter_parsed_decks(raw_decks, workers, batch_size, errors), 1):
+                deck_text = pending.popleft()
+                if deck is None:
+                    # A card could not be resolved; iter_parsed_decks has reported it
+                    counts['skipped'] += 1
+                    continue
+                raw_hash = deck_hash(deck_text.raw_deck, deck_text.source, deck_text.line_number)
+                canonical_hash = deck.canonical_hash()
+                deck_id = deck_store.deck_id_for_canonical_hash(canonical_hash)
+                if deck_id is not None:
+                    counts['duplicates'] += 1
+                else:
+                    cards = deck_cards(deck)
+                    bands = minhash_bands(cards)
+                    near_duplicate_of = deck_store.find_near_duplicate(cards, bands, max_distance) if max_distance else None
+                    if near_duplicate_of is not None:
+                        # Point at the original deck, not at another variant of it
+                        near_duplicate_of = connection.execute(
+                            "SELECT COALESCE(near_duplicate_of, id) FROM decks WHERE id = ?", (near_duplicate_of,)
+                        ).fetchone()[0]
+                        counts['near_duplicates'] += 1
+                    deck_id = deck_store.add_deck(deck, canonical_hash, cards, bands, near_duplicate_of)
+                    counts['added'] += 1
+                deck_store.add_source(deck_id, raw_hash, deck_text)
+                if index % batch_size == 0:
+                    connection.commit()
+        except BaseException:
+            # Only whole batches are kept, so a failed import can simply be run again
+            connection.rollback()
+            raise
+        connection.commit()
+    return counts
+
+
+def deck_file_name(name, deck_id):
+    """
+    Returns a file name for an exported deck, e.g. "Dimir_Midrange_12.txt".
+    """
+    stem = re.sub(r'[^A-Za-z0-9]+', '_', name or 'deck').strip('_') or 'deck'
+    return f"{stem}_{deck_id}.txt"
+
+
+def export_decks(directory, deck_store=None, name=None, event=None):
+    """
+    Writes the stored decks that are not near duplicates to directory as deck_lists-format .txt files.
+
+    Returns:
+        list: The paths written.
+    """
+    deck_store = deck_store or DeckStore()
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for deck_id, deck_name, deck_list in deck_store.unique_decks(name, event):
+        path = os.path.join(directory, deck_file_name(deck_name, deck_id))
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(deck_list)
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import tournament decks into the deck store, or export them.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    import_parser = subparsers.add_parser('import', help="import deck list files")
+    import_parser.add_argument('paths', nargs='+')
+    import_parser.add_argument('--workers', type=int)
+    import_parser.add_argument('--max-distance', type=int, default=NEAR_DUPLICATE_DISTANCE,
+                               help="card copies within which decks are near duplicates (0 to turn off)")
+    import_parser.add_argument('--strict', action='store_true', help="stop at the first unparseable line or unknown card")
+    export_parser = subparsers.add_parser('export', help="write the unique decks as .txt files")
+    export_parser.add_argument('directory')
+    export_parser.add_argument('--name', help="only decks whose name contains this")
+    export_parser.add_argument('--event', help="only decks played at an event containing this")
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        start = time.perf_counter()
+        counts = import_decks(args.paths, workers=args.workers, errors='raise' if args.strict else 'skip',
+                              max_distance=args.max_distance)
+        elapsed = time.perf_counter() - start
+        print(f"Read {counts['read']} decks in {elapsed:.1f} s ({counts['read'] / elapsed:.0f} decks/s): "
+              f"{counts['added']} added ({counts['near_duplicates']} near duplicates), "
+              f"{counts['duplicates']} duplicates, {counts['skipped']} skipped")
+    else:
+        paths = export_decks(args.directory, name=args.name, event=args.event)
+        print(f"Wrote {len(paths)} decks to {args.directory}")
@@ -0,0 +1,170 @@
+"""
+Offline fuzzy card name matching.
+
+FuzzyNameIndex resolves misspelled or loosely written card names the way Scryfall's
+fuzzy search does, without any network requests. Names are tried in this order:
+
+1. Ignoring case, accents, punctuation and spacing ("lich knights conquest", "Fire/Ice").
+2. As the start of exactly one card name: its first whole words ("Fable of the Mirror")
+   from MIN_PREFIX_LENGTH letters, or any cut ("Overlord of the Boiler") from
+   MIN_PARTIAL_PREFIX_LENGTH letters. A shorter query such as "Fable" is more likely a
+   card printed after the dump than a name cut short, so it is left to Scryfall.
+3. By edit distance over candidates sharing letter trigrams with the query ("Glisa Sunslayer").
+
+When more than one card fits equally well, no name is picked and the tied candidates are
+returned instead, so callers can report the ambiguity rather than guess.
+"""
+import bisect
+import re
+import unicodedata
+from collections import Counter, namedtuple
+
+# name is None when nothing matched or the match was ambiguous; candidates then lists the
+# tied card names (empty when nothing came close at all).
+FuzzyResult = namedtuple('FuzzyResult', ['name', 'candidates'])
+
+# Number of trigram-ranked candidates that get a full edit distance check
+CANDIDATE_LIMIT = 25
+
+# Letters (after compact_name) a query needs to match the first words of a longer name,
+# and to match one cut off mid-word
+MIN_PREFIX_LENGTH = 8
+MIN_PARTIAL_PREFIX_LENGTH = 16
+
+
+def compact_name(name):
+    """
+    Reduces a card name to lowercase letters and digits only, with accents removed.
+    """
+    decomposed = unicodedata.normalize('NFKD', name.casefold())
+    return ''.join(c for c in decomposed if c.isalnum() and not unicodedata.combining(c))
+
+
+def name_trigrams(compacted):
+    padded = f"  {compacted} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def word_ends(name):
+    """
+    Returns the positions in compact_name(name) where a word of name ends.
+    """
+    ends = set()
+    length = 0
+    for word in re.split(r'[\s/-]+', name):
+        length += len(compact_name(word))
+        ends.add(length)
+    return ends
+
+
+def edit_distance(a, b, limit):
+    """
+    Returns the Levenshtein distance between two strings, or limit + 1 once it is
+    certain to exceed limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def max_typos(compacted):
+    """
+    Number of typos tolerated for a name of this length: 1 for short names, up to 1 per 5 letters.
+    """
+    return max(1, len(compacted) // 5)
+
+
+class FuzzyNameIndex:
+    """
+    A trigram index over card names for offline fuzzy resolution.
+
+    Args:
+        names (iterable): (lookup_name, card_name) pairs. lookup_name is any name the card
+                          can be found by (full name, face name, alias); card_name is the
+                          card's full Oracle name returned on a match.
+    """
+
+    def __init__(self, names):
+        self.card_names = {}
+        # Compacted name -> the written names it came from, for word boundaries
+        self.lookup_names = {}
+        for lookup_name, card_name in names:
+            key = compact_name(lookup_name)
+            self.card_names.setdefault(key, set()).add(card_name)
+            self.lookup_names.setdefault(key, set()).add(lookup_name)
+        self.sorted_keys = sorted(self.card_names)
+
+        self.trigram_index = {}
+        for key in self.sorted_keys:
+            for trigram in name_trigrams(key):
+                self.trigram_index.setdefault(trigram, []).append(key)
+
+    def _single(self, card_names):
+        if len(card_names) == 1:
+            return FuzzyResult(next(iter(card_names)), [])
+        return FuzzyResult(None, sorted(card_names))
+
+    def resolve(self, query):
+        """
+        Resolves a loosely written card name to a single Oracle card name.
+
+        Args:
+            query (str): The card name as written in a deck list.
+
+        Returns:
+            FuzzyResult: The matched card name, or None plus the tied candidates.
+        """
+        key = compact_name(query)
+        if not key:
+            return FuzzyResult(None, [])
+
+        if key in self.card_names:
+            return self._single(self.card_names[key])
+
+        # Unique prefix, e.g. a name cut short
+        if len(key) >= MIN_PREFIX_LENGTH:
+            partial = len(key) >= MIN_PARTIAL_PREFIX_LENGTH
+            start = bisect.bisect_left(self.sorted_keys, key)
+            prefixed = set()
+            for candidate in self.sorted_keys[start:]:
+                if not candidate.startswith(key):
+                    break
+                if partial or any(len(key) in word_ends(name) for name in self.lookup_names[candidate]):
+                    prefixed.update(self.card_names[candidate])
+                if len(prefixed) > CANDIDATE_LIMIT:
+                    break
+            if prefixed:
+                return self._single(prefixed)
+
+        # Typos: each typo breaks at most three trigrams, so any name within the typo limit
+        # shares at least one of the query's (3 * limit + 1) rarest trigrams. Rank the names
+        # found through those by shared trigrams, then check the best few by edit distance.
+        limit = max_typos(key)
+        trigrams = sorted(name_trigrams(key), key=lambda t: len(self.trigram_index.get(t, ())))
+        shared = Counter()
+        for trigram in trigrams[:3 * limit + 1]:
+            shared.update(self.trigram_index.get(trigram, ()))
+        best_distance = limit + 1
+        best_names = set()
+        for candidate, _ in shared.most_common(CANDIDATE_LIMIT):
+            distance = edit_distance(key, candidate, limit)
+            if distance < best_distance:
+                best_distance, best_names = distance, set(self.card_names[candidate])
+            elif distance == best_distance and distance <= limit:
+                best_names.update(self.card_names[candidate])
+
+        if not best_names:
+            return FuzzyResult(None, [])
+        return self._single(best_names)
@@ -1,4 +1,5 @@
 from visualization_tools import *
+from card_search import search_cards
 
 def load_json(file_path):
     with open(file_path, 'r') as file:
@@ -12,17 +13,14 @@ gauntlet_cards = {}
 for card in gauntlet['cards']:
     gauntlet_cards[card['name']] = card['quantity']
 
+# Colorless enchantments in the gauntlet, found with the card store's search index. The
+# type line search also finds artifact enchantments, enchantment creatures and cards with
+# an enchantment back face, so only keep cards whose main front face type is Enchantment.
+gauntlet_card_ids = [get_card_id(card) for card in gauntlet_cards]
 cards = {}
-for card in gauntlet_cards.keys():
-    color = get_card_colors(card)
-    card_type = get_main_card_type(get_card_type(card))
-    # print(f"{card} ({color}) - {get_main_card_type(card_type)} - {gauntlet_cards[card]}")
-    if card_type == "Enchantment":
-        card_entry = get_card_entry(card)
-        colorID = card_entry['color_identity']
-        if len(colorID) == 0:
-            cards[card] = gauntlet_cards[card]
-
+for card in search_cards(type_line="Enchantment", color_identity="", identity_mode="exact", card_ids=gauntlet_card_ids):
+    if get_main_card_type(get_card_type(card)) == "Enchantment":
+        cards[card] = gauntlet_cards[card]
 
 
 collect_and_sort_cards(cards, {})
@@ -1,20 +1,33 @@
 import glob
-import hashlib
+import itertools
 import json
 import math
 import os
-import requests
+from concurrent.futures import ProcessPoolExecutor
 
-from deck_list_manager import get_card_entry
-from mtg_deck import MTGDeck
-from mtg_tools import get_card_type
-from visualization_tools import visual_spoiler_v2
+from card_counts import COUNT_TYPECODE, ID_TYPECODE, CardCounts
+from card_store import get_card_store, reopen_card_store
+from deck_cache import get_deck_cache, load_cached_deck, save_cached_deck
+from legality import FORMATS, combined_mask, format_bit
+from mtg_deck import MTGDeck, raw_card_names
+from mtg_tools import get_card_entry, get_card_name, get_card_type, prefetch_card_entries
+from price_store import get_price_table
+from scryfall_client import fetch_many
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 deck_list_path = os.path.join(current_dir, "deck_lists")
 pre_gauntlet_deck_list_path = os.path.join(current_dir, "pre_gauntlet_deck_lists")
 image_path = os.path.join(current_dir, "deck_images")
 
+# Below this many uncached decks, starting worker processes costs more than it saves
+PARALLEL_MIN_DECKS = 8
+
+# Decks handed to the worker processes at a time by iter_parsed_decks
+PARSE_BATCH_SIZE = 256
+
+# A gauntlet holds enough copies of each card for this many decks to be played at once
+GAUNTLET_TOP_DECKS = 2
+
 
 def save_deck_to_json(deck, filename):
     with open(filename, "w", encoding="utf-8") as file:
@@ -31,44 +44,82 @@ def ensure_cache_directory(directory):
         os.makedirs(directory)
 
 
-def build_gauntlet(list_of_decks, filename="gauntlet.json"):
-    total_cards = 0
-    gauntlet_list = {"cards": []}
-    cards_used = {}
-    for deck in list_of_decks:
-        cards_needed = deck.get_cards_needed()
-        for card_name, quantity in cards_needed.items():
-            if card_name in cards_used:
-                cards_used[card_name].append(quantity)
-            else:
-                cards_used[card_name] = [quantity]
-
-    for card in cards_used:
-        cards_used[card] = sorted(cards_used[card], reverse=True)
-
-    for name, quantities in cards_used.items():
-        if len(quantities) == 1:
-            total_needed = quantities[0]
-        else:
-            total_needed = quantities[0] + quantities[1]
-        card = {"name": name, "quantity": total_needed}
-        total_cards += total_needed
-        gauntlet_list["cards"].append(card)
-
+def gauntlet_matrix_entries(list_of_decks):
+    """
+    Flattens the cards needed by every deck into the nonzero entries of a sparse decks x cards matrix.
+
+    Returns:
+        tuple: NumPy arrays (card_ids, counts), one entry per card of each deck, in deck order.
+    """
+    import numpy as np
+
+    all_cards_needed = [deck.get_cards_needed() for deck in list_of_decks]
+    # One buffer per array type, rather than a NumPy array per deck
+    card_ids = np.frombuffer(b''.join(cards.ids.tobytes() for cards in all_cards_needed),
+                             dtype=np.dtype(ID_TYPECODE))
+    counts = np.frombuffer(b''.join(cards.counts.tobytes() for cards in all_cards_needed),
+                           dtype=np.dtype(COUNT_TYPECODE))
+    return card_ids, counts
+
+
+def compute_gauntlet(list_of_decks, top_decks=GAUNTLET_TOP_DECKS):
+    """
+    Works out how many copies of each card the gauntlet needs: the sum of the top_decks
+    largest counts any deck needs, so that any top_decks decks can be played at once.
+
+    The decks x cards count matrix is kept sparse, since a deck uses a few dozen of the
+    tens of thousands of cards. One argsort of (card ID, descending count) keys puts each
+    card's entries together with its largest counts first, so the top counts of every
+    card are summed without a Python loop.
+
+    Args:
+        list_of_decks (list): The decks (anything with get_cards_needed returning a CardCounts).
+        top_decks (int): How many decks' worth of each card to count.
+
+    Returns:
+        tuple: NumPy arrays (card_ids, quantities), in the order the cards first appear in the decks.
+    """
+    import numpy as np
+
+    card_ids, counts = gauntlet_matrix_entries(list_of_decks)
+    if not len(card_ids):
+        return card_ids.astype(np.int64), np.zeros(0, dtype=np.int64)
+
+    count_range = int(counts.max()) + 1
+    keys = card_ids.astype(np.int64) * count_range + (count_range - 1 - counts)
+    order = np.argsort(keys)
+    card_ids, counts = card_ids[order], counts[order].astype(np.int64)
+
+    # Each card's entries form one run; rank 0 in a run is its largest count
+    run_starts = np.flatnonzero(np.diff(card_ids, prepend=card_ids[0] - 1))
+    run_sizes = np.diff(run_starts, append=len(card_ids))
+    ranks = np.arange(len(card_ids)) - np.repeat(run_starts, run_sizes)
+    quantities = np.add.reduceat(np.where(ranks < top_decks, counts, 0), run_starts)
+
+    # List the cards in the order they first appear, like the deck lists do
+    first_seen = np.argsort(np.minimum.reduceat(order, run_starts), kind='stable')
+    return card_ids[run_starts][first_seen], quantities[first_seen]
+
+
+def write_gauntlet_json(card_ids, quantities, filename="gauntlet.json"):
+    """
+    Writes the result of compute_gauntlet as a {"cards": [{"name": ..., "quantity": ...}]} file.
+    """
+    gauntlet_list = {"cards": [
+        {"name": get_card_name(card_id), "quantity": quantity}
+        for card_id, quantity in zip(card_ids.tolist(), quantities.tolist())
+    ]}
     save_deck_to_json(gauntlet_list, filename)
 
 
-def create_or_load_deck(raw_deck):
-    # Ensure the deck_cache directory exists
-    cache_directory = "deck_cache"
-    ensure_cache_directory(cache_directory)
+def build_gauntlet(list_of_decks, filename="gauntlet.json"):
+    card_ids, quantities = compute_gauntlet(list_of_decks)
+    write_gauntlet_json(card_ids, quantities, filename)
 
-    # Calculate the hash for the raw_deck before creating the object
-    deck_hash = hashlib.md5(str(raw_deck).encode()).hexdigest()
-    cache_file = os.path.join(cache_directory, f"deck_cache_{deck_hash}.pkl")
 
-    # Check if the deck is already cached
-    cached_deck = MTGDeck.load_from_cache(cache_file)
+def create_or_load_deck(raw_deck):
+    # Check if the deck is already cached for this card store snapshot
+    cached_deck = load_cached_deck(raw_deck)
     if cached_deck:
         print("Loaded deck from cache.")
         return cached_deck
@@ -76,7 +127,7 @@ def create_or_load_deck(raw_deck):
     # If not cached, create a new deck and cache it
     print("Creating new deck and saving to cache.")
     new_deck = MTGDeck(raw_deck)
-    new_deck.save_to_cache(cache_file)
+    save_cached_deck(new_deck)
     return new_deck
 
 
@@ -124,35 +175,296 @@ def differences_to_dict(differences):
     return diff_dict
 
 
-def build_deck_lists(which_decks="gauntlet"):
+def _init_parse_worker():
+    # The parent's SQLite connections must not be used after the fork
+    reopen_card_store()
+
+
+def _parse_in_worker(raw_deck):
+    """
+    Parses a deck list in a worker process. Returns the deck, or None if the parent has to
+    parse it instead: the worker's card store is read-only, so a card that needs Scryfall
+    fails here. Also returns the misspellings resolved on the way, for the parent to save.
+    """
+    try:
+        deck = MTGDeck(raw_deck)
+    except ValueError:
+        deck = None
+    store = get_card_store()
+    aliases, store.unsaved_aliases = store.unsaved_aliases, []
+    return deck, aliases
+
+
+def _finish_worker_parses(raw_decks, results, errors='raise'):
+    """
+    Saves the aliases of each _parse_in_worker result and yields its deck, parsing the
+    decks the worker could not here.
+    """
+    store = get_card_store()
+    for raw_deck, (deck, aliases) in zip(raw_decks, results):
+        if aliases:
+            store.add_aliases(aliases)
+        yield deck if deck is not None else _parse_in_parent(raw_deck, errors)
+
+
+def _parse_in_parent(raw_deck, errors='raise'):
+    """
+    Parses a deck list in this process, where unknown cards can be fetched and added to the
+    card store. With errors="skip", a deck that cannot be parsed is reported and None returned.
+    """
+    try:
+        return MTGDeck(raw_deck)
+    except ValueError as e:
+        if errors == 'raise':
+            raise
+        print(f"Skipped deck {raw_deck[0].strip() if raw_deck else ''}: {e}")
+        return None
+
+
+def parse_decks(raw_decks, workers=None):
+    """
+    Parses deck lists into MTGDeck objects, in parallel worker processes when there are enough of them.
+
+    Each worker reads the card store through its own read-only connection. A deck with a
+    card the store does not know yet is parsed again here, where the card can be fetched
+    and added.
+
+    Args:
+        raw_decks (list): The deck lists, each a list of lines.
+        workers (int, optional): Number of worker processes. 1 parses in this process;
+                                 None uses one per core once there are PARALLEL_MIN_DECKS decks.
+
+    Returns:
+        list: The parsed decks, in the same order as raw_decks.
+    """
+    if workers is None:
+        workers = os.cpu_count() if len(raw_decks) >= PARALLEL_MIN_DECKS else 1
+    workers = min(workers, len(raw_decks))
+    if workers <= 1:
+        return [MTGDeck(raw_deck) for raw_deck in raw_decks]
+
+    # Open (and if needed compile) the card store before the workers start, so they
+    # all read the same store instead of racing to build it
+    get_card_store()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_parse_worker) as executor:
+        chunksize = max(1, len(raw_decks) // (workers * 4))
+        results = list(executor.map(_parse_in_worker, raw_decks, chunksize=chunksize))
+    return list(_finish_worker_parses(raw_decks, results))
+
+
+def iter_parsed_decks(raw_decks, workers=None, batch_size=PARSE_BATCH_SIZE, errors='raise'):
+    """
+    Parses a stream of deck lists (e.g. from deck_parser.iter_deck_file) into MTGDeck objects.
+
+    Unlike parse_decks, the input is consumed batch_size decks at a time, so a dump of
+    any size is never held in memory all at once.
+
+    Args:
+        raw_decks (iterable): The deck lists, each a list of lines.
+        workers (int, optional): Number of worker processes. 1 parses in this process;
+                                 None uses one per core once there are PARALLEL_MIN_DECKS decks.
+        batch_size (int): Decks read ahead and sent to the workers at a time.
+        errors (str): "raise" to stop at the first deck with a card that cannot be resolved,
+                      or "skip" to print the error and yield None for that deck.
+
+    Yields:
+        MTGDeck: The parsed decks (or None for skipped ones), in input order.
+    """
+    raw_decks = iter(raw_decks)
+    batch = list(itertools.islice(raw_decks, batch_size))
+    if workers is None:
+        # A short first batch is the whole input
+        workers = os.cpu_count() if len(batch) >= PARALLEL_MIN_DECKS else 1
+    workers = min(workers, len(batch))
+    if workers <= 1:
+        for raw_deck in itertools.chain(batch, raw_decks):
+            yield _parse_in_parent(raw_deck, errors)
+        return
+
+    get_card_store()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_parse_worker) as executor:
+        while batch:
+            results = executor.map(_parse_in_worker, batch, chunksize=max(1, len(batch) // (workers * 4)))
+            yield from _finish_worker_parses(batch, results, errors)
+            batch = list(itertools.islice(raw_decks, batch_size))
+
+
+def deck_list_files(which_decks="gauntlet"):
+    """
+    Returns the paths of the gauntlet's deck lists (or the pre-gauntlet lists), sorted by file name.
+    """
+    directory = deck_list_path if which_decks == "gauntlet" else pre_gauntlet_deck_list_path
+    return sorted(glob.glob(os.path.join(directory, "*.txt")))
+
+
+def read_raw_deck(txt_file):
+    with open(txt_file, "r", encoding="utf-8") as file:
+        return file.readlines()
+
+
+def parse_missing_decks(decks, raw_decks, workers=None):
+    """
+    Parses and caches the decks that were not in the deck cache.
+
+    Args:
+        decks (list): Cached decks, None where there was no entry. The None entries are filled in place.
+        raw_decks (list): The deck list of each deck. Only the ones where decks is None are used.
+        workers (int, optional): Number of processes to parse with (see parse_decks).
+
+    Returns:
+        list: The newly parsed decks.
+    """
+    uncached_decks = [raw_deck for raw_deck, deck in zip(raw_decks, decks) if deck is None]
+    # Look up every card name unknown to the card store in one batched pass, instead
+    # of one Scryfall request per card while the decks are parsed
+    prefetch_card_entries(name for raw_deck in uncached_decks for name in raw_card_names(raw_deck))
+
+    new_decks = parse_decks(uncached_decks, workers)
+    parsed_decks = iter(new_decks)
+    for index, deck in enumerate(decks):
+        if deck is None:
+            decks[index] = next(parsed_decks)
+    get_deck_cache().put_many(new_decks)
+    return new_decks
+
+
+def build_deck_lists(which_decks="gauntlet", workers=None):
+    """
+    Loads every deck list of the gauntlet (or the pre-gauntlet lists), parsing the ones
+    that are not in the deck cache.
+
+    Args:
+        which_decks (str): "gauntlet" for deck_lists, anything else for pre_gauntlet_deck_lists.
+        workers (int, optional): Number of processes to parse uncached decks with (see parse_decks).
+
+    Returns:
+        list: The MTGDeck objects, ordered by file name.
+    """
     print("Building Deck Lists")
-    if which_decks == "gauntlet":
-        txt_files = glob.glob(os.path.join(deck_list_path, "*.txt"))
-    else:
-        txt_files = glob.glob(os.path.join(pre_gauntlet_deck_list_path, "*.txt"))
-    decks = []
-    deck_names = []
-    for txt_file in txt_files:
-        with open(txt_file, "r", encoding="utf-8") as file:
-            current_deck = file.readlines()
-            deck_names.append(current_deck[0].strip())
-        d = create_or_load_deck(current_deck)
-        decks.append(d)
+    raw_decks = [read_raw_deck(txt_file) for txt_file in deck_list_files(which_decks)]
+
+    # Load every cached deck in one query
+    deck_cache = get_deck_cache()
+    decks = deck_cache.get_many(raw_decks)
+    cached = [deck is not None for deck in decks]
+    parse_missing_decks(decks, raw_decks, workers)
+    for was_cached, current_deck in zip(cached, raw_decks):
+        if was_cached:
+            print("Loaded deck from cache.")
+        else:
+            print("Creating new deck and saving to cache.")
         print(current_deck[0].strip(), "Build")
+    deck_cache.collect_garbage()
     return decks
 
 
-def update_deck_visuals(deck_lists):
+def update_deck_visuals(deck_lists, save=False):
+    # Rendering lives in visualization_tools, which is only imported when images are drawn
+    from visualization_tools import visual_spoiler_v2
+
     for deck in deck_lists:
         for version in deck.mainboard.keys():
             # deck_list = deck.mainboard[version]
             # sideboard_list = deck.sideboard[version]
             deck_name = deck.deck_name[version] + " " + version
             # visual_spoiler_v2(deck_list, sideboard_list, deck_name, version, deck)
-            visual_spoiler_v2(deck, version)
+            visual_spoiler_v2(deck, version, save=save)
             print(deck_name, version, "Visual done")
 
 
+def get_gauntlet_keywords(deck_lists):
+    """
+    Returns every keyword used by the mainboards of a list of decks, across all versions.
+
+    The card IDs of every deck are collected first, so the whole gauntlet is a single
+    lookup in the card store's keyword index.
+    """
+    card_ids = set()
+    for deck in deck_lists:
+        card_ids.update(deck.mainboard.all_ids())
+    return get_card_store().keywords_for_cards(card_ids)
+
+
+def legality_matrix(deck_lists, formats=FORMATS, include_sideboard=False):
+    """
+    Checks every version of every deck against several formats in one pass.
+
+    The legality masks of all the cards in all the decks are read from the card store
+    with one query, then each deck version is a single AND-reduce over its cards' masks.
+
+    Args:
+        deck_lists (list): The MTGDeck objects to check.
+        formats (iterable): The formats to report on, e.g. ("standard", "pioneer").
+        include_sideboard (bool): Whether sideboard cards count towards legality.
+
+    Returns:
+        list: One dictionary per deck version with its "deck" name, "version", "legal"
+        (format -> bool) and "illegal_cards" (format -> the card names breaking legality).
+    """
+    formats = list(formats)
+    bits = [format_bit(format) for format in formats]
+    version_card_ids = [
+        (deck, version, deck.version_card_ids(version, include_sideboard))
+        for deck in deck_lists
+        for version in deck.mainboard
+    ]
+    masks = get_card_store().legality_masks(set().union(*(card_ids for _, _, card_ids in version_card_ids)))
+
+    matrix = []
+    for deck, version, card_ids in version_card_ids:
+        deck_mask = combined_mask(masks[card_id] for card_id in card_ids)
+        matrix.append({
+            'deck': deck.deck_name[version],
+            'version': version,
+            'legal': {format: bool(deck_mask & bit) for format, bit in zip(formats, bits)},
+            'illegal_cards': {
+                format: sorted(get_card_name(card_id) for card_id in card_ids if not masks[card_id] & bit)
+                for format, bit in zip(formats, bits)
+                if not deck_mask & bit
+            },
+        })
+    return matrix
+
+
+def load_card_counts(json_file):
+    """
+    Loads a gauntlet.json style {"cards": [{"name": ..., "quantity": ...}]} file as a CardCounts.
+    """
+    with open(json_file, 'r') as f:
+        data = json.load(f)
+    return CardCounts.from_dict({card["name"]: card["quantity"] for card in data["cards"]})
+
+
+def gauntlet_cost(gauntlet_cards, currency='usd'):
+    """
+    Returns the total price of a gauntlet's cards (a CardCounts, see load_card_counts).
+    """
+    return get_price_table().cost(gauntlet_cards, currency)
+
+
+def deck_costs(deck_lists, currency='usd'):
+    """
+    Returns the price of the cards needed to build every version of each deck, in deck_lists order.
+    """
+    return get_price_table().costs((deck.get_cards_needed() for deck in deck_lists), currency)
+
+
+def still_needed(cards_needed, collection, currency='usd'):
+    """
+    Works out which cards are still missing from a collection, and what they cost.
+
+    Args:
+        cards_needed (CardCounts): The cards wanted, e.g. a gauntlet or a deck's get_cards_needed().
+        collection (CardCounts): The cards already owned.
+        currency (str): The currency to price the missing cards in.
+
+    Returns:
+        tuple: The missing cards as a CardCounts, and their total price.
+    """
+    missing = cards_needed.shortfall(collection)
+    return missing, get_price_table().cost(missing, currency)
+
+
 def generate_token_html(card_name, uri):
     html = ""
     layout = uri.get("layout", None)
@@ -173,29 +485,20 @@ def generate_token_html(card_name, uri):
 
 
 def generate_token_list(deck, version="v1"):
-    token_html = []
-    for item in deck.mainboard[version]:
-        card = get_card_entry(item)
-        card_parts = card.get("all_parts", [])
-        for part in card_parts:
-            component = part.get("component", None)
-            if component == "token":
-                uri = requests.get(part["uri"]).json()
-                token_html.append(generate_token_html(part["name"], uri))
-            if component == "combo_piece" and "Emblem" in part.get("type_line", ""):
-                uri = requests.get(part["uri"]).json()
-                token_html.append(generate_token_html(part["name"], uri))
-    for item in deck.sideboard.get(version, {}):
+    token_parts = []
+    for item in list(deck.mainboard[version]) + list(deck.sideboard.get(version, {})):
         card = get_card_entry(item)
         card_parts = card.get("all_parts", [])
         for part in card_parts:
             component = part.get("component", None)
             if component == "token":
-                uri = requests.get(part["uri"]).json()
-                token_html.append(generate_token_html(part["name"], uri))
+                token_parts.append(part)
             if component == "combo_piece" and "Emblem" in part.get("type_line", ""):
-                uri = requests.get(part["uri"]).json()
-                token_html.append(generate_token_html(part["name"], uri))
+                token_parts.append(part)
+
+    # Fetch all token cards concurrently; the shared client keeps us within Scryfall's rate limit
+    uris = fetch_many(part["uri"] for part in token_parts)
+    token_html = [generate_token_html(part["name"], uri) for part, uri in zip(token_parts, uris)]
     token_html.sort()
     for item in token_html:
         print(item)
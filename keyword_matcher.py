@@ -0,0 +1,80 @@
+"""
+Aho-Corasick matcher for finding keyword abilities in card text.
+
+Matching every keyword against a card's text with one big alternation regex costs a
+pass of the regex engine per card over hundreds of alternatives. The Aho-Corasick
+automaton finds every keyword in a single left-to-right pass over the text, however
+many keywords there are. The card store runs it once per card while compiling, so
+lookups afterwards never scan text at all.
+"""
+from collections import deque
+
+
+def is_word_character(text, index):
+    return 0 <= index < len(text) and (text[index].isalnum() or text[index] == '_')
+
+
+class KeywordMatcher:
+    """
+    Finds whole-word, case-insensitive occurrences of a fixed set of keywords.
+    """
+
+    def __init__(self, keywords):
+        # Trie transitions, failure links and the keywords ending at each state
+        self.transitions = [{}]
+        self.failure = [0]
+        self.outputs = [[]]
+        for keyword in keywords:
+            state = 0
+            for character in keyword.lower():
+                next_state = self.transitions[state].get(character)
+                if next_state is None:
+                    next_state = len(self.transitions)
+                    self.transitions.append({})
+                    self.failure.append(0)
+                    self.outputs.append([])
+                    self.transitions[state][character] = next_state
+                state = next_state
+            self.outputs[state].append((keyword, len(keyword.lower())))
+
+        # Breadth-first, so every failure link points at a state that is already finished
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for character, next_state in self.transitions[state].items():
+                queue.append(next_state)
+                fallback = self.failure[state]
+                while fallback and character not in self.transitions[fallback]:
+                    fallback = self.failure[fallback]
+                self.failure[next_state] = self.transitions[fallback].get(character, 0)
+                self.outputs[next_state] = self.outputs[next_state] + self.outputs[self.failure[next_state]]
+
+    def find(self, text):
+        """
+        Returns the set of keywords that occur in text as whole words.
+
+        Like a longest-first regex alternation, a keyword inside a longer match does not
+        count on its own, e.g. "double strike" finds Double strike but not Strike.
+        """
+        text = text.lower()
+        transitions = self.transitions
+        failure = self.failure
+        outputs = self.outputs
+        matches = []
+        state = 0
+        for index, character in enumerate(text):
+            while state and character not in transitions[state]:
+                state = failure[state]
+            state = transitions[state].get(character, 0)
+            for keyword, length in outputs[state]:
+                start = index - length + 1
+                if not is_word_character(text, start - 1) and not is_word_character(text, index + 1):
+                    matches.append((start, -length, keyword))
+
+        found = set()
+        covered_until = 0
+        for start, negative_length, keyword in sorted(matches):
+            if start >= covered_until:
+                found.add(keyword)
+                covered_until = start - negative_length
+        return found
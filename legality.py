@@ -0,0 +1,74 @@
+"""
+Card legality as integer bitmasks over formats.
+
+Each format Scryfall reports gets one bit, and a card's mask has the bits of the formats
+it is legal in set. A deck is legal in exactly the formats left after AND-ing the masks
+of its cards together, so checking a deck against every format at once is one pass of
+integer ANDs instead of intersecting a set of format names per card.
+"""
+from functools import reduce
+from operator import and_
+
+# Scryfall's formats in the order they appear in its legalities. The masks are stored in
+# the card store, so new formats must be appended; reordering needs a schema bump.
+FORMATS = (
+    'standard',
+    'future',
+    'historic',
+    'timeless',
+    'gladiator',
+    'pioneer',
+    'explorer',
+    'modern',
+    'legacy',
+    'pauper',
+    'vintage',
+    'penny',
+    'commander',
+    'oathbreaker',
+    'standardbrawl',
+    'brawl',
+    'alchemy',
+    'paupercommander',
+    'duel',
+    'oldschool',
+    'premodern',
+    'predh',
+)
+FORMAT_BITS = {format: 1 << index for index, format in enumerate(FORMATS)}
+ALL_FORMATS_MASK = (1 << len(FORMATS)) - 1
+
+
+def format_bit(format):
+    try:
+        return FORMAT_BITS[format.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown format: {format}") from None
+
+
+def legality_mask(legalities):
+    """
+    Returns the bitmask of the formats a card is legal in.
+
+    Args:
+        legalities (dict): A Scryfall legalities dictionary, e.g. {"standard": "legal", ...}.
+    """
+    mask = 0
+    for format, legality in legalities.items():
+        if legality == "legal":
+            mask |= FORMAT_BITS.get(format, 0)
+    return mask
+
+
+def mask_formats(mask):
+    """
+    Returns the set of format names whose bits are set in a mask.
+    """
+    return frozenset(format for format, bit in FORMAT_BITS.items() if mask & bit)
+
+
+def combined_mask(masks):
+    """
+    AND-reduces card masks into the mask of formats every one of the cards is legal in.
+    """
+    return reduce(and_, masks, ALL_FORMATS_MASK)
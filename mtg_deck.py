@@ -1,8 +1,60 @@
 import hashlib
-import os
-import pickle
 
-from mtg_tools import get_card_colors, get_card_entry, get_oracle_name
+from card_counts import CardCounts, VersionedCardCounts, versions_maximum
+from card_store import get_card_store
+from deck_parser import MAINBOARD, SIDEBOARD, read_deck, version_sort_key
+from legality import combined_mask, format_bit, mask_formats
+from mtg_tools import get_card_colors, get_card_name, get_oracle_name
+
+
+def raw_card_names(raw_deck):
+    """
+    Returns the card names written in a raw deck list, before any name resolution.
+    """
+    return [
+        name
+        for sections in read_deck(raw_deck).versions.values()
+        for section in sections.values()
+        for name in section
+    ]
+
+
+def canonical_deck_hash(versions):
+    """
+    Returns a hash of a deck's resolved contents.
+
+    The order of cards within a section, how their names were spelled and the metadata
+    do not affect it; the card counts of each version's mainboard and sideboard do.
+    Card names are hashed rather than IDs, so the hash is the same under any card
+    store snapshot.
+
+    Args:
+        versions (dict): Version ("v1", ...) -> (mainboard, sideboard), each a {card_id: count} dictionary.
+    """
+    lines = []
+    for version in sorted(versions, key=version_sort_key):
+        mainboard, sideboard = versions[version]
+        for section, cards in (("# " + version, mainboard), ("# Sideboard", sideboard)):
+            lines.append(section)
+            lines.extend(sorted(f"{count} {get_card_name(card_id)}" for card_id, count in cards.items()))
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+def versioned_to_dict(versioned):
+    # Each CardCounts as a pair of parallel lists: card IDs and counts
+    return {
+        'base_version': versioned.base_version,
+        'base': [versioned.base.ids.tolist(), versioned.base.counts.tolist()],
+        'deltas': {version: [delta.ids.tolist(), delta.counts.tolist()] for version, delta in versioned.deltas.items()},
+    }
+
+
+def versioned_from_dict(data):
+    return VersionedCardCounts.from_deltas(
+        data['base_version'],
+        CardCounts(*data['base']),
+        {version: CardCounts(ids, counts) for version, (ids, counts) in data['deltas'].items()},
+    )
 
 
 class MTGDeck:
@@ -12,148 +64,145 @@ class MTGDeck:
     The MTGDeck class is designed to parse, manage, and perform operations on
     an MTG deck, including its mainboard and sideboard, as well as associated
     metadata such as deck name, author, and event details.
-    It can load and save deck data from/to cache and calculate
-    the deck's hash for consistency checking.
+    It can be converted to and from plain data for the deck cache, and hashed by
+    its resolved contents to recognise the same deck written differently.
 
     Attributes:
-        mainboard (dict): A dictionary storing the mainboard of the deck, keyed by version.
-        sideboard (dict): A dictionary storing the sideboard of the deck, keyed by version.
+        mainboard (VersionedCardCounts): The mainboard of each version as a CardCounts, keyed by version.
+                                         Stored as the first version plus each other version's changes.
+        sideboard (VersionedCardCounts): The sideboard of each version, stored the same way.
+        cards_needed (CardCounts): The most copies of each card any version uses, mainboard plus sideboard.
         deck_name (dict): A dictionary storing the deck's name(s), keyed by version.
         deck_author (dict): A dictionary storing the deck's author(s), keyed by version.
         deck_event (dict): A dictionary storing the event(s) associated with the deck, keyed by version.
         raw_deck (list): A list representing the raw input deck data to be parsed.
+        card_store_snapshot (str): The card store snapshot whose card IDs the deck uses.
 
     Methods:
         __init__(raw_deck):
             Initializes the MTGDeck object with the provided raw deck data and builds the deck list.
 
-        _calculate_hash():
-            Generates an MD5 hash from the raw deck data for consistency checking.
-
-        load_from_cache(cache_file):
-            Loads and returns a cached MTGDeck object from the specified cache file if it exists.
+        to_dict():
+            Returns the parsed deck as plain JSON-serializable data, for the deck cache.
 
-        save_to_cache(cache_file):
-            Saves the current MTGDeck object to the specified cache file.
+        from_dict(data):
+            Rebuilds an MTGDeck from to_dict data without parsing the raw deck again.
 
         build_deck_list():
-            Parses the raw deck data, extracting the metadata (name, author, event)
-            and splitting the deck into mainboard and sideboard for each version.
+            Parses the raw deck data in one pass (see deck_parser), extracting the metadata
+            (name, author, event) and the mainboard and sideboard of each version.
 
         get_cards_needed():
             Returns a dictionary of cards needed across all versions of the deck, considering both mainboard
             and sideboard quantities.
 
+        diff(version1, version2):
+            Returns the mainboard and sideboard changes between two versions.
+
         get_color_distribution():
             Analyzes the deck's mainboard to return a distribution of card colors.
 
+        get_keywords(version=None):
+            Returns every keyword the mainboard cards have or mention, for one version or all of them.
+
+        legality_mask(version="v1", include_sideboard=False):
+            Returns the bitmask of formats the deck version is legal in, AND-reduced from its cards' masks.
+
         legal_formats(version="v1"):
             Returns a set of legal formats for the given deck version based on the legalities of each card in
             the mainboard.
 
+        illegal_cards(format, version="v1", include_sideboard=False):
+            Returns the cards that keep the deck version out of a format.
+
         is_standard_legal(version="v1"):
             Returns True if the deck is legal in the Standard format for the given version, otherwise False.
+
+        canonical_hash():
+            Returns a hash of the resolved card counts of every version, independent of card order and spelling.
+
+        to_deck_list():
+            Returns the deck as deck_lists-format lines (Name:/Author:/Event: and "# v" sections).
     """
 
     def __init__(self, raw_deck):
-        self.mainboard = {}
-        self.sideboard = {}
+        self.mainboard = VersionedCardCounts()
+        self.sideboard = VersionedCardCounts()
+        self.cards_needed = CardCounts()
         self.deck_name = {}
         self.deck_author = {}
         self.deck_event = {}
         self.raw_deck = raw_deck
+        self.card_store_snapshot = get_card_store().snapshot
         self.build_deck_list()
 
-    def _calculate_hash(self):
-        # Create a hash from the raw_deck variable
-        return hashlib.md5(str(self.raw_deck).encode()).hexdigest()
+    def to_dict(self):
+        return {
+            'raw_deck': self.raw_deck,
+            'card_store_snapshot': self.card_store_snapshot,
+            'deck_name': self.deck_name,
+            'deck_author': self.deck_author,
+            'deck_event': self.deck_event,
+            'mainboard': versioned_to_dict(self.mainboard),
+            'sideboard': versioned_to_dict(self.sideboard),
+        }
 
-    @staticmethod
-    def load_from_cache(cache_file):
-        if os.path.exists(cache_file):
-            with open(cache_file, "rb") as f:
-                return pickle.load(f)
-        return None
-
-    def save_to_cache(self, cache_file):
-        with open(cache_file, "wb") as f:
-            pickle.dump(self, f)
-
-    def build_meta_info(self, meta_info):
-        meta_info_dict = {}
-        meta_info = [x.strip() for x in meta_info.split("\n") if x.strip()]
-        if len(meta_info) == 1:
-            meta_info_dict["Name"] = (
-                meta_info[0].strip().removeprefix("# ").removeprefix("Name: ")
-            )
-        else:
-            for meta in meta_info:
-                key, value = meta.split(":")
-                meta_info_dict[key.strip()] = value.strip()
-
-        if "Name" in meta_info_dict:
-            names = meta_info_dict["Name"].split(", ")
-            for i, item in enumerate(names):
-                self.deck_name["v" + str(i + 1)] = item.strip()
-        if "Author" in meta_info_dict:
-            authors = meta_info_dict["Author"].split(", ")
-            for i, item in enumerate(authors):
-                self.deck_author["v" + str(i + 1)] = item.strip()
-        if "Event" in meta_info_dict:
-            events = meta_info_dict["Event"].split(", ")
-            for i, item in enumerate(events):
-                self.deck_event["v" + str(i + 1)] = item.strip()
+    @classmethod
+    def from_dict(cls, data):
+        deck = cls.__new__(cls)
+        deck.raw_deck = data['raw_deck']
+        deck.card_store_snapshot = data['card_store_snapshot']
+        deck.deck_name = data['deck_name']
+        deck.deck_author = data['deck_author']
+        deck.deck_event = data['deck_event']
+        deck.mainboard = versioned_from_dict(data['mainboard'])
+        deck.sideboard = versioned_from_dict(data['sideboard'])
+        deck.cards_needed = versions_maximum(deck.mainboard, deck.sideboard)
+        return deck
+
+    def build_meta_info(self, metadata):
+        # Comma-separated values are per version: "Name: Mono Red, Mono Red v2"
+        for key, values in (("Name", self.deck_name), ("Author", self.deck_author), ("Event", self.deck_event)):
+            if key in metadata:
+                for i, item in enumerate(metadata[key].split(", ")):
+                    values["v" + str(i + 1)] = item.strip()
 
     def build_deck_list(self):
-        content = "".join(self.raw_deck)
-        sections = content.split("# v")
-        self.build_meta_info(sections.pop(0))
-
-        versions = {}
-        for section in sections:
-            if section.strip():
-                version, cards = section.split("\n", 1)
-                versions[f"v{version.strip()}"] = cards.strip().split("\n")
-
-        for version, cards in versions.items():
-            version_mainboard = {}
-            version_sideboard = {}
-            if "# Sideboard" in cards:
-                main_raw_deck = cards[: cards.index("# Sideboard")]
-                sideboard_raw_deck = cards[cards.index("# Sideboard") + 1 :]
-            else:
-                main_raw_deck = cards[0:]
-                sideboard_raw_deck = []
-            for card in main_raw_deck:
-                card_count, name = card.split(" ", 1)
-                name = get_oracle_name(name)
-                version_mainboard[name] = int(card_count)
-            for card in sideboard_raw_deck:
-                card_count, name = card.split(" ", 1)
-                name = get_oracle_name(name)
-                version_sideboard[name] = int(card_count)
-            self.mainboard[version] = version_mainboard
-            self.sideboard[version] = version_sideboard
+        deck_text = read_deck(self.raw_deck)
+        self.build_meta_info(deck_text.metadata)
+        versions = sorted(deck_text.versions, key=version_sort_key)
+        self.mainboard = VersionedCardCounts(
+            {version: self._resolve_section(deck_text.versions[version][MAINBOARD]) for version in versions}
+        )
+        self.sideboard = VersionedCardCounts(
+            {version: self._resolve_section(deck_text.versions[version][SIDEBOARD]) for version in versions}
+        )
+        self.cards_needed = versions_maximum(self.mainboard, self.sideboard)
+
+    @staticmethod
+    def _resolve_section(cards):
+        resolved = {}
+        for name, count in cards.items():
+            oracle_name = get_oracle_name(name)
+            resolved[oracle_name] = resolved.get(oracle_name, 0) + count
+        return CardCounts.from_dict(resolved)
 
     def get_cards_needed(self):
-        cards_needed = {}
-
-        for version in self.mainboard:
-            for card_name, quantity in self.mainboard[version].items():
-                name, number = card_name, quantity + self.sideboard.get(
-                    version, {}
-                ).get(card_name, 0)
-                if name in cards_needed:
-                    cards_needed[name] = max(cards_needed[name], number)
-                else:
-                    cards_needed[name] = number
-            for card_name, quantity in self.sideboard[version].items():
-                name, number = card_name, quantity
-                if name in cards_needed:
-                    cards_needed[name] = max(cards_needed[name], number)
-                else:
-                    cards_needed[name] = number
-        return cards_needed
+        # Each version needs its mainboard plus its sideboard; the deck needs the most of
+        # any version, which versions_maximum works out once when the deck is built
+        return self.cards_needed
+
+    def diff(self, version1, version2):
+        """
+        Returns how a deck changes from one version to another.
+
+        Only the two versions' stored changes are compared, so this does not rebuild either version.
+
+        Returns:
+            tuple: (mainboard changes, sideboard changes), each a CardCounts of signed counts,
+            e.g. +2 for a card version2 plays two more copies of.
+        """
+        return self.mainboard.diff(version1, version2), self.sideboard.diff(version1, version2)
 
     def get_color_distribution(self):
         color_distribution = {}
@@ -167,21 +216,71 @@ class MTGDeck:
                     color_distribution[c] = quantity
         print(color_distribution)
 
+    def get_keywords(self, version=None):
+        """
+        Returns every keyword the mainboard cards have or mention in their rules text.
+
+        Args:
+            version (str, optional): The version to look at. Defaults to all versions.
+        """
+        card_ids = set(self.mainboard[version].ids) if version else self.mainboard.all_ids()
+        return get_card_store().keywords_for_cards(card_ids)
+
+    def version_card_ids(self, version="v1", include_sideboard=False):
+        card_ids = set(self.mainboard[version].ids)
+        if include_sideboard:
+            card_ids.update(self.sideboard.get(version, CardCounts()).ids)
+        return card_ids
+
+    def legality_mask(self, version="v1", include_sideboard=False):
+        masks = get_card_store().legality_masks(self.version_card_ids(version, include_sideboard))
+        return combined_mask(masks.values())
+
     def legal_formats(self, version="v1"):
-        legal_formats = set()
-        for card_name in self.mainboard[version]:
-            card_legal_formats = set()
-            card = get_card_entry(card_name)
-            legalities = card["legalities"]
-            for format, legality in legalities.items():
-                if legality == "legal":
-                    card_legal_formats.add(format)
-            legal_formats = (
-                legal_formats.intersection(card_legal_formats)
-                if legal_formats
-                else card_legal_formats
-            )
-        return legal_formats
+        return mask_formats(self.legality_mask(version))
+
+    def illegal_cards(self, format, version="v1", include_sideboard=False):
+        bit = format_bit(format)
+        masks = get_card_store().legality_masks(self.version_card_ids(version, include_sideboard))
+        return sorted(get_card_name(card_id) for card_id, mask in masks.items() if not mask & bit)
 
     def is_standard_legal(self, version="v1"):
         return "standard" in self.legal_formats(version)
+
+    def sorted_versions(self):
+        return sorted(self.mainboard, key=version_sort_key)
+
+    def canonical_hash(self):
+        """
+        Returns a hash of what the deck contains, after name resolution (see canonical_deck_hash).
+        """
+        return canonical_deck_hash({
+            version: (self.mainboard[version].id_counts(), self.sideboard.get(version, CardCounts()).id_counts())
+            for version in self.mainboard
+        })
+
+    def to_deck_list(self):
+        """
+        Writes the deck back out in the deck_lists format: Name:/Author:/Event: lines
+        with one comma-separated value per version, then a "# v" section per version.
+        Values are written by position like build_meta_info reads them, and stop at the
+        last version that has one, so a deck with fewer values than versions reads back the same.
+
+        Returns:
+            list: The lines, each ending in a newline.
+        """
+        versions = self.sorted_versions()
+        lines = []
+        for key, values in (("Name", self.deck_name), ("Author", self.deck_author), ("Event", self.deck_event)):
+            if values:
+                last = max(int(version[1:]) for version in values)
+                lines.append(f"{key}: {', '.join(values.get(f'v{i}', '') for i in range(1, last + 1))}")
+        for version in versions:
+            lines.append("# " + version)
+            lines.extend(f"{count} {get_card_name(card_id)}" for card_id, count in
+                         zip(self.mainboard[version].ids, self.mainboard[version].counts))
+            sideboard = self.sideboard.get(version)
+            if sideboard:
+                lines.append("# Sideboard")
+                lines.extend(f"{count} {get_card_name(card_id)}" for card_id, count in zip(sideboard.ids, sideboard.counts))
+        return [line + "\n" for line in lines]
@@ -49,25 +49,13 @@ if __name__ == "__main__":
     exit()
 
 
-    def is_number(s):
-        if s is None:
-            return False
-        try:
-            float(s)
-            return True
-        except ValueError:
-            return False
-
-
-    total = 0
-    for item in json2['cards']:
-        card = get_card_entry(item['name'])
-        cost = 0
-        if is_number(card['prices']['usd']):
-            cost = float(card['prices']['usd'])
+    price_table = get_price_table()
+    gauntlet_cards = load_card_counts('gauntlet.json')
+    for card_name, card_id in zip(gauntlet_cards, gauntlet_cards.ids):
+        cost = price_table.price(card_id)
         if cost > 10:
-            print(f"{item['name']:<60} {cost:.2f}")
-        total += cost * item['quantity']
+            print(f"{card_name:<60} {cost:.2f}")
+    total = gauntlet_cost(gauntlet_cards)
 
     print(total)
     exit()
@@ -196,22 +184,6 @@ if __name__ == "__main__":
             return card['card_faces'][0]['oracle_text'] + " // " + card['card_faces'][1]['oracle_text']
 
 
-    def get_deck_keywords(deck):
-        deck_keywords = set()
-        # Compile a single regex pattern for all keywords
-        sorted_keywords = sorted(ALL_KEYWORDS, key=len, reverse=True)
-        keyword_pattern = re.compile(r'\b(?:' + '|'.join(re.escape(keyword) for keyword in sorted_keywords) + r')\b',
-                                     re.IGNORECASE)
-
-        for version in deck.mainboard:
-            for card in deck.mainboard[version]:
-                oracle_text = get_all_oracle_text(card)
-
-                matches = keyword_pattern.findall(oracle_text)
-                deck_keywords.update(matches)
-        return deck_keywords
-
-
     # deck = deck_lists[2]
     #
     # for item in deck.mainboard['v1']:
@@ -249,12 +221,8 @@ if __name__ == "__main__":
     for card_name in cards_needed:
         cards_needed[card_name] = sum(cards_needed[card_name][:2])
 
-    all_keywords_needed = set()
-    for deck in decks_wanted:
-        deck_kw = get_deck_keywords(deck)
-        # lower case all of them
-        deck_kw = [keyword.lower() for keyword in deck_kw]
-        all_keywords_needed.update(deck_kw)
+    # lower case all of them
+    all_keywords_needed = {keyword.lower() for keyword in get_gauntlet_keywords(decks_wanted)}
 
     # Title case all_keywords_needed
     # all_keywords_needed = sorted([keyword.title() for keyword in all_keywords_needed])
@@ -262,10 +230,10 @@ if __name__ == "__main__":
 
     # visual_spoiler_v2(cards_needed, {}, "Duskmourn Mini Gauntlet", "")
 
-    # print(sorted(ALL_KEYWORDS))
+    # print(sorted(get_all_keywords()))
     # begin = time.time()
     # for deck in deck_lists:
-    #     kw = sorted(get_deck_keywords(deck))
+    #     kw = sorted(deck.get_keywords())
     #     kw = [keyword.title() for keyword in kw]
     #     print(deck.deck_name, kw)
     # print(time.time() - begin)
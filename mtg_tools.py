@@ -1,54 +1,99 @@
-import json
-import requests
-import time
 import os
 
+from card_record import COLOR_SORT_ORDER, TYPE_SORT_ORDER, CardRecord, color_category, get_main_card_type
+from card_store import get_card_store
+from printings import ArtRules, get_printings_index
+from scryfall_client import SCRYFALL_API_URL, fetch_collection, get_json
+
 current_dir = os.path.dirname(os.path.abspath(__file__))
 deck_list_path = os.path.join(current_dir, 'deck_lists')
 
-with open('oracle-cards-20241109220318.json', 'r', encoding="utf8") as f:
-    ORACLE_DATA = json.load(f)
+# Card name -> CardRecord, filled in the first time each card is used
+CARD_RECORDS = {}
+
+# Interned card IDs (the card store's row IDs) in both directions
+CARD_IDS = {}
+CARD_NAMES = {}
 
-ALL_KEYWORDS = set()
-for item in ORACLE_DATA:
-    for keyword in item['keywords']:
-        ALL_KEYWORDS.add(keyword)
+# Card name -> printing chosen by the art rules (None for the oracle printing)
+PREFERRED_PRINTINGS = {}
 
 
-def get_card_entry(card_name, delay=0.15):
+def get_card_entry(card_name):
     """
     Retrieves card details from local Oracle data or, if not found, from the Scryfall API.
 
     Args:
         card_name (str): The name of the card to look up.
-        delay (float, optional): Time to delay between requests to prevent API rate limiting.`
 
     Returns:
         dict or None: Card details as a dictionary if found, or None if not found or an error occurs.
     """
-    # Normalize the card name for comparison
-    card_name_lower = card_name.lower()
-
     # Check if card is in the local data first
-    for card in ORACLE_DATA:
-        if card['name'].lower() == card_name_lower and card['set_type'] != "funny" and card['layout'] != "token":
-            return card
-
-    # Add a delay to prevent rate limiting
-    print("Used Scryfall API", card_name)
-    time.sleep(delay)
+    store = get_card_store()
+    card = store.get_card(card_name)
+    if card is not None:
+        return card
+
+    # Resolve typos, missing punctuation and partial names offline before asking Scryfall
+    resolved_name, candidates = store.resolve_card_name(card_name)
+    if resolved_name:
+        print(f"Resolved {card_name} to {resolved_name}")
+        store.add_aliases([(card_name, resolved_name)])
+        return store.get_card(resolved_name)
+    if candidates:
+        # Possibly a card printed after the dump; let Scryfall decide
+        print(f"Ambiguous card name {card_name}, could be: {', '.join(candidates)}")
+
+    if store.read_only:
+        # A parse worker; the parent process fetches and adds the card instead
+        return None
 
     # Query the Scryfall API for the card using fuzzy search
-    url = f'https://api.scryfall.com/cards/named?fuzzy={card_name}'
+    print("Used Scryfall API", card_name)
+    url = f'{SCRYFALL_API_URL}/cards/named?fuzzy={card_name}'
+    import requests
     try:
-        response = requests.get(url)
-        response.raise_for_status()  # Ensure we raise an error for bad responses
-        return response.json()
+        return store.add_card(get_json(url), extra_names=[card_name])
     except requests.exceptions.RequestException as e:
         print(f"Error fetching card data: {e}")
         return None  # Handle errors by returning None or an appropriate response
 
 
+def prefetch_card_entries(card_names):
+    """
+    Fetches every card name that cannot be resolved locally from Scryfall in batches,
+    and adds the results to the card store so later get_card_entry calls find them.
+
+    Names that are ambiguous locally are fetched too, as Scryfall may know the exact card.
+
+    Args:
+        card_names (iterable): Card names as written in deck lists.
+
+    Returns:
+        list: The names Scryfall did not recognise either.
+    """
+    store = get_card_store()
+    missing = []
+    for card_name in dict.fromkeys(card_names):
+        if store.get_card(card_name) is None:
+            if not store.resolve_card_name(card_name).name:
+                missing.append(card_name)
+    if not missing:
+        return []
+
+    print(f"Fetching {len(missing)} cards from Scryfall")
+    import requests
+    try:
+        cards, not_found = fetch_collection(missing)
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching card data: {e}")
+        return missing
+    for card in cards:
+        store.add_card(card)
+    return not_found
+
+
 # Changed this function to use a different function to get card data.
 # May need to revert changes later if there are issues.
 # Change made on 2024/11/27
@@ -65,11 +110,80 @@ def get_oracle_name(card_name):
     # data = response.json()
 
     data = get_card_entry(card_name)
+    if data is None:
+        raise ValueError(f"Unknown card: {card_name}")
 
     # print(card_name, data)
     return data['name']
 
 
+def get_all_keywords():
+    """
+    Returns the set of every keyword ability that appears on any card.
+    """
+    return get_card_store().all_keywords()
+
+
+def get_card_record(card_name):
+    """
+    Returns the precomputed CardRecord for a card, building it the first time the card is used.
+
+    Args:
+        card_name (str): The name of the card.
+
+    Returns:
+        CardRecord: The card's derived attributes.
+    """
+    record = CARD_RECORDS.get(card_name)
+    if record is None:
+        record = CARD_RECORDS[card_name] = CardRecord(get_card_entry(card_name))
+    return record
+
+
+def get_card_id(card_name, resolve=True):
+    """
+    Returns the integer ID of a card, interning it the first time the name is seen.
+
+    IDs come from the card store, so they are shared by every deck and process using
+    the same card store snapshot.
+
+    Args:
+        card_name (str): The name of the card.
+        resolve (bool): Whether to resolve names missing from the card store through
+                        get_card_entry (fuzzy matching, then Scryfall).
+
+    Returns:
+        int or None: The card's ID, or None if the card is unknown and resolve is False.
+
+    Raises:
+        ValueError: If resolve is True and neither the card store nor Scryfall knows the card.
+    """
+    card_id = CARD_IDS.get(card_name)
+    if card_id is None:
+        store = get_card_store()
+        card_id = store.get_card_id(card_name)
+        if card_id is None:
+            if not resolve:
+                return None
+            # Misspelled or unknown locally; get_card_entry resolves it and adds it to the store
+            card = get_card_entry(card_name)
+            if card is None:
+                raise ValueError(f"Unknown card: {card_name}")
+            card_id = store.get_card_id(card['name'])
+        CARD_IDS[card_name] = card_id
+    return card_id
+
+
+def get_card_name(card_id):
+    """
+    Returns the full Oracle name of the card with the given ID.
+    """
+    card_name = CARD_NAMES.get(card_id)
+    if card_name is None:
+        card_name = CARD_NAMES[card_id] = get_card_store().get_card_name(card_id)
+    return card_name
+
+
 def get_card_colors(card_name):
     """
     Retrieves the color identity of a Magic: The Gathering card, considering various card layouts.
@@ -80,18 +194,7 @@ def get_card_colors(card_name):
     Returns:
         list: A list of the card's colors or color identity.
     """
-    card = get_card_entry(card_name)
-    layout = card['layout']
-
-    if layout in ["adventure", "prototype"]:
-        return card['color_identity']
-    elif layout == "transform":
-        return card['card_faces'][0]['colors']
-    elif layout == "modal_dfc":
-        colors = {color for face in card['card_faces'] for color in face['colors']}
-        return list(colors)
-    else:
-        return card['colors']
+    return list(get_card_record(card_name).colors)
 
 
 def load_preferred_card_art(file_path='preferred_art.txt'):
@@ -118,60 +221,76 @@ def load_preferred_card_art(file_path='preferred_art.txt'):
     return preferred_card_art
 
 
-preferred_card_art = load_preferred_card_art()
+_preferred_card_art = None
 
 
-def get_card_image(card_name, quality='normal'):
+def get_preferred_card_art():
     """
-    Retrieves the URL for the card image based on the card's name and preferred art.
+    Returns the preferred card art, reading preferred_art.txt the first time it is needed.
+    """
+    global _preferred_card_art
+    if _preferred_card_art is None:
+        _preferred_card_art = load_preferred_card_art()
+    return _preferred_card_art
 
-    Args:
-        card_name (str): The name of the card.
 
-    Returns:
-        str: The URL of the card image.
+_art_rules = None
+
+
+def get_art_rules():
+    """
+    Returns the art preference rules, reading art_rules.txt the first time they are needed.
     """
-    card = get_card_entry(card_name)
-    layout = card.get('layout', '')
+    global _art_rules
+    if _art_rules is None:
+        _art_rules = ArtRules.load()
+    return _art_rules
 
-    # Comment this out since it uses png. We are using normal for now.
-    # Check if preferred art is available
-    # if card_name in preferred_card_art:
-    #     return preferred_card_art[card_name]
 
-    # Determine the image URL based on card layout
-    if layout in ['transform', 'modal_dfc', 'flip']:
-        return card['card_faces'][0]['image_uris'][quality]
+def get_preferred_printing(card_name):
+    """
+    Returns the printing the art rules choose for a card.
 
-    return card['image_uris'][quality]
+    Args:
+        card_name (str): The name of the card.
 
+    Returns:
+        dict or None: The chosen printing (see PrintingsIndex.find_printings), or None
+        when no rule applies or no printings index is available.
+    """
+    if card_name not in PREFERRED_PRINTINGS:
+        printing = None
+        art_rules = get_art_rules()
+        if art_rules:
+            printings_index = get_printings_index()
+            card = get_card_entry(card_name)
+            if printings_index is not None and card is not None and 'oracle_id' in card:
+                printing = printings_index.resolve_art(card['oracle_id'], card['name'], art_rules)
+        PREFERRED_PRINTINGS[card_name] = printing
+    return PREFERRED_PRINTINGS[card_name]
 
-def get_main_card_type(type_line):
+
+def get_card_image(card_name, quality='normal'):
     """
-    Determines the main card type based on the type line.
+    Retrieves the URL for the card image based on the card's name and preferred art.
 
     Args:
-        type_line (str): The type line of the card.
+        card_name (str): The name of the card.
 
     Returns:
-        str: The main card type.
+        str: The URL of the card image.
     """
-    card_types = [
-        "Creature",
-        "Artifact",
-        "Enchantment",
-        "Instant",
-        "Sorcery",
-        "Planeswalker",
-        "Battle",
-        "Land",
-    ]
+    # Comment this out since it uses png. We are using normal for now.
+    # Check if preferred art is available
+    # if card_name in get_preferred_card_art():
+    #     return get_preferred_card_art()[card_name]
 
-    for card_type in card_types:
-        if card_type in type_line:
-            return card_type
+    printing = get_preferred_printing(card_name)
+    if printing is not None:
+        return printing['image_uris'][quality]
 
-    return "Other"
+    # The record already holds the front face image for double-faced layouts
+    return get_card_record(card_name).image_uris[quality]
 
 
 def sort_cards_by_type(card_list):
@@ -212,40 +331,10 @@ def sort_cards_by_type_and_color(card_list):
     Returns:
         list: A sorted list of cards, ordered first by type and then by color.
     """
-    # Define the sorting order for card types
-    type_sort_order = {
-        "Creature": 1,
-        "Instant": 2,
-        "Sorcery": 3,
-        "Artifact": 4,
-        "Enchantment": 5,
-        "Planeswalker": 6,
-        "Land": 7
-    }
-
-    # Define the sorting order for card colors
-    color_sort_order = {
-        "W": 1,
-        "U": 2,
-        "B": 3,
-        "R": 4,
-        "G": 5,
-        "Gold": 6,
-        "Colorless": 7
-    }
-
-    # Helper function to determine color category
-    def determine_color_category(colors):
-        if len(colors) > 1:
-            return "Gold"
-        elif len(colors) == 0:
-            return "Colorless"
-        else:
-            return colors[0]
     # Sort cards first by type, then by color category
     return sorted(card_list, key=lambda card: (
-        type_sort_order.get(card[2], float('inf')),  # Sort by card type
-        color_sort_order.get(determine_color_category(card[3]), float('inf')),  # Sort by card color
+        TYPE_SORT_ORDER.get(card[2], float('inf')),  # Sort by card type
+        COLOR_SORT_ORDER.get(color_category(card[3]), float('inf')),  # Sort by card color
         card[0] # Sort by card name
     ))
 
@@ -255,13 +344,11 @@ def collect_and_sort_cards(deck, sideboard):
 
     # Collect and sort cards from the deck
     for key, value in deck.items():
-        card = get_card_entry(key)
-        card_type = get_main_card_type(card['type_line'])
-        card_colors = get_card_colors(key)
-        all_cards.append((key, value, card_type, card_colors))
+        record = get_card_record(key)
+        all_cards.append((key, value, record.main_type, list(record.colors)))
 
-    # Sort the collected deck cards by card type
-    all_cards = sort_cards_by_type_and_color(all_cards)
+    # Sort the collected deck cards by card type, then color, using the precomputed sort keys
+    all_cards.sort(key=lambda card: (get_card_record(card[0]).sort_key, card[0]))
 
     # TODO: Fix Sideboard
     # Collect cards from the sideboard
@@ -285,7 +372,7 @@ def get_deck_colors(deck):
 
 def get_card_type(card):
     if type(card) == str:
-        card = get_card_entry(card)
+        return get_card_record(card).front_type_line
     if card['layout'] == 'transform':
         return card['card_faces'][0]['type_line']
     return card['type_line']
@@ -299,8 +386,7 @@ def separate_card_types(card_dict):
                   'Planeswalkers': {},
                   'Lands': {}}
     for card_name, quantity in card_dict.items():
-        card = get_card_entry(card_name)
-        card_type = get_main_card_type(get_card_type(card))
+        card_type = get_card_record(card_name).front_main_type
         if card_type == 'Creature':
             card_types['Creatures'][card_name] = quantity
         elif card_type == 'Artifact':
@@ -319,11 +405,11 @@ def separate_card_types(card_dict):
 
 def deck_to_html(deck):
     def generate_card_html(quantity, card_name, img_url):
-        card = get_card_entry(card_name)
-        if card['layout'] == 'split':
+        layout = get_card_record(card_name).layout
+        if layout == 'split':
             html = f'<li><span class="rotated-card">{quantity} {card_name} <img src="{img_url}" alt="{card_name}"> </span></li>'
             return html
-        if card['layout'] == 'transform':
+        if layout == 'transform':
             img_url_front = img_url
             img_url_back = img_url.replace('front', 'back')
             html = f'<li><span class="card">{quantity} {card_name} <img src="{img_url_front}" alt="{card_name}" class="front"> <img src="{img_url_back}" alt="{card_name}" class="back"> </span></li>'
@@ -332,9 +418,9 @@ def deck_to_html(deck):
         return html
 
     for version in deck.mainboard.keys():
-        deck_name = deck.deck_name.replace(' ', '_')
-        author_name = deck.deck_author.replace(' ', '_')
-        event_name = deck.deck_event.replace(' ', '_')
+        deck_name = deck.deck_name.get(version, '').replace(' ', '_')
+        author_name = deck.deck_author.get(version, '').replace(' ', '_')
+        event_name = deck.deck_event.get(version, '').replace(' ', '_')
         if author_name == "" and event_name == "":
             deck_name += '_' + version
         else:
@@ -375,7 +461,6 @@ def deck_to_html(deck):
         print(f"\t\t\t<h2>Lands ({total_cards})</h2>")
         print("\t\t\t<ul>")
         for card_name, quantity in split_deck['Lands'].items():
-            card = get_card_entry(card_name)
             print("\t\t\t\t", generate_card_html(quantity, card_name, get_card_image(card_name, 'large')))
         print("\t\t\t</ul>")
         print("\t\t</div>")
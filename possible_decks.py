@@ -13,18 +13,17 @@ image_path = os.path.join(current_dir, 'deck_images')
 
 # Function to load card collection
 def load_card_collection(json_file):
-    with open(json_file, 'r') as f:
-        data = json.load(f)
-    return {card["name"]: card["quantity"] for card in data["cards"]}
+    return load_card_counts(json_file)
 
 # Check if a combination can be built
 def can_build_combination(deck_combination, card_collection):
     combined_cards_needed = {}
     for deck in deck_combination:
-        for card_name, quantity in deck.get_cards_needed().items():
-            combined_cards_needed[card_name] = combined_cards_needed.get(card_name, 0) + quantity
+        cards_needed = deck.get_cards_needed()
+        for card_id, quantity in zip(cards_needed.ids, cards_needed.counts):
+            combined_cards_needed[card_id] = combined_cards_needed.get(card_id, 0) + quantity
             # Early termination if we exceed the available cards
-            if combined_cards_needed[card_name] > card_collection.get(card_name, 0):
+            if combined_cards_needed[card_id] > card_collection.count(card_id):
                 return False
     return True
 
@@ -71,51 +70,6 @@ def find_buildable_combinations_parallel(deck_objects, card_collection_json):
 
     return buildable_combinations
 
-# Ensure the cache directory exists
-def ensure_cache_directory(directory):
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-
-
-# Before creating the object, compute the hash of the raw_deck
-def create_or_load_deck(raw_deck):
-    # Ensure the deck_cache directory exists
-    cache_directory = 'deck_cache'
-    ensure_cache_directory(cache_directory)
-
-    # Calculate the hash for the raw_deck before creating the object
-    deck_hash = hashlib.md5(str(raw_deck).encode()).hexdigest()
-    cache_file = os.path.join(cache_directory, f'deck_cache_{deck_hash}.pkl')
-
-    # Check if the deck is already cached
-    cached_deck = MTGDeck.load_from_cache(cache_file)
-    if cached_deck:
-        print("Loaded deck from cache.")
-        return cached_deck
-
-    # If not cached, create a new deck and cache it
-    print("Creating new deck and saving to cache.")
-    new_deck = MTGDeck(raw_deck)
-    new_deck.save_to_cache(cache_file)
-    return new_deck
-
-def build_deck_lists(which_decks='gauntlet'):
-    print("Building Deck Lists")
-    if which_decks == 'gauntlet':
-        txt_files = glob.glob(os.path.join(deck_list_path, '*.txt'))
-    else:
-        txt_files = glob.glob(os.path.join(pre_gauntlet_deck_list_path, '*.txt'))
-    decks = []
-    deck_names = []
-    for txt_file in txt_files:
-        with open(txt_file, 'r') as file:
-            current_deck = file.readlines()
-            deck_names.append(current_deck[0].strip())
-        d = create_or_load_deck(current_deck)
-        decks.append(d)
-        print(current_deck[0].strip(), "Build")
-    return decks
-
 # Example Usage
 if __name__ == "__main__":
     # Load your decks
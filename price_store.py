@@ -0,0 +1,198 @@
+"""
+Columnar card prices and price history.
+
+compile_card_store pulls each card's usd, eur and tix prices out of the bulk data into a
+prices table. PriceTable loads that table once into one NumPy array of floats per
+currency, indexed by card ID. Costing a deck is then a gather of its CardCounts IDs from
+that array and a nansum against its counts, with no card JSON decoded and no price
+strings parsed. costs prices any number of decks in one such pass.
+
+Card IDs only mean something within one store, so each snapshot's prices are also
+copied, keyed by card name, into price_history.sqlite3 the first time the snapshot is
+used. price_deltas compares any two recorded snapshots.
+"""
+import math
+import sqlite3
+import threading
+
+from card_counts import COUNT_TYPECODE, ID_TYPECODE
+from card_store import PRICE_CURRENCIES, get_card_store
+
+PRICE_HISTORY_FILE = 'price_history.sqlite3'
+
+
+class PriceTable:
+    """
+    The prices of one card store snapshot, one column per currency.
+
+    Attributes:
+        snapshot (str): The bulk data file the prices come from.
+        columns (dict): Currency -> NumPy array of prices indexed by card ID, NaN where a
+                        card has no price.
+    """
+
+    def __init__(self, store):
+        import numpy as np
+
+        self.snapshot = store.get_meta('source_file')
+        rows = store.connection.execute("SELECT card_id, usd, eur, tix FROM prices").fetchall()
+        size = max((row[0] for row in rows), default=0) + 1
+        card_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        self.columns = {}
+        for column, currency in enumerate(PRICE_CURRENCIES, 1):
+            prices = np.full(size, np.nan)
+            # None (no price) becomes NaN
+            prices[card_ids] = np.array([row[column] for row in rows], dtype=np.float64)
+            self.columns[currency] = prices
+
+    def price(self, card_id, currency='usd'):
+        """
+        Returns the price of one copy of a card, or NaN if it has none.
+        """
+        column = self.columns[currency]
+        return float(column[card_id]) if card_id < len(column) else math.nan
+
+    def _prices(self, card_ids, currency):
+        # Cards added to the store after the table was loaded have no price
+        import numpy as np
+
+        column = self.columns[currency]
+        return np.where(card_ids < len(column), column[np.minimum(card_ids, len(column) - 1)], np.nan)
+
+    def cost(self, card_counts, currency='usd'):
+        """
+        Returns the total price of a CardCounts. Cards without a price count as free.
+        """
+        import numpy as np
+
+        card_ids = np.frombuffer(card_counts.ids, dtype=np.dtype(ID_TYPECODE))
+        counts = np.frombuffer(card_counts.counts, dtype=np.dtype(COUNT_TYPECODE))
+        return float(np.nansum(self._prices(card_ids, currency) * counts))
+
+    def costs(self, all_card_counts, currency='usd'):
+        """
+        Returns the total price of each of several CardCounts, in one vectorized pass.
+        Cards without a price count as free.
+        """
+        import numpy as np
+
+        all_card_counts = list(all_card_counts)
+        card_ids = np.frombuffer(b''.join(card_counts.ids.tobytes() for card_counts in all_card_counts),
+                                 dtype=np.dtype(ID_TYPECODE))
+        counts = np.frombuffer(b''.join(card_counts.counts.tobytes() for card_counts in all_card_counts),
+                               dtype=np.dtype(COUNT_TYPECODE))
+        rows = np.repeat(np.arange(len(all_card_counts)), [len(card_counts) for card_counts in all_card_counts])
+        subtotals = np.nan_to_num(self._prices(card_ids, currency)) * counts
+        return np.bincount(rows, weights=subtotals, minlength=len(all_card_counts)).tolist()
+
+    def unpriced(self, card_counts, currency='usd'):
+        """
+        Returns the IDs of the cards in a CardCounts that have no price.
+        """
+        import numpy as np
+
+        card_ids = np.frombuffer(card_counts.ids, dtype=np.dtype(ID_TYPECODE))
+        return card_ids[np.isnan(self._prices(card_ids, currency))].tolist()
+
+
+def record_price_snapshot(store, history_file=PRICE_HISTORY_FILE):
+    """
+    Copies a card store's prices into the price history, unless its snapshot is already there.
+
+    Returns:
+        str: The snapshot name, i.e. the bulk data file the store was compiled from.
+    """
+    snapshot = store.get_meta('source_file')
+    connection = sqlite3.connect(history_file)
+    with connection:
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS snapshots (snapshot TEXT PRIMARY KEY, recorded_at REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS prices (
+                snapshot TEXT NOT NULL,
+                name TEXT NOT NULL,
+                usd REAL,
+                eur REAL,
+                tix REAL,
+                PRIMARY KEY (snapshot, name)
+            ) WITHOUT ROWID;
+        """)
+        recorded = connection.execute("SELECT 1 FROM snapshots WHERE snapshot = ?", (snapshot,)).fetchone()
+        if not recorded:
+            connection.executemany(
+                "INSERT OR IGNORE INTO prices (snapshot, name, usd, eur, tix) VALUES (?, ?, ?, ?, ?)",
+                ((snapshot, *row) for row in store.connection.execute(
+                    "SELECT cards.name, prices.usd, prices.eur, prices.tix "
+                    "FROM prices JOIN cards ON cards.id = prices.card_id"
+                )),
+            )
+            connection.execute("INSERT INTO snapshots (snapshot, recorded_at) VALUES (?, julianday('now'))",
+                               (snapshot,))
+    connection.close()
+    return snapshot
+
+
+def list_price_snapshots(history_file=PRICE_HISTORY_FILE):
+    """
+    Returns the recorded snapshot names, oldest first.
+    """
+    connection = sqlite3.connect(history_file)
+    try:
+        return [row[0] for row in connection.execute("SELECT snapshot FROM snapshots ORDER BY recorded_at")]
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        connection.close()
+
+
+def price_deltas(old_snapshot, new_snapshot, currency='usd', card_names=None, history_file=PRICE_HISTORY_FILE):
+    """
+    Compares card prices between two recorded snapshots.
+
+    Args:
+        old_snapshot (str): The earlier snapshot name.
+        new_snapshot (str): The later snapshot name.
+        currency (str): One of PRICE_CURRENCIES.
+        card_names (iterable, optional): Only compare these cards, e.g. the gauntlet's.
+        history_file (str): Path to the price history database.
+
+    Returns:
+        list: (card name, old price, new price, change) tuples for the cards priced in
+        both snapshots whose price changed, biggest change first.
+    """
+    if currency not in PRICE_CURRENCIES:
+        raise ValueError(f"currency must be one of {', '.join(PRICE_CURRENCIES)}")
+    connection = sqlite3.connect(history_file)
+    try:
+        rows = connection.execute(
+            f"SELECT old.name, old.{currency}, new.{currency} FROM prices AS old "
+            f"JOIN prices AS new ON new.name = old.name AND new.snapshot = ? "
+            f"WHERE old.snapshot = ? AND old.{currency} IS NOT NULL AND new.{currency} IS NOT NULL "
+            f"AND old.{currency} != new.{currency}",
+            (new_snapshot, old_snapshot),
+        ).fetchall()
+    finally:
+        connection.close()
+    if card_names is not None:
+        card_names = set(card_names)
+        rows = [row for row in rows if row[0] in card_names]
+    deltas = [(name, old, new, new - old) for name, old, new in rows]
+    return sorted(deltas, key=lambda delta: abs(delta[3]), reverse=True)
+
+
+_price_table = None
+_price_table_lock = threading.Lock()
+
+
+def get_price_table():
+    """
+    Returns the prices of the shared card store, loading them (and recording the
+    snapshot in the price history) on first use.
+    """
+    global _price_table
+    if _price_table is None:
+        with _price_table_lock:
+            if _price_table is None:
+                store = get_card_store()
+                record_price_snapshot(store)
+                _price_table = PriceTable(store)
+    return _price_table
@@ -0,0 +1,346 @@
+"""
+Index of every printing of every card, for choosing which art a card is shown with.
+
+The oracle bulk file behind the card store holds one printing per card. Scryfall's
+default-cards bulk file holds every English printing, around 100k of them.
+compile_printings_index streams that file into a small SQLite table keyed by oracle_id,
+keeping only what art selection needs (set, frame, frame effects, full-art and
+borderless flags, release date and image URLs). A lookup then reads just the handful of
+rows for one card instead of loading the whole file.
+
+Art preferences are written as rules in art_rules.txt, one per line:
+
+    # card name (or * for every card), then filters
+    *, frame_effect=extendedart
+    Shivan Reef, set=dmu
+    Warden of the Inner Sky, set=lci full_art
+    Battlefield Forge, id=7dbd1d94-9ae2-46dc-9ece-26e72a323fd1
+
+Filters are set=<code>, frame=<frame>, frame_effect=<effect>, id=<Scryfall ID>, and the
+flags full_art and borderless (prefix a flag with ! to exclude it). A card's own rules
+are tried first, then the * rules, and the newest printing matching the first rule that
+matches anything wins. Cards with no matching rule keep their oracle printing's art.
+"""
+import glob
+import json
+import os
+import sqlite3
+import threading
+
+from bulk_data import iter_bulk_cards
+
+DEFAULT_CARDS_PATTERN = 'default-cards-*.json'
+PRINTINGS_FILE = 'printings.sqlite3'
+ART_RULES_FILE = 'art_rules.txt'
+
+# Bump whenever the tables written by compile_printings_index change.
+SCHEMA_VERSION = 1
+
+PRINTING_FIELDS = (
+    'id',
+    'oracle_id',
+    'layout',
+    'set',
+    'collector_number',
+    'released_at',
+    'frame',
+    'frame_effects',
+    'full_art',
+    'border_color',
+    'image_uris',
+    'card_faces',
+)
+
+# Printings that are not cards a deck can show
+SKIPPED_LAYOUTS = ('token', 'double_faced_token', 'emblem', 'art_series')
+
+FLAG_FILTERS = ('full_art', 'borderless')
+VALUE_FILTERS = {
+    'id': "id = ?",
+    'set': "set_code = ?",
+    'frame': "frame = ?",
+    'frame_effect': "frame_effects LIKE '%,' || ? || ',%'",
+}
+
+
+def find_default_cards_file():
+    """
+    Returns the newest default-cards bulk data file in the working directory, or None.
+    """
+    bulk_files = sorted(glob.glob(DEFAULT_CARDS_PATTERN))
+    return bulk_files[-1] if bulk_files else None
+
+
+def printing_row(card):
+    """
+    Flattens a default-cards entry into a printings table row, or returns None for
+    printings that should not be indexed.
+    """
+    if card.get('layout') in SKIPPED_LAYOUTS:
+        return None
+    faces = card.get('card_faces', [])
+    # Reversible cards only carry an oracle_id and images on their faces
+    oracle_id = card.get('oracle_id') or (faces[0].get('oracle_id') if faces else None)
+    image_uris = card.get('image_uris') or (faces[0].get('image_uris') if faces else None)
+    if not oracle_id or not image_uris:
+        return None
+    return (
+        card['id'],
+        oracle_id,
+        card.get('set', ''),
+        card.get('collector_number', ''),
+        card.get('released_at', ''),
+        card.get('frame', ''),
+        ',' + ','.join(card.get('frame_effects', [])) + ',',
+        int(bool(card.get('full_art'))),
+        int(card.get('border_color') == 'borderless'),
+        json.dumps(image_uris, separators=(',', ':')),
+    )
+
+
+def compile_printings_index(bulk_file, index_file=PRINTINGS_FILE):
+    """
+    Compiles a Scryfall default-cards bulk data file into a printings index.
+
+    Like compile_card_store, the bulk file is streamed and the index is written to a
+    temporary file that is moved into place once complete.
+
+    Args:
+        bulk_file (str): Path to the default-cards bulk data JSON file.
+        index_file (str): Path of the SQLite index to create or replace.
+
+    Returns:
+        str: The path of the compiled index.
+    """
+    temp_file = index_file + '.tmp'
+    if os.path.exists(temp_file):
+        os.remove(temp_file)
+
+    connection = sqlite3.connect(temp_file)
+    with connection:
+        connection.executescript("""
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE printings (
+                id TEXT PRIMARY KEY,
+                oracle_id TEXT NOT NULL,
+                set_code TEXT NOT NULL,
+                collector_number TEXT NOT NULL,
+                released_at TEXT NOT NULL,
+                frame TEXT NOT NULL,
+                frame_effects TEXT NOT NULL,
+                full_art INTEGER NOT NULL,
+                borderless INTEGER NOT NULL,
+                image_uris TEXT NOT NULL
+            );
+        """)
+        rows = (printing_row(card) for card in iter_bulk_cards(bulk_file, PRINTING_FIELDS))
+        connection.executemany(
+            "INSERT OR IGNORE INTO printings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (row for row in rows if row is not None),
+        )
+        # Built after the bulk insert, which is much faster than keeping it up to date row by row
+        connection.execute("CREATE INDEX printings_by_oracle_id ON printings (oracle_id, released_at)")
+        connection.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+            ('schema_version', str(SCHEMA_VERSION)),
+            ('source_file', os.path.basename(bulk_file)),
+        ])
+    connection.close()
+
+    os.replace(temp_file, index_file)
+    return index_file
+
+
+def parse_art_filters(text):
+    """
+    Parses the filters of one art rule, e.g. "set=lci full_art !borderless".
+
+    Returns:
+        dict: Filter names mapped to their value, True or False for flags.
+    """
+    filters = {}
+    for token in text.split():
+        if '=' in token:
+            key, value = token.split('=', 1)
+            if key not in VALUE_FILTERS:
+                raise ValueError(f"Unknown art rule filter: {key}")
+            filters[key] = value.lower() if key == 'set' else value
+        else:
+            flag = token.lstrip('!')
+            if flag not in FLAG_FILTERS:
+                raise ValueError(f"Unknown art rule flag: {flag}")
+            filters[flag] = not token.startswith('!')
+    return filters
+
+
+class ArtRules:
+    """
+    Art preference rules, indexed by card name.
+    """
+
+    def __init__(self, rules=()):
+        self.rules_by_name = {}
+        self.default_rules = []
+        for card_name, filters in rules:
+            if card_name == '*':
+                self.default_rules.append(filters)
+            else:
+                self.rules_by_name.setdefault(card_name.casefold(), []).append(filters)
+
+    @classmethod
+    def load(cls, file_path=ART_RULES_FILE):
+        """
+        Reads rules from a text file; a missing file means no rules.
+        """
+        rules = []
+        if os.path.exists(file_path):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line or line.startswith('#') or ',' not in line:
+                        continue
+                    card_name, filters = line.split(',', 1)
+                    rules.append((card_name.strip(), parse_art_filters(filters)))
+        return cls(rules)
+
+    def rules_for(self, card_name):
+        """
+        Returns the rules that apply to a card, its own rules first.
+        """
+        return self.rules_by_name.get(card_name.casefold(), []) + self.default_rules
+
+    def __bool__(self):
+        return bool(self.rules_by_name or self.default_rules)
+
+
+class PrintingsIndex:
+    """
+    Read access to a compiled printings index.
+    """
+
+    def __init__(self, index_file=PRINTINGS_FILE):
+        self.index_file = index_file
+        self.connection = sqlite3.connect(index_file, check_same_thread=False)
+
+    def get_meta(self, key, default=None):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def find_printings(self, oracle_id, limit=None, **filters):
+        """
+        Returns the printings of a card matching every filter, newest first.
+
+        Args:
+            oracle_id (str): The card's Oracle ID.
+            limit (int, optional): Maximum number of printings to return.
+            **filters: Art rule filters, e.g. set='lci', frame_effect='showcase', full_art=True.
+
+        Returns:
+            list: Printing dictionaries with id, set, collector_number, released_at,
+            frame, frame_effects, full_art, borderless and image_uris.
+        """
+        conditions = ["oracle_id = ?"]
+        parameters = [oracle_id]
+        for key, value in filters.items():
+            if key in FLAG_FILTERS:
+                conditions.append(f"{key} = ?")
+                parameters.append(int(value))
+            else:
+                conditions.append(VALUE_FILTERS[key])
+                parameters.append(value)
+        query = (
+            "SELECT id, set_code, collector_number, released_at, frame, frame_effects, full_art, borderless, "
+            f"image_uris FROM printings WHERE {' AND '.join(conditions)} ORDER BY released_at DESC"
+        )
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        return [
+            {
+                'id': row[0],
+                'set': row[1],
+                'collector_number': row[2],
+                'released_at': row[3],
+                'frame': row[4],
+                'frame_effects': row[5].strip(',').split(',') if row[5] != ',' else [],
+                'full_art': bool(row[6]),
+                'borderless': bool(row[7]),
+                'image_uris': json.loads(row[8]),
+            }
+            for row in self.connection.execute(query, parameters)
+        ]
+
+    def resolve_art(self, oracle_id, card_name, art_rules):
+        """
+        Picks the printing a card should be shown with under a set of art rules.
+
+        Returns:
+            dict or None: The newest printing matching the first rule that matches any
+            printing, or None if no rule does.
+        """
+        for filters in art_rules.rules_for(card_name):
+            printings = self.find_printings(oracle_id, limit=1, **filters)
+            if printings:
+                return printings[0]
+        return None
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM printings").fetchone()[0]
+
+
+def open_printings_index(bulk_file=None, index_file=PRINTINGS_FILE):
+    """
+    Opens the printings index, compiling it from the default-cards file first if needed.
+
+    Args:
+        bulk_file (str, optional): Path to the default-cards bulk data file. Defaults to
+                                   the newest default-cards-*.json in the working directory.
+        index_file (str): Path to the SQLite printings index.
+
+    Returns:
+        PrintingsIndex or None: The opened index, or None if there is neither an index
+        nor a default-cards file to build one from.
+    """
+    bulk_file = bulk_file or find_default_cards_file()
+    if os.path.exists(index_file):
+        index = PrintingsIndex(index_file)
+        up_to_date = (
+            index.get_meta('schema_version') == str(SCHEMA_VERSION)
+            and (bulk_file is None or index.get_meta('source_file') == os.path.basename(bulk_file))
+        )
+        if up_to_date:
+            return index
+        index.connection.close()
+
+    if bulk_file is None:
+        return None
+    print(f"Compiling printings index from {bulk_file}")
+    compile_printings_index(bulk_file, index_file)
+    return PrintingsIndex(index_file)
+
+
+_printings_index = None
+_printings_index_loaded = False
+_printings_index_lock = threading.Lock()
+
+
+def get_printings_index():
+    """
+    Returns the process-wide printings index, opening it on first use, or None if no
+    default-cards data is available.
+    """
+    global _printings_index, _printings_index_loaded
+    if not _printings_index_loaded:
+        with _printings_index_lock:
+            if not _printings_index_loaded:
+                _printings_index = open_printings_index()
+                _printings_index_loaded = True
+    return _printings_index
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Usage: python printings.py [default_cards_file]
+    bulk_file = sys.argv[1] if len(sys.argv) > 1 else find_default_cards_file()
+    if bulk_file is None:
+        sys.exit(f"No {DEFAULT_CARDS_PATTERN} file found")
+    print(compile_printings_index(bulk_file))
@@ -0,0 +1,319 @@
+"""
+Shared HTTP client for Scryfall API requests and card images.
+
+All requests go through one keep-alive connection pool. Requests to the Scryfall API
+share a token-bucket rate limiter, so fetches can run concurrently from threads (see
+fetch_many) or asyncio tasks (see fetch_async) without ever exceeding Scryfall's limit.
+
+Every response is kept in an on-disk cache keyed by URL, so rerunning a script does not
+fetch the same JSON or image twice. Entries expire after a time-to-live, and the least
+recently used entries are evicted once the cache grows past its size limit.
+
+Setting the SCRYFALL_OFFLINE environment variable to 1 (or calling set_offline) replays
+cached responses only, expired or not, and raises OfflineCacheMiss for anything else.
+
+requests takes longer to import than the rest of the tools put together, so it is only
+imported once a request actually has to go out; answering from the cache never needs it.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+HTTP_CACHE_FILE = 'http_cache.sqlite3'
+
+# Point this at a local stand-in server (see scryfall_stub.py) to work without Scryfall
+SCRYFALL_API_URL = os.environ.get('SCRYFALL_API_URL', 'https://api.scryfall.com')
+
+# Maximum number of identifiers the /cards/collection endpoint accepts per request
+COLLECTION_BATCH_SIZE = 75
+
+# Scryfall allows 10 requests per second to its API on average; its image CDN is not limited
+REQUESTS_PER_SECOND = 10
+RATE_LIMIT_EXEMPT_HOSTS = ('cards.scryfall.io', 'svgs.scryfall.io')
+MAX_WORKERS = 8
+USER_AGENT = 'mtg_gauntlet/1.0'
+
+# Scryfall asks clients to keep card data for at least a day
+JSON_TTL = 24 * 60 * 60
+# Image URLs carry a version stamp, so they can be kept much longer
+IMAGE_TTL = 30 * 24 * 60 * 60
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+
+
+class TokenBucket:
+    """
+    A thread-safe token-bucket rate limiter.
+
+    Tokens refill continuously at rate per second up to capacity. Each request takes one
+    token, waiting for the next one to refill when the bucket is empty, so bursts of up
+    to capacity requests go out immediately while the long-run rate never exceeds rate.
+    """
+
+    def __init__(self, rate=REQUESTS_PER_SECOND, capacity=REQUESTS_PER_SECOND):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ResponseCache:
+    """
+    A persistent URL -> response body cache with TTL expiry and LRU eviction.
+
+    Attributes:
+        hits (int): Number of lookups answered from the cache.
+        misses (int): Number of lookups that needed a network request.
+        total_bytes (int): Size of every cached body, kept up to date by put, so
+                           eviction does not have to sum the table.
+    """
+
+    def __init__(self, cache_file=HTTP_CACHE_FILE, max_bytes=MAX_CACHE_BYTES):
+        self.cache_file = cache_file
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(cache_file, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    url TEXT PRIMARY KEY,
+                    body BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            self.connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            self.total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, url, ttl, allow_expired=False):
+        """
+        Returns the cached body for a URL, or None if it is missing or older than ttl seconds.
+        """
+        now = time.time()
+        with self._lock, self.connection:
+            row = self.connection.execute(
+                "SELECT body, fetched_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None or (not allow_expired and now - row[1] > ttl):
+                self.misses += 1
+                return None
+            self.connection.execute("UPDATE responses SET last_used = ? WHERE url = ?", (now, url))
+            self.hits += 1
+            return row[0]
+
+    def put(self, url, body):
+        now = time.time()
+        with self._lock, self.connection:
+            replaced = self.connection.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+            if replaced:
+                self.total_bytes -= replaced[0]
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (url, body, size, fetched_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (url, body, len(body), now, now),
+            )
+            self.total_bytes += len(body)
+            self._evict()
+
+    def _evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        for url, size in self.connection.execute(
+            "SELECT url, size FROM responses ORDER BY last_used"
+        ).fetchall():
+            self.connection.execute("DELETE FROM responses WHERE url = ?", (url,))
+            self.total_bytes -= size
+            if self.total_bytes <= self.max_bytes:
+                break
+
+    def clear(self):
+        with self._lock, self.connection:
+            self.connection.execute("DELETE FROM responses")
+            self.total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'bytes': self.total_bytes}
+
+
+_response_cache = None
+_session = None
+_offline_cache_miss = None
+_client_lock = threading.Lock()
+_offline = os.environ.get('SCRYFALL_OFFLINE') == '1'
+rate_limiter = TokenBucket()
+
+
+def get_response_cache():
+    global _response_cache
+    with _client_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+    return _response_cache
+
+
+def get_offline_cache_miss():
+    """
+    Returns the OfflineCacheMiss exception class, a requests RequestException raised in
+    offline mode when a URL has never been cached.
+
+    The class is created on first use so that importing this module does not import requests.
+    """
+    global _offline_cache_miss
+    if _offline_cache_miss is None:
+        from requests.exceptions import RequestException
+
+        _offline_cache_miss = type('OfflineCacheMiss', (RequestException,), {
+            '__doc__': "Raised in offline mode when a URL has never been cached.",
+            '__module__': __name__,
+        })
+    return _offline_cache_miss
+
+
+def __getattr__(name):
+    # Keeps `from scryfall_client import OfflineCacheMiss` working without importing requests up front
+    if name == 'OfflineCacheMiss':
+        return get_offline_cache_miss()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_session():
+    """
+    Returns the process-wide requests session, whose connection pool is sized for MAX_WORKERS threads.
+    """
+    global _session
+    with _client_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+            _session.headers.update({'User-Agent': USER_AGENT, 'Accept': 'application/json;q=0.9,*/*;q=0.8'})
+    return _session
+
+
+def set_offline(offline=True):
+    """
+    Switches offline replay mode on or off for this process.
+    """
+    global _offline
+    _offline = offline
+
+
+def fetch(url, ttl=JSON_TTL, payload=None):
+    """
+    Fetches the body of a URL, answering from the response cache when possible.
+
+    Args:
+        url (str): The URL to fetch.
+        ttl (float): Maximum age in seconds of a cached response that may be reused.
+        payload (dict, optional): JSON body to POST instead of making a GET request.
+                                  It becomes part of the cache key.
+
+    Returns:
+        bytes: The response body.
+
+    Raises:
+        requests.exceptions.RequestException: If the request fails, or the URL is not
+        cached while offline.
+    """
+    cache_key = url if payload is None else url + '\n' + json.dumps(payload, sort_keys=True)
+    cache = get_response_cache()
+    body = cache.get(cache_key, ttl, allow_expired=_offline)
+    if body is not None:
+        return body
+    if _offline:
+        raise get_offline_cache_miss()(f"Not in the response cache: {cache_key}")
+
+    if urlparse(url).hostname not in RATE_LIMIT_EXEMPT_HOSTS:
+        rate_limiter.acquire()
+    if payload is None:
+        response = get_session().get(url)
+    else:
+        response = get_session().post(url, json=payload)
+    response.raise_for_status()
+    cache.put(cache_key, response.content)
+    return response.content
+
+
+def get_json(url, ttl=JSON_TTL):
+    return json.loads(fetch(url, ttl))
+
+
+def get_image_bytes(url, ttl=IMAGE_TTL):
+    return fetch(url, ttl)
+
+
+def fetch_many(urls, fetch_function=get_json, max_workers=MAX_WORKERS):
+    """
+    Fetches several URLs concurrently, still within the shared rate limit.
+
+    Args:
+        urls (iterable): The URLs to fetch.
+        fetch_function (callable): Called with each URL, e.g. get_json or get_image_bytes.
+        max_workers (int): Number of requests in flight at once.
+
+    Returns:
+        list: The results, in the same order as urls.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(fetch_function, urls))
+
+
+async def fetch_async(url, fetch_function=get_json):
+    """
+    Fetches a URL from an asyncio task without blocking the event loop.
+    """
+    import asyncio
+
+    return await asyncio.to_thread(fetch_function, url)
+
+
+def fetch_collection(card_names):
+    """
+    Looks up many cards by exact name with as few requests as possible, using the
+    /cards/collection endpoint in batches of COLLECTION_BATCH_SIZE names.
+
+    Args:
+        card_names (iterable): The card names to look up.
+
+    Returns:
+        tuple: A list of the card dictionaries found, and a list of the names Scryfall
+        did not recognise.
+    """
+    card_names = list(dict.fromkeys(card_names))
+    batches = [card_names[start:start + COLLECTION_BATCH_SIZE]
+               for start in range(0, len(card_names), COLLECTION_BATCH_SIZE)]
+
+    def fetch_batch(batch):
+        payload = {'identifiers': [{'name': name} for name in batch]}
+        return json.loads(fetch(f'{SCRYFALL_API_URL}/cards/collection', payload=payload))
+
+    cards = []
+    not_found = []
+    for result in fetch_many(batches, fetch_batch):
+        cards.extend(result['data'])
+        not_found.extend(identifier['name'] for identifier in result['not_found'])
+    return cards, not_found
@@ -0,0 +1,124 @@
+"""
+A local stand-in for the parts of the Scryfall API the tools use.
+
+It serves /cards/named (exact and fuzzy) and /cards/collection from a Scryfall bulk
+data file, so batched resolution can be exercised without touching the real API:
+
+    python scryfall_stub.py oracle-cards-20241109220318.json 8080
+    SCRYFALL_API_URL=http://localhost:8080 python mtg_gauntlet.py
+
+start_stub_server runs the same server on a background thread from Python, as
+test_scryfall_stub.py does to check prefetch_card_entries' batching and offline replay.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from bulk_data import iter_bulk_cards
+from card_store import build_card_index
+from fuzzy_names import FuzzyNameIndex
+from scryfall_client import COLLECTION_BATCH_SIZE
+
+
+class StubCards:
+    """
+    The cards a stub server answers with, indexed like the local card store.
+    """
+
+    def __init__(self, cards):
+        self.card_index = build_card_index(cards)
+        self.fuzzy_index = FuzzyNameIndex((name, card['name']) for name, card in self.card_index.items())
+        self.requests = []
+
+    def named(self, name, fuzzy):
+        card = self.card_index.get(name.casefold())
+        if card is None and fuzzy:
+            resolved_name, _ = self.fuzzy_index.resolve(name)
+            card = self.card_index.get(resolved_name.casefold()) if resolved_name else None
+        return card
+
+
+def error_body(status, details):
+    return {'object': 'error', 'status': status, 'details': details}
+
+
+def make_handler(stub_cards):
+    class StubHandler(BaseHTTPRequestHandler):
+        def send_json(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            stub_cards.requests.append(('GET', url.path))
+            query = parse_qs(url.query)
+            if url.path != '/cards/named':
+                self.send_json(404, error_body(404, f"No route for {url.path}"))
+                return
+            fuzzy = 'fuzzy' in query
+            name = (query.get('fuzzy') or query.get('exact') or [''])[0]
+            card = stub_cards.named(name, fuzzy)
+            if card is None:
+                self.send_json(404, error_body(404, f"No cards found matching “{name}”"))
+            else:
+                self.send_json(200, card)
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            stub_cards.requests.append(('POST', url.path))
+            if url.path != '/cards/collection':
+                self.send_json(404, error_body(404, f"No route for {url.path}"))
+                return
+            length = int(self.headers.get('Content-Length', 0))
+            identifiers = json.loads(self.rfile.read(length))['identifiers']
+            if len(identifiers) > COLLECTION_BATCH_SIZE:
+                self.send_json(422, error_body(422, f"Too many identifiers, the limit is {COLLECTION_BATCH_SIZE}"))
+                return
+            data = []
+            not_found = []
+            for identifier in identifiers:
+                card = stub_cards.named(identifier['name'], fuzzy=False)
+                if card is None:
+                    not_found.append(identifier)
+                else:
+                    data.append(card)
+            self.send_json(200, {'object': 'list', 'not_found': not_found, 'data': data})
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def start_stub_server(cards, port=0):
+    """
+    Starts a stub Scryfall server on a background thread.
+
+    Args:
+        cards (iterable): The card dictionaries the server knows about.
+        port (int): Port to listen on; 0 picks a free one.
+
+    Returns:
+        tuple: The server (call shutdown() to stop it), its base URL, and the StubCards
+        whose requests list records every request served.
+    """
+    stub_cards = StubCards(cards)
+    server = ThreadingHTTPServer(('localhost', port), make_handler(stub_cards))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://localhost:{server.server_address[1]}", stub_cards
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Usage: python scryfall_stub.py bulk_file [port]
+    bulk_file = sys.argv[1]
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8080
+    server = ThreadingHTTPServer(('localhost', port), make_handler(StubCards(iter_bulk_cards(bulk_file))))
+    print(f"Serving {bulk_file} on http://localhost:{port}")
+    server.serve_forever()
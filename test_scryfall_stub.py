@@ -0,0 +1,96 @@
+"""
+Runs batched card resolution (mtg_tools.prefetch_card_entries) against the stub Scryfall
+server in scryfall_stub.py, with a throwaway card store and response cache.
+
+    python -m unittest test_scryfall_stub
+"""
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import card_store
+import scryfall_client
+from card_store import CardStore, compile_card_store
+from mtg_tools import prefetch_card_entries
+from scryfall_client import COLLECTION_BATCH_SIZE, ResponseCache, fetch_collection, get_offline_cache_miss
+from scryfall_stub import start_stub_server
+
+
+def make_card(name):
+    return {
+        'id': f"id-{name}", 'oracle_id': f"oracle-{name}", 'name': name, 'layout': 'normal',
+        'set': 'tst', 'set_type': 'expansion', 'mana_cost': '{G}', 'cmc': 1, 'type_line': 'Creature',
+        'oracle_text': '', 'colors': ['G'], 'color_identity': ['G'], 'keywords': [], 'legalities': {},
+    }
+
+
+# Enough cards unknown to the local store for three /cards/collection batches
+LOCAL_NAMES = ['Grizzly Bears', 'Llanowar Elves']
+REMOTE_NAMES = [f"Stub Creature {number}" for number in range(2 * COLLECTION_BATCH_SIZE + 10)]
+
+
+class PrefetchAgainstStubTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+        server, url, self.stub_cards = start_stub_server(make_card(name) for name in LOCAL_NAMES + REMOTE_NAMES)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        bulk_file = os.path.join(self.directory, 'cards.json')
+        with open(bulk_file, 'w', encoding='utf-8') as f:
+            json.dump([make_card(name) for name in LOCAL_NAMES], f)
+        store_file = compile_card_store(bulk_file, os.path.join(self.directory, 'card_store.sqlite3'))
+
+        for patch in (
+            mock.patch.object(card_store, '_card_store', CardStore(store_file)),
+            mock.patch.object(scryfall_client, '_response_cache', self.new_response_cache()),
+            mock.patch.object(scryfall_client, 'SCRYFALL_API_URL', url),
+            mock.patch.object(scryfall_client, '_offline', False),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def new_response_cache(self):
+        return ResponseCache(os.path.join(self.directory, f"http_cache_{len(os.listdir(self.directory))}.sqlite3"))
+
+    def post_count(self):
+        return sum(method == 'POST' for method, _ in self.stub_cards.requests)
+
+    def test_fetches_unknown_names_in_batches(self):
+        not_found = prefetch_card_entries(LOCAL_NAMES + REMOTE_NAMES + ['Not A Real Card'])
+
+        self.assertEqual(not_found, ['Not A Real Card'])
+        self.assertEqual(self.post_count(), 3)
+        self.assertEqual(card_store.get_card_store().get_card(REMOTE_NAMES[-1])['name'], REMOTE_NAMES[-1])
+
+    def test_rerun_makes_no_requests(self):
+        prefetch_card_entries(REMOTE_NAMES)
+        requests_served = len(self.stub_cards.requests)
+
+        self.assertEqual(prefetch_card_entries(REMOTE_NAMES), [])
+        self.assertEqual(len(self.stub_cards.requests), requests_served)
+
+    def test_offline_replays_cache_or_raises(self):
+        fetch_collection(REMOTE_NAMES)
+        requests_served = len(self.stub_cards.requests)
+        scryfall_client.set_offline(True)
+
+        cards, not_found = fetch_collection(REMOTE_NAMES)
+        self.assertEqual((len(cards), not_found), (len(REMOTE_NAMES), []))
+        self.assertEqual(len(self.stub_cards.requests), requests_served)
+
+        with mock.patch.object(scryfall_client, '_response_cache', self.new_response_cache()):
+            with self.assertRaises(get_offline_cache_miss()):
+                fetch_collection(REMOTE_NAMES)
+            # prefetch_card_entries reports the names instead of raising
+            self.assertEqual(prefetch_card_entries(REMOTE_NAMES[:3]), REMOTE_NAMES[:3])
+        self.assertEqual(len(self.stub_cards.requests), requests_served)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,13 +1,22 @@
+"""
+Rendering of deck images.
+
+This is the render layer: cairosvg and PIL are imported inside the functions that draw,
+so the data-only tools (building gauntlets, comparing lists, costs) never pay for loading
+them, or need cairo installed at all.
+"""
 import math
-import cairosvg
 import io
-from PIL import Image, ImageDraw, ImageFont
 from mtg_tools import *
+from scryfall_client import fetch_many, get_image_bytes
 
 FONT_PATH = "assets/Beleren-Bold.ttf"
 
 
 def load_svg_as_image(svg_path):
+    import cairosvg
+    from PIL import Image
+
     png_bytes = cairosvg.svg2png(url=svg_path)
     image = Image.open(io.BytesIO(png_bytes)).convert('RGBA')
     return image
@@ -15,11 +24,10 @@ def load_svg_as_image(svg_path):
 
 def add_number_to_image(image_url, number, position=(372, 960), font_size=48, font_color=(255, 255, 255),
                         circle_color=(0, 0, 0)):
+    from PIL import Image, ImageDraw, ImageFont
+
     # Fetch the image from the URL
-    image = requests.get(image_url).content
-    with open('image.png', 'wb') as f:
-        f.write(image)
-    image = Image.open('image.png').convert('RGBA')
+    image = Image.open(io.BytesIO(get_image_bytes(image_url))).convert('RGBA')
 
     # Initialize the drawing context
     draw = ImageDraw.Draw(image)
@@ -66,6 +74,8 @@ def number_cards_per_row(distinct_num_cards_deck):
 
 
 def visual_spoiler_v2(deck_obj, version_number="v1", file_name=None, save=False, show=False):
+    from PIL import Image, ImageDraw, ImageFont
+
     deck = deck_obj.mainboard[version_number]
     sideboard = deck_obj.sideboard[version_number]
     deck_name = deck_obj.deck_name[version_number]
@@ -118,6 +128,9 @@ def visual_spoiler_v2(deck_obj, version_number="v1", file_name=None, save=False,
 
     all_cards = collect_and_sort_cards(deck, sideboard)
 
+    # Download every card image concurrently up front; add_number_to_image then reads them from the cache
+    fetch_many([get_card_image(card_name) for card_name, _, _, _ in all_cards], get_image_bytes)
+
     for i, (card_name, quantity, card_type, card_colors) in enumerate(all_cards):
         url = get_card_image(card_name)
         image = add_number_to_image(url, quantity, (card_width // 2, card_height - 50))